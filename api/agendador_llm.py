@@ -0,0 +1,194 @@
+import asyncio
+import heapq
+import itertools
+import time
+from transmissao import MedidorLatencia
+
+# Agendador central das chamadas ao modelo.
+# Limita quantas gerações vão ao Ollama ao mesmo tempo; o excedente espera numa fila de prioridade
+# (classificações curtas passam na frente das extrações JSON).
+# Pedidos idênticos simultâneos são coalescidos numa única chamada, e classificações da mesma
+# chain que estão na fila saem juntas num micro-lote (`abatch`): chegam ao Ollama no mesmo instante,
+# com o mesmo prefixo, e são processadas em paralelo nos slots do servidor (OLLAMA_NUM_PARALLEL).
+# O lote ocupa uma única vaga: no pior caso chegam ao Ollama max_concorrencia × max_lote classificações
+# (curtas), enquanto as extrações continuam limitadas a max_concorrencia.
+# Controle de admissão: se o pedido mais antigo da fila (com prioridade igual ou maior) já espera mais
+# que `max_espera`, novos pedidos são recusados na hora (SobrecargaLLM) em vez de aumentar a fila.
+
+PRIORIDADE_CLASSIFICACAO = 0
+PRIORIDADE_EXTRACAO = 1
+NOMES_PRIORIDADE = {PRIORIDADE_CLASSIFICACAO: "classificacao", PRIORIDADE_EXTRACAO: "extracao"}
+
+class SobrecargaLLM(Exception):
+    pass
+
+class _Pedido:
+    __slots__ = ("chain", "entrada", "prioridade", "lote", "futuro", "enfileirado_em")
+
+    def __init__(self, chain, entrada, prioridade, lote):
+        self.chain = chain
+        self.entrada = entrada
+        self.prioridade = prioridade
+        self.lote = lote # Chave de agrupamento (mesma chain) ou None se não pode ir em lote
+        self.futuro = asyncio.get_running_loop().create_future()
+        self.enfileirado_em = time.perf_counter()
+
+class AgendadorLLM:
+    """
+    Fila de prioridade com concorrência limitada. Tudo roda no event loop (sem await entre
+    ler e alterar a fila), então não há lock. Um pedido cancelado enquanto espera é descartado
+    ao sair da fila.
+    """
+    def __init__(self, max_concorrencia=4, max_lote=4, max_espera=5.0):
+        self.max_concorrencia = max_concorrencia
+        self.max_lote = max_lote
+        self.max_espera = max_espera
+        self._fila = [] # heap [(prioridade, sequência, pedido)]
+        self._sequencia = itertools.count()
+        self._ativos = 0
+        self._tarefas = set() # Referências fortes das execuções em andamento
+        self._em_andamento = {} # {chave: tarefa} para coalescer pedidos idênticos
+        self._espera = {nome: MedidorLatencia() for nome in NOMES_PRIORIDADE.values()}
+        self.maior_fila = 0
+        self.executados = 0
+        self.lotes = 0
+        self.pedidos_em_lote = 0
+        self.coalescidos = 0
+        self.cancelados = 0
+        self.rejeitados = 0
+
+    async def executar(self, chain, entrada, prioridade=PRIORIDADE_CLASSIFICACAO, agrupavel=False):
+        """
+        `chain.ainvoke(entrada)` assim que houver vaga. Com `agrupavel`, pode sair em lote
+        com outros pedidos da mesma chain que estejam na fila.
+        """
+        pedido = _Pedido(chain, entrada, prioridade, id(chain) if agrupavel else None)
+        self._enfileirar(pedido)
+        return await pedido.futuro
+
+    async def coalescer(self, chave, fabrica):
+        """
+        Quem chega com a mesma chave enquanto a primeira chamada está em andamento recebe o mesmo
+        resultado. `shield`: se um cliente desistir, a chamada continua para os demais.
+        """
+        tarefa = self._em_andamento.get(chave)
+        if tarefa is None:
+            tarefa = asyncio.ensure_future(fabrica())
+            self._em_andamento[chave] = tarefa
+            tarefa.add_done_callback(lambda t: self._finalizar_coalescido(chave, t))
+        else:
+            self.coalescidos += 1
+        return await asyncio.shield(tarefa)
+
+    def _finalizar_coalescido(self, chave, tarefa):
+        self._em_andamento.pop(chave, None)
+        if not tarefa.cancelled():
+            tarefa.exception() # Marca a exceção como lida quando todos os clientes já desistiram
+
+    def espera_atual(self, prioridade=PRIORIDADE_EXTRACAO):
+        """
+        Há quanto tempo (s) espera o pedido mais antigo da fila com prioridade igual ou maior.
+        """
+        agora = time.perf_counter()
+        return max((agora - pedido.enfileirado_em for p, _, pedido in self._fila
+                    if p <= prioridade and not pedido.futuro.done()), default=0.0)
+
+    def _enfileirar(self, pedido):
+        if self._fila and self.espera_atual(pedido.prioridade) > self.max_espera:
+            self.rejeitados += 1
+            raise SobrecargaLLM(f"fila do LLM acima de {self.max_espera:.1f}s de espera")
+        if self._ativos < self.max_concorrencia and not self._fila:
+            self._iniciar([pedido])
+            return
+        heapq.heappush(self._fila, (pedido.prioridade, next(self._sequencia), pedido))
+        self.maior_fila = max(self.maior_fila, len(self._fila))
+
+    def _despachar(self):
+        while self._ativos < self.max_concorrencia and self._fila:
+            _, _, pedido = heapq.heappop(self._fila)
+            if pedido.futuro.done(): # Cliente desistiu enquanto esperava
+                self.cancelados += 1
+                continue
+            lote = [pedido]
+            if pedido.lote is not None:
+                lote.extend(self._retirar_compativeis(pedido.lote, self.max_lote - 1))
+            self._iniciar(lote)
+
+    def _retirar_compativeis(self, chave_lote, limite):
+        compativeis = []
+        restantes = []
+        for item in sorted(self._fila):
+            pedido = item[2]
+            if len(compativeis) < limite and pedido.lote == chave_lote and not pedido.futuro.done():
+                compativeis.append(pedido)
+            else:
+                restantes.append(item)
+        if compativeis:
+            heapq.heapify(restantes)
+            self._fila = restantes
+        return compativeis
+
+    def _iniciar(self, lote):
+        self._ativos += 1
+        agora = time.perf_counter()
+        for pedido in lote:
+            self._espera[NOMES_PRIORIDADE.get(pedido.prioridade, "extracao")].registrar(agora - pedido.enfileirado_em)
+
+        tarefa = asyncio.create_task(self._rodar(lote))
+        self._tarefas.add(tarefa)
+        tarefa.add_done_callback(self._tarefas.discard)
+        for pedido in lote:
+            pedido.futuro.add_done_callback(lambda _: self._abandonar(lote, tarefa))
+
+    def _abandonar(self, lote, tarefa):
+        # Todos desistiram (prazo estourado/cliente saiu): cancela a requisição ao Ollama e libera a vaga
+        if not tarefa.done() and all(pedido.futuro.cancelled() for pedido in lote):
+            tarefa.cancel()
+
+    async def _rodar(self, lote):
+        try:
+            if len(lote) == 1:
+                try:
+                    resultados = [await lote[0].chain.ainvoke(lote[0].entrada)]
+                except Exception as e:
+                    resultados = [e]
+            else:
+                self.lotes += 1
+                self.pedidos_em_lote += len(lote)
+                resultados = await lote[0].chain.abatch([p.entrada for p in lote], return_exceptions=True)
+
+            self.executados += len(lote)
+            for pedido, resultado in zip(lote, resultados):
+                if pedido.futuro.done():
+                    continue
+                if isinstance(resultado, Exception):
+                    pedido.futuro.set_exception(resultado)
+                else:
+                    pedido.futuro.set_result(resultado)
+        finally:
+            for pedido in lote:
+                if not pedido.futuro.done():
+                    pedido.futuro.cancel()
+            self._liberar()
+
+    def _liberar(self):
+        self._ativos -= 1
+        self._despachar()
+
+    def estatisticas(self):
+        return {
+            "max_concorrencia": self.max_concorrencia,
+            "max_lote": self.max_lote,
+            "ativos": self._ativos,
+            "fila": len(self._fila),
+            "maior_fila": self.maior_fila,
+            "executados": self.executados,
+            "lotes": self.lotes,
+            "pedidos_em_lote": self.pedidos_em_lote,
+            "coalescidos": self.coalescidos,
+            "cancelados_na_fila": self.cancelados,
+            "max_espera_segundos": self.max_espera,
+            "espera_atual_ms": round(self.espera_atual() * 1000, 2),
+            "rejeitados_sobrecarga": self.rejeitados,
+            "espera": {nome: medidor.estatisticas() for nome, medidor in self._espera.items()},
+        }
@@ -0,0 +1,95 @@
+import csv
+import os
+import time
+from threading import Lock
+
+# Armazém de clientes em memória, indexado pelo CPF só com dígitos.
+# Estrutura: {cpf_limpo: {cpf, data_nascimento, nome, score, limite_credito}}
+
+PASTA_DADOS = os.path.join(os.path.dirname(__file__), "data")
+ARQUIVO_CLIENTES = os.path.join(PASTA_DADOS, "clientes.csv")
+INTERVALO_VERIFICACAO = 1.0 # Segundos entre duas consultas ao mtime do arquivo
+
+def limpar_cpf(cpf):
+    return "".join(c for c in str(cpf) if c.isdigit())
+
+class ArmazemClientes:
+    """
+    Carrega o CSV uma única vez e responde consultas por CPF em O(1).
+    Se o arquivo mudar no disco (mtime, consultado no máximo uma vez por `intervalo_verificacao`),
+    um novo índice é montado à parte e trocado de uma vez só: quem já leu um registro continua
+    com a versão antiga, intacta. Do event loop, `precisa_recarregar` decide e `recarregar` roda
+    numa thread (ver RepositorioCSV.ler).
+    """
+    def __init__(self, caminho, intervalo_verificacao=INTERVALO_VERIFICACAO):
+        self.caminho = caminho
+        self.intervalo_verificacao = intervalo_verificacao
+        self._indice = {}
+        self._colunas = []
+        self._mtime = None
+        self._verificado_em = 0.0
+        self._lock = Lock() # Serializa apenas recargas e escritas; leituras não bloqueiam
+
+    def precisa_recarregar(self):
+        """
+        True se o índice nunca foi carregado ou se o mtime mudou (um os.stat a cada intervalo).
+        """
+        agora = time.monotonic()
+        if self._mtime is not None and agora - self._verificado_em < self.intervalo_verificacao:
+            return False
+        self._verificado_em = agora
+        return os.stat(self.caminho).st_mtime_ns != self._mtime
+
+    def _recarregar_se_mudou(self):
+        if self.precisa_recarregar():
+            self.recarregar()
+
+    def recarregar(self):
+        mtime = os.stat(self.caminho).st_mtime_ns
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            with open(self.caminho, newline="", encoding="utf-8") as arquivo:
+                leitor = csv.DictReader(arquivo)
+                novo_indice = {limpar_cpf(linha["cpf"]): linha for linha in leitor}
+                colunas = leitor.fieldnames or []
+            # Troca atômica da referência (copy-on-write)
+            self._indice = novo_indice
+            self._colunas = colunas
+            self._mtime = mtime
+
+    def obter(self, cpf):
+        """
+        Retorna uma cópia do registro do cliente (strings, como no CSV) ou None.
+        """
+        self._recarregar_se_mudou()
+        registro = self._indice.get(limpar_cpf(cpf))
+        return dict(registro) if registro is not None else None
+
+    def atualizar_score(self, cpf, novo_score):
+        """
+        Substitui o registro do cliente por uma cópia com o novo score e regrava o CSV.
+        Retorna False se o CPF não existir.
+        """
+        self._recarregar_se_mudou()
+        cpf_limpo = limpar_cpf(cpf)
+        with self._lock:
+            registro = self._indice.get(cpf_limpo)
+            if registro is None:
+                return False
+            novo_indice = dict(self._indice)
+            novo_indice[cpf_limpo] = {**registro, "score": str(novo_score)}
+
+            # Escreve num temporário e troca o arquivo para nunca expor um CSV pela metade
+            temporario = self.caminho + ".tmp"
+            with open(temporario, "w", newline="", encoding="utf-8") as arquivo:
+                escritor = csv.DictWriter(arquivo, fieldnames=self._colunas, lineterminator="\n")
+                escritor.writeheader()
+                escritor.writerows(novo_indice.values())
+            os.replace(temporario, self.caminho)
+
+            self._indice = novo_indice
+            self._mtime = os.stat(self.caminho).st_mtime_ns
+            return True
+
+ARMAZEM_CLIENTES = ArmazemClientes(ARQUIVO_CLIENTES)
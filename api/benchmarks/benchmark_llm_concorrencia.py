@@ -0,0 +1,69 @@
+"""
+Benchmark de vazão com várias sessões consultando o LLM ao mesmo tempo.
+
+Compara o caminho antigo (chain.invoke bloqueante dentro de um endpoint async)
+com o `consultar_llm` assíncrono (chain.ainvoke). O Ollama é substituído por um
+modelo simulado com latência fixa, então o resultado mede apenas o efeito do
+event loop, sem depender de GPU.
+
+Uso:
+    python benchmarks/benchmark_llm_concorrencia.py --sessoes 50 --latencia 0.2
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import llm_service
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableLambda
+
+INSTRUCAO = "Classifique a intenção do usuário em: credito, entrevista, cambio, encerrar ou outros."
+
+def criar_llm_simulado(latencia):
+    def gerar(_prompt):
+        time.sleep(latencia)
+        return "credito"
+
+    async def agerar(_prompt):
+        await asyncio.sleep(latencia)
+        return "credito"
+
+    return RunnableLambda(gerar, afunc=agerar)
+
+def consultar_llm_bloqueante(mensagem, historico, instrucao):
+    # Reproduz o caminho anterior: chain.invoke chamado direto no endpoint async
+    prompt = ChatPromptTemplate.from_template("{instrucao}\n{historico}\n{mensagem}")
+    chain = prompt | llm_service.obter_llm() | StrOutputParser()
+    historico_str = llm_service.formatar_historico(historico)
+    return chain.invoke({"instrucao": instrucao, "historico": historico_str, "mensagem": mensagem}).strip().lower()
+
+async def turno_antes(i):
+    return consultar_llm_bloqueante(f"quero ver meu limite {i}", [], INSTRUCAO)
+
+async def turno_depois(i):
+    return await llm_service.consultar_llm(f"quero ver meu limite {i}", [], INSTRUCAO)
+
+async def medir(turno, sessoes):
+    inicio = time.perf_counter()
+    await asyncio.gather(*(turno(i) for i in range(sessoes)))
+    return time.perf_counter() - inicio
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessoes", type=int, default=50)
+    parser.add_argument("--latencia", type=float, default=0.2, help="latência simulada de cada geração (s)")
+    args = parser.parse_args()
+
+    llm_simulado = criar_llm_simulado(args.latencia)
+    llm_service.obter_llm = lambda: llm_simulado
+
+    for nome, turno in (("antes (invoke bloqueante)", turno_antes), ("depois (ainvoke)", turno_depois)):
+        duracao = asyncio.run(medir(turno, args.sessoes))
+        print(f"{nome:<28} {args.sessoes} sessões em {duracao:.2f}s -> {args.sessoes / duracao:.1f} turnos/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Benchmark de memória e de custo por turno das sessões.
+
+Monta N sessões no formato antigo (dict livre + histórico como lista de dicts {role, content})
+e no formato atual, do jeito que o backend em memória as guarda (EstadoSessao com __slots__ dentro
+do ArmazemSessoes, HistoricoConversa com as tuplas (papel, conteudo) numa lista curta), com o mesmo
+conteúdo. Compara a memória alocada (tracemalloc), o tamanho serializado (backends sqlite/redis) e o
+custo do caminho quente de um turno: ler/escrever o estado, registrar as duas mensagens e montar o
+texto do histórico para o prompt.
+
+O ganho é de memória e de leitura de estado. A escrita de estado não fica mais rápida no Python 3.11:
+o acesso ao membro do enum (SubEstadoCredito.MENU) passa pelo __getattr__ do EnumType e custa mais que
+a gravação no slot. O turno fica mais caro que o append + corte do formato antigo porque o histórico
+atual faz mais trabalho a cada mensagem que sai da janela: orçamento de tokens e resumo rolante.
+
+Uso:
+    python benchmarks/benchmark_memoria_sessoes.py --sessoes 100000 --mensagens 6 20
+"""
+import argparse
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from estado_sessao import EstadoSessao, EstadoTriagem, SubEstadoCredito, USUARIO, ASSISTENTE
+from historico_conversa import JANELA_HISTORICO
+from sessao import ArmazemSessoes, serializar_sessao
+
+def cliente(i):
+    return {"cpf": f"{i:011d}", "data_nascimento": "01/01/1980", "nome": f"Cliente {i}", "score": "629", "limite_credito": "5000.00"}
+
+def texto_mensagem(m, i):
+    return f"mensagem {m} da sessão {i}"
+
+def sessao_dict(i, mensagens):
+    sessao = {
+        "estado": "AUTENTICADO",
+        "tentativas": 0,
+        "dados_cliente": cliente(i),
+        "cpf_temp": f"{i:011d}",
+        "agente_atual": "triagem",
+        "historico": [],
+        "sub_estado_credito": "MENU",
+        "sub_estado_entrevista": "INICIO",
+        "sub_estado_cambio": "MENU",
+        "voltou_da_entrevista": False,
+        "iniciando_cambio": False,
+    }
+    for m in range(mensagens):
+        papel = "user" if m % 2 == 0 else "assistant"
+        sessao["historico"].append({"role": papel, "content": texto_mensagem(m, i)})
+    return sessao
+
+def sessao_atual(i, mensagens):
+    sessao = EstadoSessao()
+    sessao.estado = EstadoTriagem.AUTENTICADO
+    sessao.dados_cliente = cliente(i)
+    sessao.cpf_temp = f"{i:011d}"
+    for m in range(mensagens):
+        sessao.registrar(USUARIO if m % 2 == 0 else ASSISTENTE, texto_mensagem(m, i))
+    return sessao
+
+def armazenar_dicts(n_sessoes, mensagens):
+    return {f"sessao_{i}": sessao_dict(i, mensagens) for i in range(n_sessoes)}
+
+def armazenar_atual(n_sessoes, mensagens):
+    armazem = ArmazemSessoes(max_sessoes=n_sessoes)
+    for i in range(n_sessoes):
+        armazem.criar(f"sessao_{i}", sessao_atual(i, mensagens))
+    return armazem
+
+def medir_memoria(fabrica, n_sessoes, mensagens):
+    tracemalloc.start()
+    armazenadas = fabrica(n_sessoes, mensagens)
+    atual, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del armazenadas
+    return atual
+
+def turno_dict(sessao):
+    # Caminho antigo: estado por chave, append na lista e prompt com as últimas mensagens
+    if sessao["estado"] == "AUTENTICADO" and sessao.get("sub_estado_credito", "MENU") == "MENU":
+        sessao["sub_estado_credito"] = "MENU"
+    sessao["historico"].append({"role": "user", "content": "quero ver meu limite"})
+    sessao["historico"].append({"role": "assistant", "content": "Seu limite atual é R$ 5000.00."})
+    del sessao["historico"][:-JANELA_HISTORICO] # Mantém o mesmo tamanho entre repetições
+    return "".join(f"{m['role']}: {m['content']}\n" for m in sessao["historico"])
+
+def turno_atual(sessao):
+    if sessao.estado is EstadoTriagem.AUTENTICADO and sessao.sub_estado_credito is SubEstadoCredito.MENU:
+        sessao.sub_estado_credito = SubEstadoCredito.MENU
+    sessao.registrar(USUARIO, "quero ver meu limite")
+    sessao.registrar(ASSISTENTE, "Seu limite atual é R$ 5000.00.")
+    return sessao.historico.renderizar()
+
+def comparar(antes, depois, unidade, escala=1.0):
+    variacao = (depois - antes) / antes * 100 if antes else 0.0
+    return f"{antes * escala:10.1f} -> {depois * escala:10.1f} {unidade:<10} ({variacao:+.1f}%)"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessoes", type=int, default=100000)
+    parser.add_argument("--mensagens", type=int, nargs="+", default=[6, 20], help="mensagens no histórico de cada sessão")
+    parser.add_argument("--repeticoes", type=int, default=200000, help="repetições das medidas de tempo")
+    args = parser.parse_args()
+
+    print(f"Formato antigo (dict + lista de dicts) -> atual (ArmazemSessoes + EstadoSessao + HistoricoConversa), janela de {JANELA_HISTORICO} mensagens")
+    for mensagens in args.mensagens:
+        print(f"\n{args.sessoes} sessões, {mensagens} mensagens cada")
+        memoria_dict = medir_memoria(armazenar_dicts, args.sessoes, mensagens)
+        memoria_atual = medir_memoria(armazenar_atual, args.sessoes, mensagens)
+        print(f"  memória              : {comparar(memoria_dict / args.sessoes, memoria_atual / args.sessoes, 'bytes/sessão')}")
+        print(f"  serializada (sqlite) : {len(serializar_sessao(sessao_atual(0, mensagens))):10d} bytes/sessão")
+
+    d = sessao_dict(0, JANELA_HISTORICO)
+    s = sessao_atual(0, JANELA_HISTORICO)
+    n = args.repeticoes
+    medidas = [
+        ("leitura de estado", lambda: (d["estado"], d.get("sub_estado_credito", "MENU")), lambda: (s.estado, s.sub_estado_credito)),
+        ("escrita de estado", lambda: d.__setitem__("sub_estado_credito", "MENU"), lambda: setattr(s, "sub_estado_credito", SubEstadoCredito.MENU)),
+        ("turno (histórico + prompt)", lambda: turno_dict(d), lambda: turno_atual(s)),
+    ]
+    print()
+    for nome, antigo, atual in medidas:
+        t_antigo = timeit.timeit(antigo, number=n) / n
+        t_atual = timeit.timeit(atual, number=n) / n
+        print(f"  {nome:<27}: {comparar(t_antigo, t_atual, 'ns', escala=1e9)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark de contenção das travas de sessão com milhares de sessões simultâneas.
+
+Cada sessão recebe vários turnos ao mesmo tempo (ex: duplo clique no front). Cada turno
+lê o estado, espera a "geração do LLM" e grava o estado de volta, como nos routers.
+Compara:
+- sem trava: rápido, mas perde atualizações (condição de corrida);
+- trava global: correto, mas serializa todas as sessões;
+- trava por sessão (sessao.TRAVAS_SESSOES): correto e só serializa a própria sessão.
+
+Uso:
+    python benchmarks/benchmark_travas_sessao.py --sessoes 5000 --turnos 3 --latencia 0.002
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sessao import TravasSessao
+
+@asynccontextmanager
+async def sem_trava(_id_sessao):
+    yield
+
+def trava_global():
+    lock = asyncio.Lock()
+
+    @asynccontextmanager
+    async def travar(_id_sessao):
+        async with lock:
+            yield
+    return travar
+
+async def turno(sessoes, id_sessao, travar, latencia):
+    async with travar(id_sessao):
+        contador = sessoes[id_sessao]["turnos"]
+        await asyncio.sleep(latencia) # Simula a chamada ao LLM no meio do turno
+        sessoes[id_sessao]["turnos"] = contador + 1
+
+async def medir(fabrica_trava, n_sessoes, n_turnos, latencia):
+    travar = fabrica_trava()
+    sessoes = {f"s{i}": {"turnos": 0} for i in range(n_sessoes)}
+    tarefas = [turno(sessoes, id_sessao, travar, latencia) for id_sessao in sessoes for _ in range(n_turnos)]
+    inicio = time.perf_counter()
+    await asyncio.gather(*tarefas)
+    duracao = time.perf_counter() - inicio
+    perdidas = sum(n_turnos - s["turnos"] for s in sessoes.values())
+    return duracao, perdidas
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessoes", type=int, default=5000)
+    parser.add_argument("--turnos", type=int, default=3, help="turnos simultâneos por sessão")
+    parser.add_argument("--latencia", type=float, default=0.002, help="latência simulada do LLM por turno (s)")
+    args = parser.parse_args()
+
+    cenarios = (
+        ("sem trava", lambda: sem_trava),
+        ("trava global", trava_global),
+        ("trava por sessão", lambda: TravasSessao().travar),
+    )
+    total = args.sessoes * args.turnos
+    for nome, fabrica in cenarios:
+        duracao, perdidas = asyncio.run(medir(fabrica, args.sessoes, args.turnos, args.latencia))
+        print(f"{nome:<18} {total} turnos em {duracao:.2f}s -> {total / duracao:,.0f} turnos/s, atualizações perdidas: {perdidas}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Servidor HTTP falso de cotações, no formato da AwesomeAPI (`GET /last/USD-BRL,EUR-BRL`).
+
+Valores fixos, latência configurável e 404 para pares desconhecidos (como a API real, que recusa
+o lote inteiro). Para usar com a API: `COTACAO_URL=http://127.0.0.1:8765`.
+
+Uso:
+    python benchmarks/servidor_cotacoes_falso.py --porta 8765 --latencia-ms 30
+"""
+import argparse
+import asyncio
+import datetime
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+# {sigla: (nome, valor em BRL)}
+COTACOES_FALSAS = {
+    "USD": ("Dólar Americano", 5.4321),
+    "EUR": ("Euro", 5.9876),
+    "GBP": ("Libra Esterlina", 6.8765),
+    "JPY": ("Iene Japonês", 0.0365),
+    "CHF": ("Franco Suíço", 6.2109),
+    "CNY": ("Yuan Chinês", 0.7512),
+    "ARS": ("Peso Argentino", 0.0058),
+    "BTC": ("Bitcoin", 345678.9),
+}
+
+def criar_app(latencia_ms=30.0):
+    app = FastAPI(title="Cotações falsas")
+    app.state.requisicoes = 0
+
+    @app.get("/last/{pares}")
+    async def ultimas_cotacoes(pares: str):
+        app.state.requisicoes += 1
+        if latencia_ms:
+            await asyncio.sleep(latencia_ms / 1000)
+        resposta = {}
+        for par in pares.split(","):
+            origem, _, destino = par.partition("-")
+            if origem not in COTACOES_FALSAS or destino != "BRL":
+                return JSONResponse(status_code=404, content={"status": 404, "code": "CoinNotExists", "message": f"moeda nao encontrada {par}"})
+            nome, valor = COTACOES_FALSAS[origem]
+            resposta[f"{origem}{destino}"] = {
+                "code": origem,
+                "codein": destino,
+                "name": f"{nome}/Real Brasileiro",
+                "bid": f"{valor:.4f}",
+                "ask": f"{valor * 1.001:.4f}",
+                "create_date": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            }
+        return resposta
+
+    return app
+
+def main():
+    import uvicorn
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--latencia-ms", type=float, default=30.0)
+    args = parser.parse_args()
+    uvicorn.run(criar_app(args.latencia_ms), host="127.0.0.1", port=args.porta, log_level="warning")
+
+if __name__ == "__main__":
+    main()
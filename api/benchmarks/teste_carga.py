@@ -0,0 +1,235 @@
+"""
+Teste de carga ponta a ponta: N sessões simultâneas conversando com a API pelos endpoints HTTP.
+
+Cada sessão repete conversas completas, alternando dois fluxos:
+  - crédito: autenticação -> triagem -> crédito (pedido acima do limite) -> entrevista -> crédito
+  - câmbio:  autenticação -> triagem -> câmbio (uma moeda, lote de moedas, moeda via LLM) -> triagem
+As mensagens seguem o `agente_final` de cada resposta, com `encadear: true` como o front.
+
+Por padrão a API sobe no próprio processo (uvicorn) com o modelo falso (LLM_BACKEND=falso,
+llm_falso.py), o servidor falso de cotações e um SQLite temporário (os CSVs de data/ não são alterados).
+Com --url o teste aponta para uma API já rodando (suba-a com as mesmas variáveis de ambiente).
+Ao final: vazão, p50/p95/p99 por endpoint e um resumo do /metricas.
+
+Uso:
+    python benchmarks/teste_carga.py --sessoes 50 --conversas 4
+    python benchmarks/teste_carga.py --sessoes 20 --latencia-llm-ms 300 --paralelo-llm 2
+"""
+import argparse
+import asyncio
+import contextlib
+import csv
+import io
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+import uuid
+
+PASTA_API = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PASTA_API)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+ROTAS_AGENTES = {
+    "AgenteTriagem": "/triagem/",
+    "AgenteCredito": "/credito/",
+    "AgenteEntrevista": "/entrevista/",
+    "AgenteCambio": "/cambio/",
+}
+
+class FalhaConversa(Exception):
+    pass
+
+class Conversa:
+    """
+    Uma sessão de chat: envia cada mensagem ao agente que atende a sessão no momento.
+    """
+    def __init__(self, http, medidas, erros):
+        self.http = http
+        self.medidas = medidas
+        self.erros = erros
+        self.id_sessao = f"carga-{uuid.uuid4().hex[:12]}"
+        self.agente = "AgenteTriagem"
+
+    async def enviar(self, mensagem):
+        rota = ROTAS_AGENTES[self.agente]
+        inicio = time.perf_counter()
+        try:
+            resposta = await self.http.post(rota, json={"id_sessao": self.id_sessao, "mensagem": mensagem, "encadear": True})
+        except Exception as e:
+            self.erros[rota] = self.erros.get(rota, 0) + 1
+            raise FalhaConversa(f"{rota} {mensagem!r}: {e}")
+        self.medidas[rota].medir_desde(inicio)
+        if resposta.status_code != 200:
+            self.erros[rota] = self.erros.get(rota, 0) + 1
+            raise FalhaConversa(f"{rota} {mensagem!r}: HTTP {resposta.status_code}")
+        dados = resposta.json()
+        self.agente = dados.get("agente_final") or self.agente
+        return dados["resposta"]
+
+    async def autenticar(self, cliente):
+        await self.enviar("")
+        await self.enviar(cliente["cpf"])
+        resposta = await self.enviar(cliente["data_nascimento"])
+        if "sucesso" not in resposta:
+            raise FalhaConversa(f"autenticação recusada: {resposta!r}")
+
+async def fluxo_credito(conversa, cliente):
+    await conversa.autenticar(cliente)
+    await conversa.enviar("preciso aumentar meu limite")
+    await conversa.enviar("aumentar limite")
+    # Acima da maior faixa da tabela de score: o agente sempre oferece a entrevista
+    resposta = await conversa.enviar("50000")
+    if "entrevista" in resposta.lower():
+        await conversa.enviar("sim")
+        await conversa.enviar("renda 9000, clt, despesas 1200, 1 dependente, sem dívidas")
+    await conversa.enviar("consultar limite")
+    if conversa.agente != "AgenteCredito":
+        raise FalhaConversa(f"fluxo de crédito terminou em {conversa.agente}")
+
+async def fluxo_cambio(conversa, cliente):
+    await conversa.autenticar(cliente)
+    await conversa.enviar("cotação de moedas")
+    await conversa.enviar("dólar")
+    await conversa.enviar("euro e libra")
+    await conversa.enviar("quero ver o iene") # Sem nome conhecido: passa pelo LLM
+    await conversa.enviar("voltar")
+    if conversa.agente != "AgenteTriagem":
+        raise FalhaConversa(f"fluxo de câmbio terminou em {conversa.agente}")
+
+FLUXOS = {"credito": fluxo_credito, "cambio": fluxo_cambio}
+
+def ler_clientes():
+    with open(os.path.join(PASTA_API, "data", "clientes.csv"), newline="", encoding="utf-8") as arquivo:
+        return list(csv.DictReader(arquivo))
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+async def subir_servidor(app, porta):
+    import uvicorn
+    servidor = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=porta, log_level="warning"))
+    tarefa = asyncio.create_task(servidor.serve())
+    while not servidor.started:
+        if tarefa.done():
+            tarefa.result() # Propaga o erro de inicialização
+        await asyncio.sleep(0.01)
+    return servidor, tarefa
+
+async def sessao_de_carga(indice, args, http, clientes, medidas, erros, resultados):
+    for n in range(args.conversas):
+        nome_fluxo = "credito" if (indice + n) % 2 == 0 else "cambio"
+        cliente = clientes[(indice + n) % len(clientes)]
+        inicio = time.perf_counter()
+        try:
+            await FLUXOS[nome_fluxo](Conversa(http, medidas, erros), cliente)
+            resultados[nome_fluxo].medir_desde(inicio)
+        except FalhaConversa as e:
+            resultados["falhas"].append(f"{nome_fluxo}: {e}")
+
+async def executar(args):
+    import httpx
+    from transmissao import MedidorLatencia
+
+    servidores = []
+    url = args.url
+    if url is None:
+        from servidor_cotacoes_falso import criar_app as criar_app_cotacoes
+        servidores.append(await subir_servidor(criar_app_cotacoes(args.latencia_cotacao_ms), args.porta_cotacoes))
+        import main # Importado depois das variáveis de ambiente
+        porta = porta_livre()
+        servidores.append(await subir_servidor(main.app, porta))
+        url = f"http://127.0.0.1:{porta}"
+
+    limites = httpx.Limits(max_connections=args.sessoes, max_keepalive_connections=args.sessoes)
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limites) as http:
+        for _ in range(300): # Espera o aquecimento do modelo (/pronto)
+            if (await http.get("/pronto")).status_code == 200:
+                break
+            await asyncio.sleep(0.1)
+
+        medidas = {rota: MedidorLatencia(capacidade=1_000_000) for rota in ROTAS_AGENTES.values()}
+        erros = {}
+        resultados = {"credito": MedidorLatencia(capacidade=1_000_000), "cambio": MedidorLatencia(capacidade=1_000_000), "falhas": []}
+        clientes = ler_clientes()
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(sessao_de_carga(i, args, http, clientes, medidas, erros, resultados) for i in range(args.sessoes)))
+        duracao = time.perf_counter() - inicio
+        metricas = (await http.get("/metricas")).json()
+
+    for servidor, tarefa in reversed(servidores):
+        servidor.should_exit = True
+        await tarefa
+    return duracao, medidas, erros, resultados, metricas
+
+def relatorio(args, duracao, medidas, erros, resultados, metricas):
+    requisicoes = sum(m.total for m in medidas.values())
+    conversas = resultados["credito"].total + resultados["cambio"].total
+    print(f"Sessões simultâneas: {args.sessoes} | conversas concluídas: {conversas} "
+          f"(crédito {resultados['credito'].total}, câmbio {resultados['cambio'].total}) | falhas: {len(resultados['falhas'])}")
+    print(f"Requisições: {requisicoes} em {duracao:.2f}s -> {requisicoes / duracao:.1f} req/s | {conversas / duracao:.2f} conversas/s")
+    print()
+    print(f"{'endpoint':<14}{'reqs':>7}{'erros':>7}{'p50_ms':>10}{'p95_ms':>10}{'p99_ms':>10}{'max_ms':>10}")
+    linhas = [(rota, m.estatisticas()) for rota, m in medidas.items()]
+    linhas += [(f"fluxo {nome}", resultados[nome].estatisticas()) for nome in ("credito", "cambio")]
+    for nome, e in linhas:
+        if not e["amostras"]:
+            continue
+        print(f"{nome:<14}{e['total']:>7}{erros.get(nome, 0):>7}{e['p50_ms']:>10.1f}{e['p95_ms']:>10.1f}{e['p99_ms']:>10.1f}{e['max_ms']:>10.1f}")
+
+    agendador = metricas.get("agendador_llm", {})
+    espera = agendador.get("espera", {}).get("classificacao", {})
+    print()
+    print(f"LLM: {agendador.get('executados', 0)} gerações, maior fila {agendador.get('maior_fila', 0)}, "
+          f"lotes {agendador.get('lotes', 0)}, coalescidos {agendador.get('coalescidos', 0)}, "
+          f"recusados por sobrecarga {agendador.get('rejeitados_sobrecarga', 0)}, espera p95 (classificação) {espera.get('p95_ms', 0)} ms")
+    print(f"Disjuntor: {metricas.get('disjuntor_llm', {}).get('estado')} | cache de classificação: "
+          f"{metricas.get('cache_classificacao', {}).get('taxa_acerto')} de acerto | cotações: "
+          f"{metricas.get('cliente_cotacoes', {}).get('requisicoes')} requisições ao provedor")
+    for falha in resultados["falhas"][:5]:
+        print(f"  falha: {falha}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessoes", type=int, default=50, help="sessões simultâneas")
+    parser.add_argument("--conversas", type=int, default=4, help="conversas completas por sessão")
+    parser.add_argument("--url", help="API já em execução (não sobe nada no processo)")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--latencia-llm-ms", type=float, default=40.0, help="custo fixo de cada geração do modelo falso")
+    parser.add_argument("--paralelo-llm", type=int, default=4, help="gerações simultâneas do modelo falso")
+    parser.add_argument("--taxa-erro-llm", type=float, default=0.0)
+    parser.add_argument("--latencia-cotacao-ms", type=float, default=30.0)
+    parser.add_argument("--porta-cotacoes", type=int, default=0, help="0 escolhe uma porta livre")
+    parser.add_argument("--verboso", action="store_true", help="mostra os prints da API durante o teste")
+    args = parser.parse_args()
+
+    pasta_temporaria = None
+    if args.url is None:
+        args.porta_cotacoes = args.porta_cotacoes or porta_livre()
+        pasta_temporaria = tempfile.mkdtemp(prefix="banco_agil_carga_")
+        os.environ.update({
+            "LLM_BACKEND": "falso",
+            "LLM_FALSO_LATENCIA_MS": str(args.latencia_llm_ms),
+            "LLM_FALSO_PARALELO": str(args.paralelo_llm),
+            "LLM_FALSO_TAXA_ERRO": str(args.taxa_erro_llm),
+            "COTACAO_URL": f"http://127.0.0.1:{args.porta_cotacoes}",
+            "BACKEND_DADOS": "sqlite",
+            "ARQUIVO_SQLITE": os.path.join(pasta_temporaria, "banco_agil.db"),
+        })
+
+    saida = contextlib.nullcontext() if args.verboso else contextlib.redirect_stdout(io.StringIO())
+    try:
+        with saida:
+            resultado = asyncio.run(executar(args))
+    finally:
+        if pasta_temporaria:
+            shutil.rmtree(pasta_temporaria, ignore_errors=True)
+    relatorio(args, *resultado)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+
+# Cache de resultados de classificação do LLM (intenções e moedas)
+# Estrutura: {(instrucao, mensagem_normalizada): (resultado, expira_em)}
+
+_RE_PONTUACAO = re.compile(r"[^\w\s]")
+_RE_ESPACOS = re.compile(r"\s+")
+
+def normalizar_mensagem(mensagem):
+    """
+    Normaliza o texto livre para que variações triviais caiam na mesma chave:
+    "Cotação do Dólar!!" e "cotacao do dolar" viram "cotacao do dolar".
+    """
+    texto = unicodedata.normalize("NFKD", str(mensagem).lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = _RE_PONTUACAO.sub(" ", texto)
+    return _RE_ESPACOS.sub(" ", texto).strip()
+
+class CacheClassificacao:
+    """
+    Cache LRU com TTL para classificações. Todas as chamadas acontecem no event loop
+    (sem await entre leitura e escrita), então não há necessidade de lock.
+    """
+    def __init__(self, capacidade=2048, ttl=3600.0):
+        self.capacidade = capacidade
+        self.ttl = ttl
+        self._itens = OrderedDict()
+        self.acertos = 0
+        self.falhas = 0
+        self.expirados = 0
+        self.despejados = 0
+
+    def obter(self, instrucao, mensagem):
+        chave = (instrucao, normalizar_mensagem(mensagem))
+        item = self._itens.get(chave)
+        if item is None:
+            self.falhas += 1
+            return None
+
+        resultado, expira_em = item
+        if expira_em < time.monotonic():
+            del self._itens[chave]
+            self.expirados += 1
+            self.falhas += 1
+            return None
+
+        self._itens.move_to_end(chave)
+        self.acertos += 1
+        return resultado
+
+    def guardar(self, instrucao, mensagem, resultado):
+        chave = (instrucao, normalizar_mensagem(mensagem))
+        self._itens[chave] = (resultado, time.monotonic() + self.ttl)
+        self._itens.move_to_end(chave)
+        while len(self._itens) > self.capacidade:
+            self._itens.popitem(last=False)
+            self.despejados += 1
+
+    def limpar(self):
+        self._itens.clear()
+
+    def estatisticas(self):
+        total = self.acertos + self.falhas
+        return {
+            "itens": len(self._itens),
+            "capacidade": self.capacidade,
+            "ttl_segundos": self.ttl,
+            "acertos": self.acertos,
+            "falhas": self.falhas,
+            "taxa_acerto": round(self.acertos / total, 4) if total else 0.0,
+            "expirados": self.expirados,
+            "despejados": self.despejados,
+        }
@@ -0,0 +1,207 @@
+import asyncio
+import time
+from collections import Counter, OrderedDict
+
+# Cache de cotações por par de moedas (ex: ("USD", "BRL")) com stale-while-revalidate.
+# Estrutura: {par: (resultado, atualizado_em, ttl)}, onde resultado = (sucesso, nome, valor)
+
+FALHA_COTACAO = (False, "Erro ao consultar a API", 0.0)
+
+class CacheCotacoes:
+    """
+    - Dentro do TTL: devolve a cotação guardada, sem ir ao provedor.
+    - Vencida, mas dentro de ttl_obsoleto: devolve a cotação antiga e dispara a atualização
+      em segundo plano.
+    - Ausente (ou velha demais): espera a busca. Buscas simultâneas do mesmo par compartilham
+      o mesmo future, e os pares que faltam num pedido são buscados numa única requisição em lote.
+    Falhas ficam guardadas por ttl_falha para não martelar o provedor com pares inválidos.
+    A demanda por par é contada para que o pré-carregamento (pre_carregar) mantenha os pares
+    mais pedidos sempre frescos.
+    Todo o acesso acontece no event loop, então não há necessidade de lock.
+    """
+    def __init__(self, buscar_lote, ttl=30.0, ttl_obsoleto=600.0, ttl_falha=10.0, capacidade=256):
+        self.buscar_lote = buscar_lote # async [(origem, destino)] -> {par: (sucesso, nome, valor)}
+        self.ttl = ttl
+        self.ttl_obsoleto = ttl_obsoleto
+        self.ttl_falha = ttl_falha
+        self.capacidade = capacidade
+        self._itens = OrderedDict()
+        self._em_andamento = {} # {par: asyncio.Future}
+        self._tarefas = set() # Referências fortes das buscas em segundo plano
+        self.acertos = 0
+        self.obsoletos = 0
+        self.falhas = 0
+        self.buscas = 0
+        self.coalescidas = 0
+        self.erros = 0
+        self._demanda = Counter() # Pedidos por par desde o último ciclo de pré-carregamento (com decaimento)
+        self.pares_quentes = []
+        self.ciclos_pre_carga = 0
+        self.pares_pre_carregados = 0
+        self.ultimo_pre_carregamento = None
+
+    async def obter(self, moeda_origem, moeda_destino="BRL"):
+        par = (moeda_origem.upper(), moeda_destino.upper())
+        return (await self.obter_lote([par]))[par]
+
+    async def obter_lote(self, pares):
+        """
+        Cotações de vários pares [(origem, destino)] -> {par: (sucesso, nome, valor)}.
+        """
+        pares = [(origem.upper(), destino.upper()) for origem, destino in pares]
+        resultados = {}
+        revalidar = []
+        faltando = []
+        agora = time.monotonic()
+        for par in dict.fromkeys(pares):
+            self._demanda[par] += 1
+            item = self._itens.get(par)
+            if item is not None:
+                resultado, atualizado_em, ttl = item
+                idade = agora - atualizado_em
+                if idade < ttl:
+                    self._itens.move_to_end(par)
+                    self.acertos += 1
+                    resultados[par] = resultado
+                    continue
+                if resultado[0] and idade < self.ttl_obsoleto:
+                    self._itens.move_to_end(par)
+                    self.obsoletos += 1
+                    resultados[par] = resultado
+                    revalidar.append(par)
+                    continue
+            self.falhas += 1
+            faltando.append(par)
+
+        if revalidar:
+            self._atualizar(revalidar)
+        if faltando:
+            futuros = self._atualizar(faltando)
+            # shield: se o cliente desistir, a busca continua para quem mais estiver esperando
+            valores = await asyncio.gather(*(asyncio.shield(futuros[par]) for par in faltando))
+            resultados.update(zip(faltando, valores))
+        return resultados
+
+    def escolher_pares_quentes(self, pares_fixos=(), max_pares=10, min_pedidos=3):
+        """
+        Pares fixos (configuração) + os mais pedidos recentemente, limitados a max_pares.
+        A contagem cai pela metade a cada chamada, então pares que esfriam saem do conjunto.
+        """
+        quentes = dict.fromkeys(pares_fixos)
+        for par, pedidos in self._demanda.most_common():
+            if len(quentes) >= max_pares or pedidos < min_pedidos:
+                break
+            quentes.setdefault(par)
+        self._demanda = Counter({par: pedidos // 2 for par, pedidos in self._demanda.items() if pedidos // 2})
+        self.pares_quentes = list(quentes)
+        return self.pares_quentes
+
+    async def pre_carregar(self, pares, antecedencia=0.0):
+        """
+        Atualiza numa única requisição em lote os pares que vencem nos próximos `antecedencia`
+        segundos (ou que ainda não estão no cache). Retorna quantos pares foram buscados.
+        """
+        limite = time.monotonic() + antecedencia
+        vencendo = []
+        for par in pares:
+            item = self._itens.get(par)
+            if item is None or not item[0][0] or item[1] + item[2] <= limite:
+                vencendo.append(par)
+
+        self.ciclos_pre_carga += 1
+        self.ultimo_pre_carregamento = time.time()
+        if not vencendo:
+            return 0
+        futuros = self._atualizar(vencendo)
+        await asyncio.gather(*(asyncio.shield(futuros[par]) for par in vencendo))
+        self.pares_pre_carregados += len(vencendo)
+        return len(vencendo)
+
+    def idades(self, pares):
+        """
+        Idade em segundos da cotação guardada de cada par (None se ausente).
+        """
+        agora = time.monotonic()
+        return {f"{origem}-{destino}": (round(agora - item[1], 1) if (item := self._itens.get((origem, destino))) else None)
+                for origem, destino in pares}
+
+    def _atualizar(self, pares):
+        """
+        Devolve {par: future}; os pares que ainda não estão sendo buscados vão numa única tarefa em lote.
+        """
+        futuros = {}
+        novos = []
+        for par in pares:
+            futuro = self._em_andamento.get(par)
+            if futuro is None:
+                futuro = asyncio.get_running_loop().create_future()
+                self._em_andamento[par] = futuro
+                novos.append(par)
+            else:
+                self.coalescidas += 1
+            futuros[par] = futuro
+        if novos:
+            self.buscas += 1
+            tarefa = asyncio.create_task(self._buscar_e_guardar(novos))
+            self._tarefas.add(tarefa)
+            tarefa.add_done_callback(self._tarefas.discard)
+        return futuros
+
+    async def _buscar_e_guardar(self, pares):
+        try:
+            resultados = await self.buscar_lote(pares)
+        except Exception as e:
+            print(f"Erro ao buscar cotações {pares}: {e}")
+            resultados = {}
+
+        agora = time.monotonic()
+        for par in pares:
+            resultado = self._registrar(par, resultados.get(par, FALHA_COTACAO), agora)
+            futuro = self._em_andamento.pop(par, None)
+            if futuro is not None and not futuro.done():
+                futuro.set_result(resultado)
+
+    def _registrar(self, par, resultado, agora):
+        if resultado[0]:
+            self._guardar(par, (resultado, agora, self.ttl))
+            return resultado
+
+        self.erros += 1
+        antigo = self._itens.get(par)
+        if antigo is not None and antigo[0][0] and agora - antigo[1] < self.ttl_obsoleto:
+            # Provedor falhou: segue servindo a última cotação boa até o limite de obsolescência
+            return antigo[0]
+        self._guardar(par, (resultado, agora, self.ttl_falha))
+        return resultado
+
+    def _guardar(self, par, item):
+        self._itens[par] = item
+        self._itens.move_to_end(par)
+        while len(self._itens) > self.capacidade:
+            self._itens.popitem(last=False)
+
+    def limpar(self):
+        self._itens.clear()
+
+    def estatisticas(self):
+        total = self.acertos + self.obsoletos + self.falhas
+        return {
+            "pares": len(self._itens),
+            "ttl_segundos": self.ttl,
+            "ttl_obsoleto_segundos": self.ttl_obsoleto,
+            "acertos": self.acertos,
+            "obsoletos_servidos": self.obsoletos,
+            "falhas": self.falhas,
+            "taxa_acerto": round((self.acertos + self.obsoletos) / total, 4) if total else 0.0,
+            "buscas_provedor": self.buscas,
+            "buscas_coalescidas": self.coalescidas,
+            "erros_provedor": self.erros,
+            "em_andamento": len(self._em_andamento),
+            "pre_carregamento": {
+                "pares_quentes": [f"{origem}-{destino}" for origem, destino in self.pares_quentes],
+                "idade_segundos": self.idades(self.pares_quentes),
+                "ciclos": self.ciclos_pre_carga,
+                "pares_atualizados": self.pares_pre_carregados,
+                "ultimo_ciclo": self.ultimo_pre_carregamento,
+            },
+        }
@@ -0,0 +1,87 @@
+import asyncio
+import httpx
+from cache_cotacoes import FALHA_COTACAO
+
+# Cliente HTTP assíncrono da AwesomeAPI com pool de conexões (keep-alive).
+# A API aceita vários pares na mesma URL: /last/USD-BRL,EUR-BRL,GBP-BRL
+
+URL_AWESOMEAPI = "https://economia.awesomeapi.com.br"
+
+class ClienteCotacoes:
+    """
+    Um único httpx.AsyncClient por processo, criado sob demanda e fechado no desligamento da API.
+    Resultados seguem o formato (sucesso, nome, valor) usado pelo Agente de Câmbio.
+    """
+    def __init__(self, url_base=URL_AWESOMEAPI, timeout=5.0, max_conexoes=20):
+        self.url_base = url_base
+        self.timeout = timeout
+        self.max_conexoes = max_conexoes
+        self._cliente = None
+        self.requisicoes = 0
+        self.pares_buscados = 0
+        self.erros = 0
+
+    def _obter_cliente(self):
+        if self._cliente is None:
+            self._cliente = httpx.AsyncClient(
+                base_url=self.url_base,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_conexoes, max_keepalive_connections=self.max_conexoes),
+            )
+        return self._cliente
+
+    async def _requisitar(self, pares):
+        self.requisicoes += 1
+        self.pares_buscados += len(pares)
+        caminho = ",".join(f"{origem}-{destino}" for origem, destino in pares)
+        return await self._obter_cliente().get(f"/last/{caminho}")
+
+    async def buscar_lote(self, pares):
+        """
+        Busca vários pares [(origem, destino)] numa única requisição.
+        Retorna {par: (sucesso, nome, valor)} com uma entrada para cada par pedido.
+        """
+        pares = list(dict.fromkeys(pares))
+        if not pares:
+            return {}
+        try:
+            resposta = await self._requisitar(pares)
+            if resposta.status_code == 404 and len(pares) > 1:
+                # A API recusa o lote inteiro se um dos pares não existir: separa os pares
+                resultados = await asyncio.gather(*(self.buscar_lote([par]) for par in pares))
+                return {par: r[par] for par, r in zip(pares, resultados)}
+            if resposta.status_code != 200:
+                self.erros += 1
+                return {par: FALHA_COTACAO for par in pares}
+            dados = resposta.json()
+        except Exception as e:
+            self.erros += 1
+            print(f"Erro ao buscar cotações {pares}: {e}")
+            return {par: FALHA_COTACAO for par in pares}
+
+        resultados = {}
+        for origem, destino in pares:
+            info = dados.get(f"{origem}{destino}")
+            if info:
+                resultados[(origem, destino)] = (True, info.get("name", ""), float(info.get("bid", 0))) # Preço de compra
+            else:
+                resultados[(origem, destino)] = FALHA_COTACAO
+        return resultados
+
+    async def buscar(self, moeda_origem, moeda_destino="BRL"):
+        par = (moeda_origem, moeda_destino)
+        return (await self.buscar_lote([par]))[par]
+
+    async def fechar(self):
+        if self._cliente is not None:
+            await self._cliente.aclose()
+            self._cliente = None
+
+    def estatisticas(self):
+        return {
+            "requisicoes": self.requisicoes,
+            "pares_buscados": self.pares_buscados,
+            "pares_por_requisicao": round(self.pares_buscados / self.requisicoes, 2) if self.requisicoes else 0.0,
+            "erros": self.erros,
+            "max_conexoes": self.max_conexoes,
+        }
@@ -0,0 +1,82 @@
+import time
+from enum import Enum
+
+# Disjuntor (circuit breaker) do backend de LLM.
+# Depois de N falhas ou prazos estourados seguidos, as chamadas falham na hora (sem esperar o Ollama)
+# e os agentes usam as regras determinísticas. Passado o tempo de espera, uma única chamada de sonda
+# é liberada (meio-aberto): se der certo o disjuntor fecha, se falhar volta a abrir.
+
+class EstadoDisjuntor(str, Enum):
+    FECHADO = "fechado"
+    ABERTO = "aberto"
+    MEIO_ABERTO = "meio_aberto"
+
+class LLMIndisponivel(Exception):
+    pass
+
+class DisjuntorLLM:
+    """
+    Usado só no event loop, sem await entre ler e alterar o estado (sem lock).
+    """
+    def __init__(self, falhas_para_abrir=5, tempo_aberto=15.0):
+        self.falhas_para_abrir = falhas_para_abrir
+        self.tempo_aberto = tempo_aberto
+        self.estado = EstadoDisjuntor.FECHADO
+        self.falhas_consecutivas = 0
+        self.aberto_em = 0.0
+        self._sonda_em_andamento = False
+        self.aberturas = 0
+        self.rejeitadas = 0
+        self.sondas = 0
+
+    def admitir(self):
+        """
+        Levanta LLMIndisponivel se a chamada não deve ir ao modelo.
+        Retorna True quando a chamada é a sonda do estado meio-aberto.
+        """
+        if self.estado is EstadoDisjuntor.FECHADO:
+            return False
+        if self.estado is EstadoDisjuntor.ABERTO:
+            if time.monotonic() - self.aberto_em < self.tempo_aberto:
+                self.rejeitadas += 1
+                raise LLMIndisponivel("disjuntor aberto")
+            self.estado = EstadoDisjuntor.MEIO_ABERTO
+        if self._sonda_em_andamento:
+            self.rejeitadas += 1
+            raise LLMIndisponivel("disjuntor meio-aberto (sonda em andamento)")
+        self._sonda_em_andamento = True
+        self.sondas += 1
+        return True
+
+    def registrar(self, sucesso, sonda=False):
+        """
+        `sucesso`: True, False (erro/prazo estourado) ou None (chamada abandonada, não conta).
+        """
+        if sonda:
+            self._sonda_em_andamento = False
+        if sucesso is None:
+            return
+        if sucesso:
+            self.falhas_consecutivas = 0
+            self.estado = EstadoDisjuntor.FECHADO
+            return
+        self.falhas_consecutivas += 1
+        if sonda or (self.estado is EstadoDisjuntor.FECHADO and self.falhas_consecutivas >= self.falhas_para_abrir):
+            self._abrir()
+
+    def _abrir(self):
+        self.estado = EstadoDisjuntor.ABERTO
+        self.aberto_em = time.monotonic()
+        self.aberturas += 1
+        print(f"Disjuntor do LLM aberto após {self.falhas_consecutivas} falhas seguidas; nova tentativa em {self.tempo_aberto:.0f}s.")
+
+    def estatisticas(self):
+        return {
+            "estado": self.estado.value,
+            "falhas_consecutivas": self.falhas_consecutivas,
+            "falhas_para_abrir": self.falhas_para_abrir,
+            "tempo_aberto_segundos": self.tempo_aberto,
+            "aberturas": self.aberturas,
+            "rejeitadas": self.rejeitadas,
+            "sondas": self.sondas,
+        }
@@ -0,0 +1,94 @@
+from enum import Enum
+from historico_conversa import HistoricoConversa
+
+# Representação compacta de uma sessão de atendimento.
+# Estados são enums (str) e o histórico é uma janela de tuplas (papel, conteudo) com orçamento
+# de tokens e resumo rolante das mensagens antigas (HistoricoConversa).
+
+class EstadoTriagem(str, Enum):
+    SAUDACAO = "SAUDACAO"
+    AGUARDANDO_CPF = "AGUARDANDO_CPF"
+    AGUARDANDO_DATA_NASCIMENTO = "AGUARDANDO_DATA_NASCIMENTO"
+    AUTENTICADO = "AUTENTICADO"
+    ENCERRADO = "ENCERRADO"
+
+class SubEstadoCredito(str, Enum):
+    MENU = "MENU"
+    AGUARDANDO_VALOR = "AGUARDANDO_VALOR"
+    OFERECER_ENTREVISTA = "OFERECER_ENTREVISTA"
+
+class SubEstadoEntrevista(str, Enum):
+    INICIO = "INICIO"
+    COLETANDO_DADOS = "COLETANDO_DADOS"
+
+class SubEstadoCambio(str, Enum):
+    MENU = "MENU"
+    AGUARDANDO_MOEDA = "AGUARDANDO_MOEDA"
+
+class Agente(str, Enum):
+    TRIAGEM = "AgenteTriagem"
+    CREDITO = "AgenteCredito"
+    ENTREVISTA = "AgenteEntrevista"
+    CAMBIO = "AgenteCambio"
+
+# Papéis das mensagens do histórico
+USUARIO = "user"
+ASSISTENTE = "assistant"
+
+class EstadoSessao:
+    """
+    Sessão com campos fixos em __slots__ (sem __dict__ por instância), todos pré-alocados.
+    O acesso por chave (`sessao["estado"]`) continua disponível para `atualizar_sessao`.
+    """
+    __slots__ = (
+        "estado", "tentativas", "dados_cliente", "cpf_temp", "agente_atual", "historico",
+        "sub_estado_credito", "sub_estado_entrevista", "sub_estado_cambio",
+        "voltou_da_entrevista", "iniciando_cambio", "dados_entrevista",
+    )
+
+    def __init__(self):
+        self.estado = EstadoTriagem.SAUDACAO
+        self.tentativas = 0
+        self.dados_cliente = None
+        self.cpf_temp = None
+        self.agente_atual = Agente.TRIAGEM
+        self.historico = HistoricoConversa() # [(papel, conteudo)] + resumo
+        self.sub_estado_credito = SubEstadoCredito.MENU
+        self.sub_estado_entrevista = SubEstadoEntrevista.INICIO
+        self.sub_estado_cambio = SubEstadoCambio.MENU
+        self.voltou_da_entrevista = False
+        self.iniciando_cambio = False
+        self.dados_entrevista = None
+
+    def registrar(self, papel, conteudo):
+        self.historico.append((papel, conteudo))
+
+    def __getitem__(self, chave):
+        return getattr(self, chave)
+
+    def __setitem__(self, chave, valor):
+        setattr(self, chave, valor)
+
+    def para_lista(self):
+        """
+        Forma serializável (JSON) na ordem dos __slots__.
+        """
+        return [
+            self.estado.value, self.tentativas, self.dados_cliente, self.cpf_temp, self.agente_atual.value,
+            self.historico.para_dict(), self.sub_estado_credito.value, self.sub_estado_entrevista.value,
+            self.sub_estado_cambio.value, self.voltou_da_entrevista, self.iniciando_cambio, self.dados_entrevista,
+        ]
+
+    @classmethod
+    def de_lista(cls, valores):
+        sessao = cls.__new__(cls)
+        (estado, sessao.tentativas, sessao.dados_cliente, sessao.cpf_temp, agente, historico,
+         sub_credito, sub_entrevista, sub_cambio, sessao.voltou_da_entrevista, sessao.iniciando_cambio,
+         sessao.dados_entrevista) = valores
+        sessao.estado = EstadoTriagem(estado)
+        sessao.agente_atual = Agente(agente)
+        sessao.historico = HistoricoConversa.de_valor(historico)
+        sessao.sub_estado_credito = SubEstadoCredito(sub_credito)
+        sessao.sub_estado_entrevista = SubEstadoEntrevista(sub_entrevista)
+        sessao.sub_estado_cambio = SubEstadoCambio(sub_cambio)
+        return sessao
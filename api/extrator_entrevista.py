@@ -0,0 +1,269 @@
+import os
+import re
+import unicodedata
+from dotenv import load_dotenv
+from cache_classificacao import normalizar_mensagem
+from roteador_intencoes import ROTEADOR_SAIDA, tem_negacao, pedido_de_saida, pedido_de_volta
+
+# Pré-extração determinística dos dados da entrevista (renda, emprego, despesas, dependentes, dívidas).
+# Cada campo encontrado vem com uma confiança; o LLM só é chamado para os campos que ficaram
+# de fora (ou abaixo do limiar), com um esquema JSON apenas com esses campos.
+
+load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+LIMIAR_EXTRATOR = float(os.getenv("LIMIAR_EXTRATOR_ENTREVISTA", "0.8"))
+
+CAMPOS_ENTREVISTA = ("renda", "emprego", "despesas", "dependentes", "dividas")
+
+# Números em formato BR ou simples: 5000 | 5.000 | 5.000,00 | 5000.50 | 5 mil | 5k
+_NUM = r"(\d{1,3}(?:\.\d{3})+(?:,\d{1,2})?|\d+(?:[.,]\d{1,2})?)(\s*(?:mil|k)\b)?"
+_PONTE = r"[^\d,;\n]{0,25}?" # "renda mensal de R$ " entre a palavra-chave e o número
+
+_RE_NUMERO = re.compile(_NUM)
+_RE_RENDA = (
+    re.compile(r"\b(?:renda|salario|ganho|recebo|rendimento|faturo|ganhos)\b" + _PONTE + _NUM),
+    re.compile(_NUM + r"\s*(?:reais\s*)?(?:de\s+)?(?:renda|salario|por mes de renda)\b"),
+)
+_RE_DESPESAS = (
+    re.compile(r"\b(?:despesas?|gastos?|custos?|contas)\b" + _PONTE + _NUM),
+    re.compile(_NUM + r"\s*(?:reais\s*)?(?:de\s+|em\s+)?(?:despesas?|gastos?|custos?)\b"),
+)
+# "Sem renda"/"sem despesas" só valem como frase fechada: "não tenho renda extra" não zera a renda
+_FIM_ORACAO = r"(?=\s*(?:[,.;!?]|$|e\b|mas\b|nenhuma\b))"
+_RE_SEM_RENDA = re.compile(r"\b(?:sem renda|nao tenho renda|nao tenho nenhuma renda|0 de renda|renda zero)" + _FIM_ORACAO)
+_RE_SEM_DESPESAS = re.compile(r"\b(?:sem despesas?|nao tenho despesas?|nao possuo despesas?|0 despesas?|nenhuma despesa|sem gastos?)" + _FIM_ORACAO)
+
+_RE_DESEMPREGADO = re.compile(r"\b(?:desempregad[oa]|sem emprego|sem trabalho|nao trabalho)\b")
+_RE_AUTONOMO = re.compile(r"\b(?:autonom[oa]|freelancer|freela|por conta propria|mei|uber|empreendedor[a]?)\b")
+_RE_FORMAL = re.compile(r"\b(?:clt|carteira assinada|registrad[oa]|formal|concursad[oa]|servidor publico)\b")
+
+_PALAVRAS_NUMERO = {"nenhum": "0", "nenhuma": "0", "zero": "0", "um": "1", "uma": "1", "dois": "2", "duas": "2", "tres": "3+"}
+_RE_DEPENDENTES = (
+    re.compile(r"\b(\d+|nenhum|nenhuma|zero|um|uma|dois|duas|tres|quatro|cinco)\s+(?:dependentes?|filhos?|filhas?)\b"),
+    re.compile(r"\bdependentes?\s*[:=]?\s*(\d+|nenhum|zero)\b"),
+)
+_RE_SEM_DEPENDENTES = re.compile(r"\b(?:sem (?:dependentes?|filhos?)|nao tenho (?:dependentes?|filhos?)|nao possuo dependentes?)\b")
+
+_RE_SEM_DIVIDAS = re.compile(r"\b(?:sem dividas?|nao tenho dividas?|nao possuo dividas?|nenhuma divida|dividas?\s*[:=]?\s*nao|nao estou devendo)\b")
+_RE_COM_DIVIDAS = re.compile(r"\b(?:tenho dividas?|com dividas?|possuo dividas?|estou com dividas?|dividas?\s*[:=]?\s*sim|estou devendo)\b")
+_RE_NEGACAO_ORACAO = re.compile(r"\b(?:nao|nem|nunca)\b(?:(?!\b(?:mas|porem)\b)[^,.;!?])*$") # Negação antes, na mesma oração
+
+_RE_ENCERRAR = re.compile(r"\b(?:sair|encerrar|tchau|cancelar|desisto)\b")
+_RE_VOLTAR = re.compile(r"\b(?:voltar|menu|outros servicos)\b")
+
+_RE_SIM = re.compile(r"^(?:sim|s|tenho|possuo)\W*$")
+_RE_NAO = re.compile(r"^(?:nao|n|nenhuma|nao tenho|nao possuo)\W*$")
+_RE_ACEITE = re.compile(r"^\W*(?:sim|s|quero|claro|aceito|bora|ok|pode ser|vamos)\b")
+_RE_RECUSA = re.compile(r"^\W*(?:nao|n|depois|nunca|agora nao)\b")
+
+def remover_acentos(texto):
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+def converter_numero(numero, multiplicador=None):
+    """
+    "5.000,00" -> 5000.0 | "5000.50" -> 5000.5 | "5" + " mil" -> 5000.0
+    """
+    if "," in numero and "." in numero:
+        numero = numero.replace(".", "").replace(",", ".")
+    elif "," in numero:
+        numero = numero.replace(",", ".")
+    elif re.fullmatch(r"\d{1,3}(?:\.\d{3})+", numero):
+        numero = numero.replace(".", "")
+    valor = float(numero)
+    if multiplicador:
+        valor *= 1000
+    return valor
+
+def _buscar_valor(padroes, texto):
+    for padrao in padroes:
+        encontrado = padrao.search(texto)
+        if encontrado:
+            return converter_numero(encontrado.group(1), encontrado.group(2))
+    return None
+
+def _quantidade_dependentes(palavra):
+    if palavra.isdigit():
+        return "3+" if int(palavra) >= 3 else palavra
+    return _PALAVRAS_NUMERO.get(palavra, "3+")
+
+class ExtratorEntrevista:
+    """
+    Extrator por regras, com padrões pré-compilados. `extrair` retorna
+    {campo: (valor, confianca)} e as flags de saída detectadas ("encerrar"/"voltar").
+    """
+    def __init__(self, limiar=LIMIAR_EXTRATOR):
+        self.limiar = limiar
+        self.turnos = 0
+        self.turnos_sem_llm = 0
+        self.campos_regras = 0
+        self.campos_llm = 0
+
+    def extrair(self, mensagem, faltando=CAMPOS_ENTREVISTA):
+        texto = remover_acentos(mensagem)
+        campos = {}
+
+        # Um valor explícito tem prioridade sobre "sem renda"/"sem despesas"
+        if (valor := _buscar_valor(_RE_RENDA, texto)) is not None:
+            campos["renda"] = (valor, 0.95)
+        elif _RE_SEM_RENDA.search(texto):
+            campos["renda"] = (0.0, 0.9)
+
+        if (valor := _buscar_valor(_RE_DESPESAS, texto)) is not None:
+            campos["despesas"] = (valor, 0.95)
+        elif _RE_SEM_DESPESAS.search(texto):
+            campos["despesas"] = (0.0, 0.9)
+
+        if _RE_DESEMPREGADO.search(texto):
+            campos["emprego"] = ("desempregado", 0.95)
+        elif _RE_AUTONOMO.search(texto):
+            campos["emprego"] = ("autônomo", 0.9)
+        elif _RE_FORMAL.search(texto):
+            campos["emprego"] = ("formal", 0.95)
+
+        if _RE_SEM_DEPENDENTES.search(texto):
+            campos["dependentes"] = ("0", 0.95)
+        else:
+            for padrao in _RE_DEPENDENTES:
+                encontrado = padrao.search(texto)
+                if encontrado:
+                    campos["dependentes"] = (_quantidade_dependentes(encontrado.group(1)), 0.95)
+                    break
+
+        if _RE_SEM_DIVIDAS.search(texto):
+            campos["dividas"] = ("não", 0.95)
+        elif encontrado := _RE_COM_DIVIDAS.search(texto):
+            if _RE_NEGACAO_ORACAO.search(texto[:encontrado.start()]):
+                # "não estou com dívidas", "nem tenho dívidas": provavelmente "não", mas confirma com o LLM
+                campos["dividas"] = ("não", 0.6)
+            else:
+                campos["dividas"] = ("sim", 0.9)
+
+        self._resposta_curta(texto, campos, faltando)
+        saida, incerta = detectar_saida(mensagem)
+        flags = {"encerrar": saida == "encerrar", "voltar": saida == "voltar", "saida_incerta": incerta}
+        return campos, flags
+
+    def _resposta_curta(self, texto, campos, faltando):
+        """
+        Resposta solta a uma pergunta de campo único ("5000", "sim", "2"): só é confiável
+        quando apenas um campo compatível está faltando.
+        """
+        pendentes = [c for c in faltando if c not in campos]
+        numeros = _RE_NUMERO.findall(texto)
+        numericos = [c for c in pendentes if c in ("renda", "despesas")]
+
+        if len(numeros) == 1 and not numericos and pendentes == ["dependentes"]:
+            valor = converter_numero(*numeros[0])
+            if valor.is_integer():
+                campos["dependentes"] = (_quantidade_dependentes(str(int(valor))), 0.85)
+        elif len(numeros) == 1 and numericos:
+            valor = converter_numero(*numeros[0])
+            # Um único valor monetário faltando: confiável. Mais de um: renda por eliminação, sem confiança
+            if len(numericos) == 1 and len(pendentes) == 1:
+                campos[numericos[0]] = (valor, 0.85)
+            elif "renda" in numericos and valor > 100:
+                campos["renda"] = (valor, 0.5)
+
+        if pendentes == ["dividas"]:
+            if _RE_SIM.match(texto):
+                campos["dividas"] = ("sim", 0.85)
+            elif _RE_NAO.match(texto):
+                campos["dividas"] = ("não", 0.85)
+
+    def separar(self, campos):
+        """
+        Divide a extração em (confiaveis {campo: valor}, fracos {campo: valor}) pelo limiar.
+        """
+        confiaveis = {c: v for c, (v, confianca) in campos.items() if confianca >= self.limiar}
+        fracos = {c: v for c, (v, confianca) in campos.items() if confianca < self.limiar}
+        return confiaveis, fracos
+
+    def registrar_turno(self, campos_regras, campos_llm, usou_llm):
+        self.turnos += 1
+        self.campos_regras += campos_regras
+        self.campos_llm += campos_llm
+        if not usou_llm:
+            self.turnos_sem_llm += 1
+
+    def estatisticas(self):
+        return {
+            "limiar": self.limiar,
+            "turnos": self.turnos,
+            "turnos_sem_llm": self.turnos_sem_llm,
+            "taxa_sem_llm": round(self.turnos_sem_llm / self.turnos, 4) if self.turnos else 0.0,
+            "campos_por_regras": self.campos_regras,
+            "campos_por_llm": self.campos_llm,
+        }
+
+def detectar_saida(mensagem):
+    """
+    Retorna (saida, incerta). `saida` ("encerrar"/"voltar") só sai das regras quando não há
+    negação, a palavra-chave não está em outro contexto ("sair do cheque especial", "voltar a
+    trabalhar") e a mensagem está perto dos exemplos de saída (limiar dos rótulos destrutivos).
+    Palavra-chave sem essa confiança: (None, True), e o LLM decide.
+    """
+    texto = normalizar_mensagem(mensagem)
+    if not (_RE_ENCERRAR.search(texto) or _RE_VOLTAR.search(texto)):
+        return None, False
+    if not tem_negacao(texto):
+        if pedido_de_saida(texto) and ROTEADOR_SAIDA.confirma(texto, "encerrar"):
+            return "encerrar", False
+        if pedido_de_volta(texto) and ROTEADOR_SAIDA.confirma(texto, "voltar"):
+            return "voltar", False
+    return None, True
+
+def intencao_saida(mensagem):
+    """
+    "encerrar", "voltar" ou None pelas palavras-chave, com as guardas de negação e contexto
+    (sem o limiar de similaridade). Usada pelos agentes quando o LLM não responde.
+    """
+    texto = normalizar_mensagem(mensagem)
+    if tem_negacao(texto):
+        return None
+    if pedido_de_saida(texto):
+        return "encerrar"
+    if pedido_de_volta(texto):
+        return "voltar"
+    return None
+
+def resposta_sim_nao(mensagem):
+    """
+    "sim", "nao" ou None para respostas a perguntas de sim/não ("quero sim", "agora não").
+    """
+    texto = remover_acentos(mensagem)
+    if _RE_RECUSA.search(texto):
+        return "nao"
+    if _RE_ACEITE.search(texto):
+        return "sim"
+    return None
+
+def normalizar_campo(campo, valor):
+    """
+    Converte o valor devolvido pelo LLM para o formato da sessão (None se inválido).
+    """
+    if valor is None:
+        return None
+    if campo in ("renda", "despesas"):
+        try:
+            return float(valor)
+        except (TypeError, ValueError):
+            return None
+    texto = remover_acentos(str(valor))
+    if campo == "emprego":
+        if "desempregado" in texto:
+            return "desempregado"
+        if "autonomo" in texto:
+            return "autônomo"
+        if "formal" in texto or "clt" in texto:
+            return "formal"
+        return None
+    if campo == "dependentes":
+        return texto if texto in ("0", "1", "2", "3+") else None
+    if campo == "dividas":
+        if "sim" in texto:
+            return "sim"
+        if "nao" in texto:
+            return "não"
+    return None
+
+EXTRATOR_ENTREVISTA = ExtratorEntrevista()
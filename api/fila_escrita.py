@@ -0,0 +1,104 @@
+import queue
+import time
+from threading import Thread, Lock
+
+# Fila de escrita em segundo plano (write-behind).
+# O endpoint apenas enfileira o registro; uma thread dedicada junta os registros em lotes
+# e chama `gravar_lote(lote)` uma vez por lote.
+
+_FIM = object() # Sentinela que pede para a thread esvaziar a fila e terminar
+
+class FilaEscrita:
+    """
+    Política de descarga:
+    - max_lote: grava assim que juntar este número de registros;
+    - intervalo: grava o que houver após este tempo (s) desde o primeiro registro do lote.
+    A durabilidade (ex: fsync por lote) fica a cargo da função `gravar_lote`.
+    """
+    def __init__(self, gravar_lote, max_lote=100, intervalo=1.0, nome="fila_escrita"):
+        self.gravar_lote = gravar_lote
+        self.max_lote = max_lote
+        self.intervalo = intervalo
+        self.nome = nome
+        self._fila = queue.Queue()
+        self._thread = None
+        self._lock = Lock()
+        self.enfileirados = 0
+        self.gravados = 0
+        self.lotes = 0
+        self.erros = 0
+
+    def _iniciar(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self._executar, name=self.nome, daemon=True)
+                self._thread.start()
+
+    def enfileirar(self, registro):
+        if self._thread is None or not self._thread.is_alive():
+            self._iniciar()
+        self._fila.put(registro)
+        self.enfileirados += 1
+
+    def _descarregar(self, lote):
+        try:
+            self.gravar_lote(lote)
+            self.gravados += len(lote)
+            self.lotes += 1
+        except Exception as e:
+            self.erros += 1
+            print(f"Erro ao gravar lote de {len(lote)} registros ({self.nome}): {e}")
+
+    def _executar(self):
+        encerrar = False
+        while not encerrar:
+            primeiro = self._fila.get()
+            if primeiro is _FIM:
+                break
+            lote = [primeiro]
+            prazo = time.monotonic() + self.intervalo
+            while len(lote) < self.max_lote:
+                restante = prazo - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    registro = self._fila.get(timeout=restante)
+                except queue.Empty:
+                    break
+                if registro is _FIM:
+                    encerrar = True
+                    break
+                lote.append(registro)
+            self._descarregar(lote)
+
+        # Drena o que ainda estiver pendente antes de sair
+        pendentes = []
+        while True:
+            try:
+                registro = self._fila.get_nowait()
+            except queue.Empty:
+                break
+            if registro is not _FIM:
+                pendentes.append(registro)
+        if pendentes:
+            self._descarregar(pendentes)
+
+    def encerrar(self, timeout=10.0):
+        """
+        Grava todos os registros pendentes e finaliza a thread (chamado no shutdown da API).
+        """
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._fila.put(_FIM)
+        self._thread.join(timeout)
+
+    def estatisticas(self):
+        return {
+            "pendentes": self._fila.qsize(),
+            "enfileirados": self.enfileirados,
+            "gravados": self.gravados,
+            "lotes": self.lotes,
+            "erros": self.erros,
+            "max_lote": self.max_lote,
+            "intervalo_segundos": self.intervalo,
+        }
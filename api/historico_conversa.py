@@ -0,0 +1,123 @@
+import os
+from dotenv import load_dotenv
+
+# Histórico da sessão com orçamento de tokens.
+# Mantém uma janela de mensagens recentes (limitada por quantidade e por tokens estimados);
+# o que sai da janela é condensado uma única vez num resumo curto, que acompanha a sessão.
+# O texto do prompt só é montado quando o LLM é chamado (sem cache: a sessão guarda só as mensagens).
+
+load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+JANELA_HISTORICO = int(os.getenv("HISTORICO_JANELA", "6")) # Mensagens mantidas na íntegra
+ORCAMENTO_TOKENS_HISTORICO = int(os.getenv("HISTORICO_ORCAMENTO_TOKENS", "250")) # Teto da janela no prompt
+MAX_TOKENS_MENSAGEM = int(os.getenv("HISTORICO_MAX_TOKENS_MENSAGEM", "80")) # Mensagens longas são truncadas no prompt
+MAX_TOKENS_RESUMO = int(os.getenv("HISTORICO_MAX_TOKENS_RESUMO", "60"))
+CARACTERES_POR_TOKEN = 4 # Estimativa sem tokenizador (texto em português)
+CARACTERES_TRECHO_RESUMO = 60
+
+def estimar_tokens(texto):
+    return (len(texto) + CARACTERES_POR_TOKEN - 1) // CARACTERES_POR_TOKEN
+
+def _rotulo(papel):
+    return "Usuário" if papel == "user" else "Agente"
+
+LIMITE_CARACTERES_MENSAGEM = MAX_TOKENS_MENSAGEM * CARACTERES_POR_TOKEN
+LIMITE_CARACTERES_RESUMO = MAX_TOKENS_RESUMO * CARACTERES_POR_TOKEN
+
+def tokens_mensagem(papel, conteudo):
+    """
+    Tokens estimados da linha de `renderizar_mensagem`, sem montar a linha.
+    """
+    limite = LIMITE_CARACTERES_MENSAGEM
+    tamanho = len(conteudo) if len(conteudo) <= limite else len(conteudo[:limite].rstrip()) + 1
+    return (len(_rotulo(papel)) + tamanho + 3 + CARACTERES_POR_TOKEN - 1) // CARACTERES_POR_TOKEN # ": " e "\n"
+
+def renderizar_mensagem(papel, conteudo):
+    """
+    Linha do prompt para uma mensagem, já truncada ao limite por mensagem.
+    """
+    limite = LIMITE_CARACTERES_MENSAGEM
+    if len(conteudo) > limite:
+        conteudo = conteudo[:limite].rstrip() + "…"
+    return f"{_rotulo(papel)}: {conteudo}\n"
+
+def resumir_mensagem(papel, conteudo):
+    """
+    Trecho do resumo para uma mensagem que saiu da janela: primeira linha, encurtada.
+    """
+    primeira_linha = conteudo.strip().splitlines()[0] if conteudo.strip() else ""
+    if len(primeira_linha) > CARACTERES_TRECHO_RESUMO:
+        primeira_linha = primeira_linha[:CARACTERES_TRECHO_RESUMO].rstrip() + "…"
+    return f"{_rotulo(papel)}: {primeira_linha}"
+
+class HistoricoConversa:
+    """
+    Janela de mensagens (papel, conteudo) + resumo das anteriores.
+    Guarda as próprias tuplas recebidas numa lista curta e um único total de tokens da janela
+    (a estimativa de cada mensagem é recalculada, em aritmética, quando ela sai da janela).
+    """
+    __slots__ = ("_mensagens", "resumo", "_tokens")
+
+    def __init__(self, mensagens=(), resumo=""):
+        self._mensagens = [] # [(papel, conteudo)]
+        self.resumo = resumo
+        self._tokens = 0
+        for papel, conteudo in mensagens:
+            self.append((papel, conteudo))
+
+    def append(self, mensagem):
+        papel, conteudo = mensagem
+        if not conteudo:
+            return # Mensagens vazias (transferências) não entram no prompt
+        mensagens = self._mensagens
+        mensagens.append(mensagem)
+        self._tokens += tokens_mensagem(papel, conteudo)
+        if len(mensagens) <= JANELA_HISTORICO and self._tokens <= ORCAMENTO_TOKENS_HISTORICO:
+            return
+
+        removidas = []
+        while len(mensagens) > JANELA_HISTORICO or (self._tokens > ORCAMENTO_TOKENS_HISTORICO and len(mensagens) > 1):
+            papel_antigo, conteudo_antigo = mensagens.pop(0)
+            self._tokens -= tokens_mensagem(papel_antigo, conteudo_antigo)
+            removidas.append(resumir_mensagem(papel_antigo, conteudo_antigo))
+        self._acrescentar_resumo(removidas)
+
+    def _acrescentar_resumo(self, trechos):
+        """
+        O resumo é rolante: novos trechos entram no fim e os mais antigos saem quando passa do limite.
+        """
+        resumo = " | ".join([self.resumo] + trechos if self.resumo else trechos)
+        limite = LIMITE_CARACTERES_RESUMO
+        if len(resumo) > limite:
+            # Corta no primeiro separador que deixa o resto dentro do limite (trechos inteiros)
+            corte = resumo.find(" | ", max(0, len(resumo) - limite - 3))
+            if corte < 0:
+                corte = resumo.rfind(" | ")
+            resumo = resumo[corte + 3 if corte >= 0 else 0:][-limite:]
+        self.resumo = resumo
+
+    def renderizar(self):
+        cabecalho = f"Resumo do início da conversa: {self.resumo}\n" if self.resumo else ""
+        limite = LIMITE_CARACTERES_MENSAGEM
+        return cabecalho + "".join([
+            f"{'Usuário' if papel == 'user' else 'Agente'}: {conteudo}\n" if len(conteudo) <= limite else renderizar_mensagem(papel, conteudo)
+            for papel, conteudo in self._mensagens
+        ])
+
+    def tokens_estimados(self):
+        return estimar_tokens(self.renderizar())
+
+    def __iter__(self):
+        return iter(self._mensagens)
+
+    def __len__(self):
+        return len(self._mensagens)
+
+    def para_dict(self):
+        return {"resumo": self.resumo, "mensagens": [list(mensagem) for mensagem in self._mensagens]}
+
+    @classmethod
+    def de_valor(cls, valor):
+        # Aceita o formato antigo (lista de pares) das sessões gravadas antes do resumo
+        if isinstance(valor, dict):
+            return cls(valor.get("mensagens", ()), valor.get("resumo", ""))
+        return cls(valor)
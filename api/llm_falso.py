@@ -0,0 +1,163 @@
+import asyncio
+import json
+import os
+import random
+import re
+import time
+from typing import Any, Dict, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import PrivateAttr
+from dotenv import load_dotenv
+from extrator_entrevista import EXTRATOR_ENTREVISTA, CAMPOS_ENTREVISTA, intencao_saida, resposta_sim_nao, remover_acentos
+from historico_conversa import estimar_tokens
+from roteador_intencoes import ROTEADOR_TRIAGEM, ROTEADOR_MENU_CREDITO
+
+# Modelo de chat determinístico que substitui o Ollama (LLM_BACKEND=falso).
+# Responde às instruções dos agentes com regras fixas (roteador por similaridade, extração por regras,
+# palavras-chave de moedas) e simula o custo de uma geração local: prefill por token do prompt,
+# tempo por token gerado, variação com semente fixa, slots paralelos limitados e erros opcionais.
+# Serve para medir a vazão da API sem GPU, sem rede e com resultados reproduzíveis.
+
+load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+
+_RE_MENSAGEM = re.compile(r'Mensagem do Usuário: "(.*)"\s*Sua Resposta:', re.DOTALL)
+_RE_SIGLA = re.compile(r"\b[A-Z]{3}\b")
+
+# Nome (sem acento) -> sigla, para as perguntas de câmbio
+MOEDAS_FALSAS = {
+    "dolar": "USD", "euro": "EUR", "libra": "GBP", "iene": "JPY", "yen": "JPY", "japao": "JPY",
+    "franco": "CHF", "yuan": "CNY", "peso": "ARS", "bitcoin": "BTC", "inglaterra": "GBP", "europa": "EUR",
+}
+
+def _rotulo_mais_proximo(roteador, mensagem, padrao):
+    # Sem passar por `classificar`/`palpite`, para não alterar as métricas do roteador
+    pontuacoes = roteador.pontuar_lote([mensagem])[0]
+    melhor = int(pontuacoes.argmax())
+    return roteador.rotulos[melhor] if pontuacoes[melhor] > 0 else padrao
+
+def responder_instrucao(instrucao, mensagem, esquema=None):
+    """
+    Resposta determinística para a instrução de cada agente/estado.
+    """
+    if "JSON" in instrucao:
+        campos = list((esquema or {}).get("properties", {})) or list(CAMPOS_ENTREVISTA) + ["encerrar", "voltar"]
+        extraidos, _ = EXTRATOR_ENTREVISTA.extrair(mensagem)
+        dados = {campo: extraidos[campo][0] if campo in extraidos else None for campo in campos if campo in CAMPOS_ENTREVISTA}
+        saida = intencao_saida(mensagem) # Sem o limiar: o "LLM" decide os casos ambíguos
+        dados.update({"encerrar": saida == "encerrar", "voltar": saida == "voltar"})
+        return json.dumps(dados, ensure_ascii=False)
+
+    if "classificador de intenções bancárias" in instrucao:
+        return _rotulo_mais_proximo(ROTEADOR_TRIAGEM, mensagem, "outros")
+    if "agente de crédito" in instrucao:
+        return _rotulo_mais_proximo(ROTEADOR_MENU_CREDITO, mensagem, "outros")
+    if "valor do limite desejado" in instrucao:
+        return intencao_saida(mensagem) or "continuar"
+    if "ofereceu uma entrevista" in instrucao:
+        return intencao_saida(mensagem) or resposta_sim_nao(mensagem) or "nao"
+    if "câmbio" in instrucao:
+        saida = intencao_saida(mensagem)
+        if saida:
+            return "SAIR" if saida == "encerrar" else "VOLTAR"
+        texto = remover_acentos(mensagem)
+        siglas = [codigo for nome, codigo in MOEDAS_FALSAS.items() if nome in texto] + _RE_SIGLA.findall(mensagem)
+        return ",".join(dict.fromkeys(siglas)) or "DESCONHECIDO"
+    return "Certo! Posso ajudar com crédito, cotação de moedas ou atualização cadastral."
+
+class ChatFalso(BaseChatModel):
+    """
+    Chat model do LangChain (aceita `.bind(format=..., options=...)`, `ainvoke`, `abatch` e `astream`
+    como o ChatOllama). `roteiro` ({trecho do prompt: resposta}) tem prioridade sobre as regras.
+    """
+    latencia_ms: float = 40.0 # Custo fixo por chamada
+    ms_prefill_token: float = 0.2
+    ms_por_token: float = 8.0
+    variacao: float = 0.2 # Fração de variação aleatória sobre o tempo total
+    paralelo: int = 4 # Gerações simultâneas, como o OLLAMA_NUM_PARALLEL
+    taxa_erro: float = 0.0
+    semente: int = 0
+    roteiro: Dict[str, str] = {}
+
+    _aleatorio: random.Random = PrivateAttr(default=None)
+    _slots: Optional[asyncio.Semaphore] = PrivateAttr(default=None)
+
+    def model_post_init(self, __context):
+        self._aleatorio = random.Random(self.semente)
+
+    @classmethod
+    def do_ambiente(cls):
+        roteiro = {}
+        if caminho := os.getenv("LLM_FALSO_ROTEIRO"):
+            with open(caminho, encoding="utf-8") as arquivo:
+                roteiro = json.load(arquivo)
+        return cls(
+            latencia_ms=float(os.getenv("LLM_FALSO_LATENCIA_MS", "40")),
+            ms_prefill_token=float(os.getenv("LLM_FALSO_MS_PREFILL_TOKEN", "0.2")),
+            ms_por_token=float(os.getenv("LLM_FALSO_MS_POR_TOKEN", "8")),
+            variacao=float(os.getenv("LLM_FALSO_VARIACAO", "0.2")),
+            paralelo=int(os.getenv("LLM_FALSO_PARALELO", "4")),
+            taxa_erro=float(os.getenv("LLM_FALSO_TAXA_ERRO", "0")),
+            semente=int(os.getenv("LLM_FALSO_SEMENTE", "0")),
+            roteiro=roteiro,
+        )
+
+    @property
+    def _llm_type(self):
+        return "chat-falso"
+
+    def _responder(self, messages, kwargs):
+        prompt = "\n".join(str(m.content) for m in messages)
+        for trecho, resposta in self.roteiro.items():
+            if trecho in prompt:
+                return prompt, resposta
+        instrucao = str(messages[0].content) if len(messages) > 1 else ""
+        encontrado = _RE_MENSAGEM.search(str(messages[-1].content))
+        mensagem = encontrado.group(1) if encontrado else str(messages[-1].content)
+        esquema = kwargs.get("format") if isinstance(kwargs.get("format"), dict) else None
+        return prompt, responder_instrucao(instrucao, mensagem, esquema)
+
+    def _gerar(self, messages, kwargs):
+        """
+        Monta o resultado e o tempo simulado (s). O sorteio acontece aqui, na ordem das chamadas.
+        """
+        if self._aleatorio.random() < self.taxa_erro:
+            raise ConnectionError("LLM falso: falha simulada")
+        prompt, texto = self._responder(messages, kwargs)
+        num_predict = (kwargs.get("options") or {}).get("num_predict")
+        tokens_prompt = estimar_tokens(prompt)
+        tokens_gerados = estimar_tokens(texto)
+        if num_predict:
+            tokens_gerados = min(tokens_gerados, num_predict)
+        prefill_ms = tokens_prompt * self.ms_prefill_token
+        geracao_ms = tokens_gerados * self.ms_por_token
+        fator = 1 + self._aleatorio.uniform(-self.variacao, self.variacao)
+        duracao = (self.latencia_ms + prefill_ms + geracao_ms) * fator / 1000
+
+        mensagem = AIMessage(
+            content=texto,
+            response_metadata={
+                "model": "chat-falso",
+                "done": True,
+                "prompt_eval_count": tokens_prompt,
+                "prompt_eval_duration": int(prefill_ms * fator * 1e6),
+                "eval_count": tokens_gerados,
+                "eval_duration": int(geracao_ms * fator * 1e6),
+            },
+            usage_metadata={"input_tokens": tokens_prompt, "output_tokens": tokens_gerados, "total_tokens": tokens_prompt + tokens_gerados},
+        )
+        return ChatResult(generations=[ChatGeneration(message=mensagem)]), duracao
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any):
+        resultado, duracao = self._gerar(messages, kwargs)
+        time.sleep(duracao)
+        return resultado
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.paralelo)
+        async with self._slots: # Acima de `paralelo` gerações, as demais esperam como no servidor real
+            resultado, duracao = self._gerar(messages, kwargs)
+            await asyncio.sleep(duracao)
+        return resultado
@@ -1,64 +1,447 @@
+import os
+import asyncio
+import functools
+import inspect
+import json
+import re
+from contextvars import ContextVar
 from langchain_ollama import ChatOllama
+from langchain_core.messages import SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
+from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.exceptions import OutputParserException
+from dotenv import load_dotenv
+from cache_classificacao import CacheClassificacao, normalizar_mensagem
+from agendador_llm import AgendadorLLM, SobrecargaLLM, PRIORIDADE_CLASSIFICACAO, PRIORIDADE_EXTRACAO
+from disjuntor_llm import DisjuntorLLM, LLMIndisponivel
+from estado_sessao import Agente
+from historico_conversa import HistoricoConversa, estimar_tokens
 
-def obter_llm():
-    return ChatOllama(
-        model="llama3.2",
-        temperature=0.0
-    )
+# Configuração do modelo local
+load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+MODELO_LLM = os.getenv("OLLAMA_MODELO", "llama3.2")
+URL_OLLAMA = os.getenv("OLLAMA_URL") # None usa o padrão do cliente (localhost:11434)
+KEEP_ALIVE_LLM = os.getenv("OLLAMA_KEEP_ALIVE", "30m") # Mantém o modelo carregado na memória entre turnos
+BACKEND_LLM = os.getenv("LLM_BACKEND", "ollama").lower() # ollama ou falso (modelo determinístico de llm_falso.py)
+TENTATIVAS_AQUECIMENTO = 5
+MAX_TOKENS_JSON = int(os.getenv("OLLAMA_MAX_TOKENS_JSON", "256")) # Limite de geração das extrações JSON
+TENTATIVAS_REPARO_JSON = int(os.getenv("OLLAMA_TENTATIVAS_REPARO_JSON", "1")) # Passadas extras pedindo ao modelo para corrigir o JSON
 
-def formatar_historico(historico):
-    historico_str = ""
-    if not historico:
-        return ""
-    for msg in historico[-6:]:
-        papel = "Usuário" if msg['role'] == 'user' else "Agente"
-        conteudo = msg.get('content', '')
-        if conteudo:
-            historico_str += f"{papel}: {conteudo}\n"
-    return historico_str
+# Cache de classificações repetidas ("quero ver meu limite", "tchau", ...)
+CACHE_CLASSIFICACAO = CacheClassificacao(
+    capacidade=int(os.getenv("CACHE_CLASSIFICACAO_CAPACIDADE", "2048")),
+    ttl=float(os.getenv("CACHE_CLASSIFICACAO_TTL", "3600"))
+)
 
-def consultar_llm(mensagem, historico, instrucao, formato="texto"):
-    """
-    Função global para consultar a Llama, passando a instrução e o histórico.
-    `formato` pode ser 'texto' (retorna string) ou 'json' (retorna um dicionário).
-    """
-    llm = obter_llm()
-    historico_str = formatar_historico(historico)
-    
-    template = """
-{instrucao}
+# Todas as gerações passam pelo agendador (concorrência limitada no Ollama, fila por prioridade)
+AGENDADOR_LLM = AgendadorLLM(
+    max_concorrencia=int(os.getenv("LLM_MAX_CONCORRENCIA", "4")),
+    max_lote=int(os.getenv("LLM_MAX_LOTE", "4")),
+    max_espera=float(os.getenv("LLM_MAX_ESPERA_FILA", "5")) # Acima disso a fila recusa novos pedidos
+)
+
+# Falha rápida quando o Ollama está fora ou lento: os agentes caem nas regras determinísticas
+DISJUNTOR_LLM = DisjuntorLLM(
+    falhas_para_abrir=int(os.getenv("LLM_DISJUNTOR_FALHAS", "5")),
+    tempo_aberto=float(os.getenv("LLM_DISJUNTOR_ESPERA", "15"))
+)
 
-IMPORTANTE: 
+# Prazo de cada chamada (fila + geração), em segundos, por agente e tipo de chamada.
+# Estouros contam como falha no disjuntor. Estados específicos podem passar `prazo=` ao consultar.
+PRAZO_PADRAO_LLM = {
+    "texto": float(os.getenv("LLM_PRAZO_CLASSIFICACAO", "10")),
+    "json": float(os.getenv("LLM_PRAZO_EXTRACAO", "20")),
+}
+PRAZOS_AGENTE_LLM = {
+    (Agente.TRIAGEM.value, "texto"): float(os.getenv("LLM_PRAZO_TRIAGEM", "6")), # O roteador por similaridade cobre a falha
+    (Agente.CREDITO.value, "texto"): float(os.getenv("LLM_PRAZO_CREDITO", "8")),
+    (Agente.CAMBIO.value, "texto"): float(os.getenv("LLM_PRAZO_CAMBIO", "8")),
+    (Agente.ENTREVISTA.value, "json"): float(os.getenv("LLM_PRAZO_ENTREVISTA", "20")),
+}
+
+def prazo_llm(agente, tipo):
+    return PRAZOS_AGENTE_LLM.get((agente, tipo), PRAZO_PADRAO_LLM[tipo])
+
+# Layout do prompt: prefixo fixo (mensagem de sistema) + parte variável (mensagem do usuário).
+# O prefixo tem a instrução do agente/estado e as regras de saída, e é idêntico byte a byte em todas
+# as chamadas do mesmo estado; o Ollama reaproveita o KV cache desse trecho em vez de reprocessá-lo.
+# Depois vem o histórico (que durante a sessão só cresce no fim) e, por último, a mensagem atual.
+REGRAS_CONSULTA = """IMPORTANTE:
 1. Se a mensagem atual revelar explicitamente a intenção do usuário de sair, encerrar, parar o atendimento, ou dizer que não quer mais falar com o banco, você DEVE retornar a intenção de 'encerrar'.
-2. Se a mensagem atual revelar explicitamente a intenção do usuário de voltar ao menu principal, ver as opções novamente, trocar de assunto, ou falar com a triagem, você DEVE retornar a intenção de 'voltar'.
+2. Se a mensagem atual revelar explicitamente a intenção do usuário de voltar ao menu principal, ver as opções novamente, trocar de assunto, ou falar com a triagem, você DEVE retornar a intenção de 'voltar'."""
 
-Histórico recente:
+TEMPLATE_TURNO = """Histórico recente:
 ---
 {historico}
 ---
 
 Mensagem do Usuário: "{mensagem}"
 
-Sua Resposta:
+Sua Resposta:"""
+TOKENS_TEMPLATE_TURNO = estimar_tokens(TEMPLATE_TURNO)
+
+# Agente que está executando o turno (definido pelo orquestrador), usado nas métricas por agente
+_AGENTE_LLM = ContextVar("agente_llm", default=None)
+
+def definir_agente_llm(agente):
+    return _AGENTE_LLM.set(agente)
+
+def restaurar_agente_llm(token):
+    _AGENTE_LLM.reset(token)
+
+def agente_llm():
+    agente = _AGENTE_LLM.get()
+    return getattr(agente, "value", agente) or "sem_agente"
+
+@functools.lru_cache(maxsize=None)
+def prefixo_estavel(instrucao):
     """
-    
-    prompt = ChatPromptTemplate.from_template(template)
+    Parte fixa do prompt: a instrução sem a indentação dos literais dos routers, seguida das
+    regras de saída. Montada uma vez por agente/estado.
+    """
+    return inspect.cleandoc(instrucao) + "\n\n" + REGRAS_CONSULTA
+
+# Cliente único do Ollama (mantém o pool HTTP do httpx vivo entre as requisições)
+_LLM = None
+# Registro de chains já compiladas: {(instrucao, formato): chain}
+_CHAINS = {}
+_MODELO_PRONTO = False
+
+def obter_llm():
+    global _LLM
+    if _LLM is None and BACKEND_LLM == "falso":
+        from llm_falso import ChatFalso # Testes de carga sem Ollama
+        _LLM = ChatFalso.do_ambiente()
+    elif _LLM is None:
+        _LLM = ChatOllama(
+            model=MODELO_LLM,
+            temperature=0.0,
+            base_url=URL_OLLAMA,
+            keep_alive=KEEP_ALIVE_LLM
+        )
+    return _LLM
+
+def obter_chain(instrucao, formato="texto", esquema=None):
+    """
+    Retorna a chain da instrução, compilando-a apenas na primeira vez.
+    As instruções dos agentes são literais fixos, então o registro é limitado pelo número de estados.
+    `formato`: 'texto' (classificação) ou 'json' (extração).
+    Em 'texto' e 'json' a chain devolve a AIMessage (o parse fica no `consultar_llm`, que também
+    lê a contagem de tokens). Em 'json' o Ollama decodifica restrito ao `esquema` (JSON Schema)
+    ou, sem esquema, em modo JSON, sempre com `num_predict` limitado.
+    """
+    chave = (instrucao, formato, json.dumps(esquema, sort_keys=True) if esquema is not None else None)
+    chain = _CHAINS.get(chave)
+    if chain is None:
+        # SystemMessage literal: o prefixo não passa pela formatação do template
+        prompt = ChatPromptTemplate.from_messages([
+            SystemMessage(content=prefixo_estavel(instrucao)),
+            ("human", TEMPLATE_TURNO),
+        ])
+        if formato == "json":
+            llm = obter_llm().bind(
+                format=esquema if esquema is not None else "json",
+                options={"temperature": 0.0, "num_predict": MAX_TOKENS_JSON}
+            )
+            chain = prompt | llm
+        else:
+            chain = prompt | obter_llm()
+        _CHAINS[chave] = chain
+    return chain
+
+def modelo_pronto():
+    return _MODELO_PRONTO
+
+async def aquecer_modelo():
+    """
+    Carrega o modelo no Ollama antes do primeiro cliente (geração de 1 token com keep_alive).
+    Só marca o serviço como pronto depois que o modelo respondeu.
+    """
+    global _MODELO_PRONTO
+    espera = 1
+    for tentativa in range(1, TENTATIVAS_AQUECIMENTO + 1):
+        try:
+            await obter_llm().ainvoke("ok", options={"num_predict": 1, "temperature": 0.0})
+            _MODELO_PRONTO = True
+            print(f"Modelo {MODELO_LLM} aquecido e pronto.")
+            return True
+        except Exception as e:
+            print(f"Falha ao aquecer o modelo (tentativa {tentativa}/{TENTATIVAS_AQUECIMENTO}): {e}")
+            await asyncio.sleep(espera)
+            espera = min(espera * 2, 30)
+    return False
+
+def formatar_historico(historico):
+    """
+    Texto do histórico para o prompt. O HistoricoConversa da sessão já mantém a janela dentro
+    do orçamento de tokens e monta o texto a cada chamada; listas avulsas são convertidas na hora.
+    """
+    if historico is None:
+        return ""
+    if not isinstance(historico, HistoricoConversa):
+        historico = HistoricoConversa(historico)
+    return historico.renderizar()
+
+class MetricasLLM:
+    """
+    Falhas de parse das respostas JSON (e como foram resolvidas) e tokens gerados por chamada.
+    """
+    def __init__(self):
+        self.chamadas = {"texto": 0, "json": 0}
+        self.falhas_parse = 0
+        self.reparos_locais = 0
+        self.reparos_llm = 0
+        self.falhas_finais = 0
+        self.prazos_estourados = 0
+        self.tokens_gerados = {"texto": 0, "json": 0}
+        self.chamadas_com_tokens = {"texto": 0, "json": 0}
+        self.max_tokens = {"texto": 0, "json": 0}
+        self.chamadas_prompt = 0
+        self.tokens_prompt = 0
+        self.max_tokens_prompt = 0
+        self.tokens_historico = 0
+        self.max_tokens_historico = 0
+
+    def registrar_prompt(self, resposta, historico_str):
+        # Tokens de entrada informados pelo backend e estimativa da parte do histórico
+        self.chamadas_prompt += 1
+        tokens_historico = estimar_tokens(historico_str)
+        self.tokens_historico += tokens_historico
+        self.max_tokens_historico = max(self.max_tokens_historico, tokens_historico)
+        uso = getattr(resposta, "usage_metadata", None)
+        if uso and uso.get("input_tokens") is not None:
+            self.tokens_prompt += uso["input_tokens"]
+            self.max_tokens_prompt = max(self.max_tokens_prompt, uso["input_tokens"])
+
+    def registrar_tokens(self, formato, resposta):
+        tokens = contar_tokens_gerados(resposta)
+        if tokens is None:
+            return
+        self.tokens_gerados[formato] += tokens
+        self.chamadas_com_tokens[formato] += 1
+        self.max_tokens[formato] = max(self.max_tokens[formato], tokens)
+
+    def estatisticas(self):
+        json_total = self.chamadas["json"]
+        return {
+            "chamadas": dict(self.chamadas),
+            "prazos_estourados": self.prazos_estourados,
+            "json": {
+                "falhas_parse": self.falhas_parse,
+                "taxa_falha_parse": round(self.falhas_parse / json_total, 4) if json_total else 0.0,
+                "reparos_locais": self.reparos_locais,
+                "reparos_llm": self.reparos_llm,
+                "falhas_finais": self.falhas_finais,
+                "taxa_falha_final": round(self.falhas_finais / json_total, 4) if json_total else 0.0,
+            },
+            "tokens_por_chamada": {
+                formato: {
+                    "media": round(self.tokens_gerados[formato] / n, 1) if (n := self.chamadas_com_tokens[formato]) else 0.0,
+                    "max": self.max_tokens[formato],
+                    "total": self.tokens_gerados[formato],
+                }
+                for formato in ("texto", "json")
+            },
+            "tokens_prompt": {
+                "media": round(self.tokens_prompt / self.chamadas_prompt, 1) if self.chamadas_prompt else 0.0,
+                "max": self.max_tokens_prompt,
+                "media_historico_estimada": round(self.tokens_historico / self.chamadas_prompt, 1) if self.chamadas_prompt else 0.0,
+                "max_historico_estimado": self.max_tokens_historico,
+            },
+        }
+
+METRICAS_LLM = MetricasLLM()
+
+class MetricasPrefill:
+    """
+    Prefill (processamento do prompt) por agente, com os tempos devolvidos pelo Ollama.
+    O `prompt_eval_count` conta só os tokens processados de fato: o que falta para o tamanho
+    estimado do prompt veio do cache de prefixo, e o ganho é estimado pelo custo médio por token.
+    """
+    def __init__(self):
+        self._agentes = {}
+
+    def registrar(self, agente, resposta, tokens_prompt):
+        dados = getattr(resposta, "response_metadata", None) or {}
+        processados = dados.get("prompt_eval_count")
+        duracao = dados.get("prompt_eval_duration")
+        if processados is None or duracao is None:
+            return
+        m = self._agentes.setdefault(agente, {"chamadas": 0, "tokens_prompt": 0, "tokens_processados": 0, "prefill_ns": 0, "max_prefill_ns": 0})
+        m["chamadas"] += 1
+        m["tokens_prompt"] += tokens_prompt
+        m["tokens_processados"] += processados
+        m["prefill_ns"] += duracao
+        m["max_prefill_ns"] = max(m["max_prefill_ns"], duracao)
+
+    def estatisticas(self):
+        resultado = {}
+        for agente, m in self._agentes.items():
+            n = m["chamadas"]
+            ns_por_token = m["prefill_ns"] / m["tokens_processados"] if m["tokens_processados"] else 0.0
+            reaproveitados = max(0, m["tokens_prompt"] - m["tokens_processados"])
+            resultado[agente] = {
+                "chamadas": n,
+                "prefill_medio_ms": round(m["prefill_ns"] / n / 1e6, 2),
+                "prefill_max_ms": round(m["max_prefill_ns"] / 1e6, 2),
+                "tokens_prompt_medio_estimado": round(m["tokens_prompt"] / n, 1),
+                "tokens_processados_medio": round(m["tokens_processados"] / n, 1),
+                "taxa_reuso_prefixo_estimada": round(reaproveitados / m["tokens_prompt"], 4) if m["tokens_prompt"] else 0.0,
+                "prefill_economizado_ms_por_turno_estimado": round(reaproveitados / n * ns_por_token / 1e6, 2),
+            }
+        return resultado
+
+METRICAS_PREFILL = MetricasPrefill()
+
+def estimar_tokens_prompt(instrucao, historico_str, mensagem):
+    return estimar_tokens(prefixo_estavel(instrucao)) + TOKENS_TEMPLATE_TURNO + estimar_tokens(historico_str) + estimar_tokens(mensagem)
+
+def contar_tokens_gerados(resposta):
+    uso = getattr(resposta, "usage_metadata", None)
+    if uso and uso.get("output_tokens") is not None:
+        return uso["output_tokens"]
+    return (getattr(resposta, "response_metadata", None) or {}).get("eval_count")
+
+_PARSER_JSON = JsonOutputParser()
+_RE_OBJETO_JSON = re.compile(r"\{.*\}", re.DOTALL)
+_RE_VIRGULA_FINAL = re.compile(r",\s*([}\]])")
+_RE_LITERAIS_PYTHON = re.compile(r"\b(True|False|None)\b")
+
+def reparar_json(texto):
+    """
+    Reparo local barato: recorta o objeto {...}, remove vírgulas sobrando e troca literais do Python.
+    Retorna o dicionário ou None.
+    """
+    encontrado = _RE_OBJETO_JSON.search(texto)
+    if not encontrado:
+        return None
+    candidato = _RE_VIRGULA_FINAL.sub(r"\1", encontrado.group(0))
+    candidato = _RE_LITERAIS_PYTHON.sub(lambda m: {"True": "true", "False": "false", "None": "null"}[m.group(1)], candidato)
+    for tentativa in (candidato, candidato.replace("'", '"')):
+        try:
+            dados = json.loads(tentativa)
+            return dados if isinstance(dados, dict) else None
+        except ValueError:
+            continue
+    return None
+
+INSTRUCAO_REPARO_JSON = """
+Corrija o texto abaixo para que seja um único objeto JSON válido, mantendo os mesmos campos e valores.
+Responda APENAS com o JSON corrigido.
+"""
+
+async def _interpretar_json(texto, esquema):
+    try:
+        dados = _PARSER_JSON.parse(texto)
+        if isinstance(dados, dict):
+            return dados
+    except OutputParserException:
+        pass
+    METRICAS_LLM.falhas_parse += 1
+
+    dados = reparar_json(texto)
+    if dados is not None:
+        METRICAS_LLM.reparos_locais += 1
+        return dados
+
+    # Passadas limitadas pedindo ao próprio modelo (com decodificação restrita) para corrigir a saída
+    for _ in range(TENTATIVAS_REPARO_JSON):
+        resposta = await _chamar_modelo(INSTRUCAO_REPARO_JSON, "json", esquema, "", texto)
+        texto = getattr(resposta, "content", resposta)
+        dados = reparar_json(texto)
+        if dados is not None:
+            METRICAS_LLM.reparos_llm += 1
+            return dados
+    return None
+
+async def _chamar_modelo(instrucao, formato, esquema, historico_str, mensagem, prazo=None):
+    """
+    Uma geração pelo agendador, dentro do prazo do agente e passando pelo disjuntor.
+    Pedidos idênticos em andamento (mesma chain, histórico e mensagem) são coalescidos, e as
+    métricas do prompt contam uma vez por chamada real ao modelo.
+    Classificações curtas têm prioridade sobre extrações JSON e podem sair em micro-lote.
+    """
+    chain = obter_chain(instrucao, formato, esquema)
+    entrada = {"historico": historico_str, "mensagem": mensagem}
+    tipo = "json" if formato == "json" else "texto"
+    agente = agente_llm()
+    prazo = prazo if prazo is not None else prazo_llm(agente, tipo)
+
+    async def gerar():
+        sonda = DISJUNTOR_LLM.admitir()
+        sucesso = None
+        try:
+            if tipo == "json":
+                chamada = AGENDADOR_LLM.executar(chain, entrada, PRIORIDADE_EXTRACAO)
+            else:
+                chamada = AGENDADOR_LLM.executar(chain, entrada, PRIORIDADE_CLASSIFICACAO, agrupavel=True)
+            resposta = await asyncio.wait_for(chamada, prazo)
+            sucesso = True
+        except SobrecargaLLM:
+            raise # Recusa da própria fila: não diz nada sobre a saúde do Ollama
+        except asyncio.TimeoutError:
+            sucesso = False
+            METRICAS_LLM.prazos_estourados += 1
+            raise LLMIndisponivel(f"prazo de {prazo:.1f}s estourado ({agente}, {tipo})")
+        except Exception:
+            sucesso = False
+            raise
+        finally:
+            DISJUNTOR_LLM.registrar(sucesso, sonda)
+        METRICAS_LLM.registrar_prompt(resposta, historico_str)
+        METRICAS_LLM.registrar_tokens(tipo, resposta)
+        METRICAS_PREFILL.registrar(agente, resposta, estimar_tokens_prompt(instrucao, historico_str, mensagem))
+        return resposta
+
+    return await AGENDADOR_LLM.coalescer((id(chain), historico_str, mensagem), gerar)
+
+async def consultar_llm(mensagem, historico, instrucao, formato="texto", esquema=None, prazo=None):
+    """
+    Função global para consultar a Llama, passando a instrução e o histórico.
+    `formato` pode ser 'texto' (retorna string) ou 'json' (retorna um dicionário).
+    Em 'json', `esquema` (JSON Schema) restringe a decodificação no Ollama; se mesmo assim o parse
+    falhar, há um reparo local e até TENTATIVAS_REPARO_JSON passadas de reparo pelo modelo.
+    Usa o `ainvoke` da chain (via AGENDADOR_LLM) para não bloquear o event loop do uvicorn.
+    """
+    historico_str = formatar_historico(historico)
+    METRICAS_LLM.chamadas["json" if formato == "json" else "texto"] += 1
     
     if formato == "json":
-        parser = JsonOutputParser()
-        chain = prompt | llm | parser
         try:
-            return chain.invoke({"instrucao": instrucao, "historico": historico_str, "mensagem": mensagem})
+            resposta = await _chamar_modelo(instrucao, formato, esquema, historico_str, mensagem, prazo)
         except Exception as e:
-            print(f"Falha de parse JSON LLM: {e}")
+            print(f"Erro de conexão com LLM (JSON): {e}")
             return {"erro_llm": True}
+        try:
+            dados = await _interpretar_json(getattr(resposta, "content", resposta), esquema)
+        except Exception as e:
+            print(f"Erro de conexão com LLM no reparo do JSON: {e}")
+            dados = None
+        if dados is None:
+            METRICAS_LLM.falhas_finais += 1
+            print("Falha de parse JSON LLM após reparo.")
+            return {"erro_llm": True}
+        return dados
     else:
-        chain = prompt | llm | StrOutputParser()
         try:
-            return chain.invoke({"instrucao": instrucao, "historico": historico_str, "mensagem": mensagem}).strip().lower()
+            resposta = await _chamar_modelo(instrucao, formato, esquema, historico_str, mensagem, prazo)
+            return getattr(resposta, "content", resposta).strip().lower()
         except Exception as e:
             print(f"Erro de conexão com LLM: {e}")
             return "erro_llm"
 
+async def classificar_llm(mensagem, historico, instrucao, prazo=None):
+    """
+    Igual ao `consultar_llm` em formato texto, mas reaproveita o resultado de mensagens
+    equivalentes (mesma instrução e mesmo texto normalizado). Falhas do LLM não são guardadas.
+    """
+    resultado = CACHE_CLASSIFICACAO.obter(instrucao, mensagem)
+    if resultado is not None:
+        return resultado
+
+    # Mensagens equivalentes chegando juntas (antes de o cache ter o resultado) viram uma única chamada
+    chave = ("classificacao", instrucao, normalizar_mensagem(mensagem))
+    resultado = await AGENDADOR_LLM.coalescer(chave, lambda: consultar_llm(mensagem, historico, instrucao, prazo=prazo))
+    if "erro_llm" not in resultado:
+        CACHE_CLASSIFICACAO.guardar(instrucao, mensagem, resultado)
+    return resultado
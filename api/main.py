@@ -1,9 +1,32 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+import asyncio
+import time
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from routers import triagem, credito, entrevista, cambio
+from routers import triagem, credito, entrevista, cambio, conversa
+import llm_service
+import roteador_intencoes
+import sessao
+import transmissao
+import extrator_entrevista
 import uvicorn
 
-app = FastAPI(title="Banco Ágil - Agente de Triagem")
+@asynccontextmanager
+async def ciclo_de_vida(app: FastAPI):
+    # Aquece o modelo em segundo plano: a API sobe, mas só fica "pronta" após o primeiro token
+    tarefa_aquecimento = asyncio.create_task(llm_service.aquecer_modelo())
+    tarefa_varredura = asyncio.create_task(sessao.varredor_sessoes())
+    tarefa_cotacoes = asyncio.create_task(cambio.pre_carregador_cotacoes())
+    yield
+    tarefa_aquecimento.cancel()
+    tarefa_varredura.cancel()
+    tarefa_cotacoes.cancel()
+    # Grava as solicitações de limite ainda pendentes na fila de escrita
+    await asyncio.to_thread(credito.FILA_SOLICITACOES.encerrar)
+    await cambio.CLIENTE_COTACOES.fechar()
+
+app = FastAPI(title="Banco Ágil - Agente de Triagem", lifespan=ciclo_de_vida)
 
 # Configurar CORS (mantido)
 app.add_middleware(
@@ -14,10 +37,63 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Endpoints HTTP dos agentes (sem streaming): o primeiro byte só sai com o turno completo
+ROTAS_AGENTES = ("/triagem/", "/credito/", "/entrevista/", "/cambio/")
+
+@app.middleware("http")
+async def medir_ttfb_agentes(request: Request, call_next):
+    if request.url.path not in ROTAS_AGENTES:
+        return await call_next(request)
+    inicio = time.perf_counter()
+    resposta = await call_next(request)
+    transmissao.TTFB_HTTP.medir_desde(inicio)
+    return resposta
+
+@app.exception_handler(sessao.ConflitoSessao)
+async def conflito_sessao(request: Request, erro: sessao.ConflitoSessao):
+    # Outro worker gravou a mesma sessão durante este turno: o cliente reenvia a mensagem
+    print(f"Conflito de sessão: {erro}")
+    return JSONResponse(status_code=409, content={"detail": str(erro), "id_sessao": erro.id_sessao})
+
 app.include_router(triagem.router)
 app.include_router(credito.router)
 app.include_router(entrevista.router)
 app.include_router(cambio.router)
+app.include_router(conversa.router)
+
+@app.get("/saude", tags=["Saúde"])
+async def saude():
+    return {"status": "ok"}
+
+@app.get("/saude/pronto", tags=["Saúde"])
+async def saude_pronto():
+    if not llm_service.modelo_pronto():
+        return JSONResponse(status_code=503, content={"status": "aquecendo", "modelo": llm_service.MODELO_LLM})
+    return {"status": "pronto", "modelo": llm_service.MODELO_LLM}
+
+@app.get("/metricas", tags=["Saúde"])
+async def metricas():
+    return {
+        "cache_classificacao": llm_service.CACHE_CLASSIFICACAO.estatisticas(),
+        "llm": llm_service.METRICAS_LLM.estatisticas(),
+        "prefill_llm": llm_service.METRICAS_PREFILL.estatisticas(),
+        "agendador_llm": llm_service.AGENDADOR_LLM.estatisticas(),
+        "disjuntor_llm": llm_service.DISJUNTOR_LLM.estatisticas(),
+        "roteador_triagem": roteador_intencoes.ROTEADOR_TRIAGEM.estatisticas(),
+        "roteador_menu_credito": roteador_intencoes.ROTEADOR_MENU_CREDITO.estatisticas(),
+        "fila_solicitacoes": credito.FILA_SOLICITACOES.estatisticas(),
+        "sessoes": sessao.SESSOES.estatisticas(),
+        "travas_sessao": sessao.TRAVAS_SESSOES.estatisticas(),
+        "cache_cotacoes": cambio.CACHE_COTACOES.estatisticas(),
+        "cliente_cotacoes": cambio.CLIENTE_COTACOES.estatisticas(),
+        "conexoes_conversa": conversa.CONEXOES.estatisticas(),
+        "extrator_entrevista": extrator_entrevista.EXTRATOR_ENTREVISTA.estatisticas(),
+        "ttfb": {
+            "http": transmissao.TTFB_HTTP.estatisticas(),
+            "websocket": transmissao.TTFB_WEBSOCKET.estatisticas(),
+            "sse": transmissao.TTFB_SSE.estatisticas()
+        }
+    }
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True, reload_excludes=["data/*", "*.csv", "data/**/*"])
@@ -0,0 +1,92 @@
+import functools
+import inspect
+import os
+from dotenv import load_dotenv
+from sessao import obter_sessao, turno_de_sessao
+from estado_sessao import Agente, EstadoTriagem
+from transmissao import emitir_mensagem
+from llm_service import definir_agente_llm, restaurar_agente_llm
+
+# Registro dos agentes e encadeamento de transferências no servidor.
+# Com `encadear=True` na entrada, quando um agente responde acao="transferir" o turno de abertura
+# do agente de destino roda na mesma requisição (e com a mesma trava/sessão carregada),
+# e a resposta traz as mensagens combinadas e o agente final. Sem a flag, o protocolo antigo
+# (o front faz um segundo POST com mensagem vazia) continua igual.
+
+load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+MAX_ENCADEAMENTOS = int(os.getenv("MAX_ENCADEAMENTOS", "3")) # Evita ciclos triagem -> crédito -> triagem...
+
+AGENTES = {} # {Agente: (endpoint com encadeamento, sem trava; modelo de entrada)}
+
+def agente(nome):
+    """
+    Decorador que registra o endpoint do agente e acrescenta o encadeamento.
+    Deve ficar abaixo de @turno_de_sessao: a cadeia inteira roda dentro de um único turno.
+    """
+    nome = Agente(nome)
+
+    def decorar(endpoint):
+        modelo_entrada = next(iter(inspect.signature(endpoint).parameters.values())).annotation
+
+        @functools.wraps(endpoint)
+        async def executar(entrada, *args, **kwargs):
+            token = definir_agente_llm(nome) # Chamadas ao LLM deste turno contam para o agente
+            try:
+                saida = await endpoint(entrada, *args, **kwargs)
+            finally:
+                restaurar_agente_llm(token)
+            emitir_mensagem(saida.resposta)
+            agente_final = _registrar_agente(entrada.id_sessao, nome, saida)
+            mensagens = [saida.resposta] if saida.resposta.strip() else []
+
+            if getattr(entrada, "encadear", False):
+                for _ in range(MAX_ENCADEAMENTOS):
+                    if saida.acao != "transferir" or saida.alvo not in AGENTES:
+                        break
+                    endpoint_alvo, modelo_alvo = AGENTES[Agente(saida.alvo)]
+                    saida = await endpoint_alvo(modelo_alvo(id_sessao=entrada.id_sessao, mensagem=""))
+                    agente_final = Agente(saida.agente_final)
+                    mensagens.extend(saida.mensagens)
+                saida = saida.model_copy(update={"resposta": "\n\n".join(mensagens)})
+
+            return saida.model_copy(update={"mensagens": mensagens, "agente_final": agente_final.value})
+
+        AGENTES[nome] = (executar, modelo_entrada)
+        return executar
+    return decorar
+
+def _registrar_agente(id_sessao, agente_atual, saida):
+    """
+    Agente que atende o próximo turno (o destino, se houve transferência), guardado na sessão.
+    """
+    if saida.acao == "transferir" and saida.alvo in AGENTES:
+        agente_atual = Agente(saida.alvo)
+    sessao = obter_sessao(id_sessao)
+    if sessao is not None:
+        sessao.agente_atual = agente_atual
+    return agente_atual
+
+class EntradaTurno:
+    """
+    Entrada mínima para turnos que não chegam por um endpoint HTTP (ex: WebSocket).
+    """
+    __slots__ = ("id_sessao", "mensagem")
+
+    def __init__(self, id_sessao, mensagem):
+        self.id_sessao = id_sessao
+        self.mensagem = mensagem
+
+@turno_de_sessao
+async def _turno_roteado(entrada):
+    sessao = obter_sessao(entrada.id_sessao)
+    # Sessão nova ou encerrada: a triagem responde (saudação ou "atendimento encerrado")
+    nome = Agente.TRIAGEM if sessao is None or sessao.estado is EstadoTriagem.ENCERRADO else sessao.agente_atual
+    endpoint, modelo_entrada = AGENTES[nome]
+    return await endpoint(modelo_entrada(id_sessao=entrada.id_sessao, mensagem=entrada.mensagem, encadear=True))
+
+async def executar_turno(id_sessao, mensagem):
+    """
+    Roteamento no servidor: a mensagem vai para o agente_atual da sessão (triagem se ainda não existe),
+    com as transferências encadeadas. Usa a mesma trava e o mesmo carregamento de sessão dos endpoints.
+    """
+    return await _turno_roteado(EntradaTurno(id_sessao, mensagem))
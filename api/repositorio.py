@@ -0,0 +1,240 @@
+import asyncio
+import csv
+import io
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from dotenv import load_dotenv
+from armazem_clientes import ARMAZEM_CLIENTES, limpar_cpf
+from tabela_score import TABELA_SCORE, validar_faixas
+
+# Repositório de dados dos agentes (clientes, faixas de score e solicitações de limite).
+# O backend é escolhido por BACKEND_DADOS: "csv" (padrão, arquivos em data/) ou "sqlite" (WAL).
+
+load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+PASTA_DADOS = os.path.join(os.path.dirname(__file__), "data")
+ARQUIVO_CLIENTES = os.path.join(PASTA_DADOS, "clientes.csv")
+ARQUIVO_SCORE_LIMITE = os.path.join(PASTA_DADOS, "score_limite.csv")
+ARQUIVO_SOLICITACOES = os.path.join(PASTA_DADOS, "solicitacoes_aumento_limite.csv")
+COLUNAS_SOLICITACOES = ["cpf_cliente", "data_hora_solicitacao", "limite_atual", "novo_limite_solicitado", "status_pedido"]
+
+BACKEND_DADOS = os.getenv("BACKEND_DADOS", "csv").lower()
+ARQUIVO_SQLITE = os.getenv("ARQUIVO_SQLITE", os.path.join(PASTA_DADOS, "banco_agil.db"))
+FSYNC_SOLICITACOES = os.getenv("FILA_SOLICITACOES_FSYNC", "false").lower() in ["1", "true", "sim"]
+
+class RepositorioDados(ABC):
+    """
+    Interface comum dos backends. Os registros de cliente seguem o formato do CSV
+    (valores em string: cpf, data_nascimento, nome, score, limite_credito).
+    Os métodos são síncronos; os routers consultam via `ler` e gravam via asyncio.to_thread.
+    """
+    @abstractmethod
+    def obter_cliente(self, cpf):
+        ...
+
+    @abstractmethod
+    def atualizar_score(self, cpf, novo_score):
+        ...
+
+    @abstractmethod
+    def limite_maximo(self, score):
+        ...
+
+    @abstractmethod
+    def registrar_solicitacoes(self, lote):
+        ...
+
+    async def ler(self, metodo, *args):
+        """
+        Leitura chamada do event loop (ex: `await REPOSITORIO.ler(REPOSITORIO.obter_cliente, cpf)`),
+        executada numa thread para não parar o loop enquanto o backend vai ao banco.
+        """
+        return await asyncio.to_thread(metodo, *args)
+
+class RepositorioCSV(RepositorioDados):
+    """
+    Backend original em arquivos CSV, servido pelos índices em memória.
+    """
+    def __init__(self, fsync=False):
+        self.fsync = fsync
+
+    async def ler(self, metodo, *args):
+        """
+        A consulta sai do índice em memória; só a recarga de um CSV alterado vai para uma thread,
+        e o índice novo entra por troca de referência (leituras concorrentes seguem no antigo).
+        """
+        for fonte in (ARMAZEM_CLIENTES, TABELA_SCORE):
+            if fonte.precisa_recarregar():
+                await asyncio.to_thread(fonte.recarregar)
+        return metodo(*args)
+
+    def obter_cliente(self, cpf):
+        return ARMAZEM_CLIENTES.obter(cpf)
+
+    def atualizar_score(self, cpf, novo_score):
+        return ARMAZEM_CLIENTES.atualizar_score(cpf, novo_score)
+
+    def limite_maximo(self, score):
+        return TABELA_SCORE.limite_maximo(score)
+
+    def registrar_solicitacoes(self, lote):
+        # Uma única escrita bufferizada por lote
+        buffer = io.StringIO()
+        escritor = csv.DictWriter(buffer, fieldnames=COLUNAS_SOLICITACOES, lineterminator="\n")
+        if not os.path.exists(ARQUIVO_SOLICITACOES):
+            escritor.writeheader()
+        escritor.writerows(lote)
+
+        with open(ARQUIVO_SOLICITACOES, "a", newline="", encoding="utf-8") as arquivo:
+            arquivo.write(buffer.getvalue())
+            if self.fsync:
+                arquivo.flush()
+                os.fsync(arquivo.fileno())
+
+ESQUEMA_SQLITE = """
+CREATE TABLE IF NOT EXISTS clientes (
+    cpf_limpo TEXT PRIMARY KEY,
+    cpf TEXT NOT NULL,
+    data_nascimento TEXT NOT NULL,
+    nome TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    limite_credito TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS faixas_score (
+    min_score INTEGER PRIMARY KEY,
+    max_score INTEGER NOT NULL,
+    limite_maximo REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS solicitacoes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    cpf_cliente TEXT NOT NULL,
+    data_hora_solicitacao TEXT NOT NULL,
+    limite_atual REAL NOT NULL,
+    novo_limite_solicitado REAL NOT NULL,
+    status_pedido TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_solicitacoes_cpf ON solicitacoes (cpf_cliente);
+"""
+
+class RepositorioSQLite(RepositorioDados):
+    """
+    Backend SQLite em modo WAL: leituras não bloqueiam a escrita da fila de solicitações.
+    Cada thread (event loop e thread da fila) usa a sua própria conexão.
+    """
+    def __init__(self, caminho, fsync=False):
+        self.caminho = caminho
+        self.fsync = fsync
+        self._local = threading.local()
+        self._conexao().executescript(ESQUEMA_SQLITE)
+
+    def _conexao(self):
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is None:
+            conexao = sqlite3.connect(self.caminho, timeout=5.0)
+            conexao.row_factory = sqlite3.Row
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.execute(f"PRAGMA synchronous={'FULL' if self.fsync else 'NORMAL'}")
+            self._local.conexao = conexao
+        return conexao
+
+    def obter_cliente(self, cpf):
+        linha = self._conexao().execute(
+            "SELECT cpf, data_nascimento, nome, score, limite_credito FROM clientes WHERE cpf_limpo = ?",
+            (limpar_cpf(cpf),)
+        ).fetchone()
+        if linha is None:
+            return None
+        cliente = dict(linha)
+        cliente["score"] = str(cliente["score"])
+        return cliente
+
+    def atualizar_score(self, cpf, novo_score):
+        conexao = self._conexao()
+        with conexao:
+            cursor = conexao.execute(
+                "UPDATE clientes SET score = ? WHERE cpf_limpo = ?", (int(novo_score), limpar_cpf(cpf))
+            )
+        return cursor.rowcount > 0
+
+    def limite_maximo(self, score):
+        # Busca pela chave primária (min_score): a faixa com maior mínimo <= score
+        linha = self._conexao().execute(
+            "SELECT max_score, limite_maximo FROM faixas_score WHERE min_score <= ? ORDER BY min_score DESC LIMIT 1",
+            (int(score),)
+        ).fetchone()
+        if linha is not None and score <= linha["max_score"]:
+            return float(linha["limite_maximo"])
+        return None
+
+    def registrar_solicitacoes(self, lote):
+        conexao = self._conexao()
+        with conexao:
+            conexao.executemany(
+                "INSERT INTO solicitacoes (cpf_cliente, data_hora_solicitacao, limite_atual, novo_limite_solicitado, status_pedido) "
+                "VALUES (:cpf_cliente, :data_hora_solicitacao, :limite_atual, :novo_limite_solicitado, :status_pedido)",
+                lote
+            )
+
+    def esta_vazio(self):
+        return self._conexao().execute("SELECT 1 FROM clientes LIMIT 1").fetchone() is None
+
+def importar_csv(repositorio, pasta_dados=PASTA_DADOS):
+    """
+    Importação única dos CSVs de data/ para o SQLite. Clientes e faixas são substituídos;
+    solicitações só são importadas se a tabela ainda estiver vazia (evita duplicar o histórico).
+    Retorna um dicionário com a quantidade de linhas importadas por tabela.
+    """
+    def ler(nome):
+        caminho = os.path.join(pasta_dados, nome)
+        if not os.path.exists(caminho):
+            return []
+        with open(caminho, newline="", encoding="utf-8") as arquivo:
+            return list(csv.DictReader(arquivo))
+
+    clientes = ler("clientes.csv")
+    faixas = sorted(
+        (int(f["min_score"]), int(f["max_score"]), float(f["limite_maximo"])) for f in ler("score_limite.csv")
+    )
+    validar_faixas(faixas)
+    solicitacoes = ler("solicitacoes_aumento_limite.csv")
+
+    conexao = repositorio._conexao()
+    with conexao:
+        conexao.executemany(
+            "INSERT OR REPLACE INTO clientes (cpf_limpo, cpf, data_nascimento, nome, score, limite_credito) VALUES (?, ?, ?, ?, ?, ?)",
+            [(limpar_cpf(c["cpf"]), c["cpf"], c["data_nascimento"], c["nome"], int(c["score"]), c["limite_credito"]) for c in clientes]
+        )
+        conexao.execute("DELETE FROM faixas_score")
+        conexao.executemany("INSERT INTO faixas_score (min_score, max_score, limite_maximo) VALUES (?, ?, ?)", faixas)
+
+        ja_tem_solicitacoes = conexao.execute("SELECT 1 FROM solicitacoes LIMIT 1").fetchone() is not None
+        if ja_tem_solicitacoes:
+            solicitacoes = []
+        conexao.executemany(
+            "INSERT INTO solicitacoes (cpf_cliente, data_hora_solicitacao, limite_atual, novo_limite_solicitado, status_pedido) "
+            "VALUES (:cpf_cliente, :data_hora_solicitacao, :limite_atual, :novo_limite_solicitado, :status_pedido)",
+            solicitacoes
+        )
+
+    return {"clientes": len(clientes), "faixas_score": len(faixas), "solicitacoes": len(solicitacoes)}
+
+def obter_repositorio(backend=BACKEND_DADOS):
+    if backend == "sqlite":
+        repositorio = RepositorioSQLite(ARQUIVO_SQLITE, fsync=FSYNC_SOLICITACOES)
+        if repositorio.esta_vazio():
+            # Primeira subida com SQLite: popula a partir dos CSVs existentes
+            print(f"Banco SQLite vazio, importando CSVs: {importar_csv(repositorio)}")
+        return repositorio
+    return RepositorioCSV(fsync=FSYNC_SOLICITACOES)
+
+REPOSITORIO = obter_repositorio()
+
+if __name__ == "__main__":
+    # Importador avulso: python repositorio.py [caminho_do_banco.db]
+    import sys
+    destino = sys.argv[1] if len(sys.argv) > 1 else ARQUIVO_SQLITE
+    print(importar_csv(RepositorioSQLite(destino)))
@@ -0,0 +1,209 @@
+import os
+import re
+import zlib
+import numpy as np
+from dotenv import load_dotenv
+from cache_classificacao import normalizar_mensagem
+
+# Roteador de intenções por vizinho mais próximo, executado antes do LLM.
+# Cada mensagem vira um vetor esparso de n-gramas (palavras + trigramas de caracteres)
+# projetado por hashing; a similaridade de cosseno com os exemplos rotulados sai de
+# um único produto de matrizes NumPy.
+# O hashing não enxerga negação ("não quero crédito" fica perto de "quero crédito"), então mensagens
+# com negação sempre vão ao LLM, e rótulos destrutivos (encerrar, aumentar_limite) exigem confiança
+# e margem maiores; "encerrar" ainda precisa de uma palavra de saída de verdade na mensagem.
+
+load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+LIMIAR_ROTEADOR = float(os.getenv("LIMIAR_ROTEADOR", "0.6")) # Confiança mínima para dispensar o LLM
+MARGEM_ROTEADOR = float(os.getenv("MARGEM_ROTEADOR", "0.1")) # Distância mínima para o segundo rótulo
+LIMIAR_ROTEADOR_DEGRADADO = float(os.getenv("LIMIAR_ROTEADOR_DEGRADADO", "0.3")) # Sem LLM, aceita palpites mais fracos
+LIMIAR_ROTEADOR_DESTRUTIVO = float(os.getenv("LIMIAR_ROTEADOR_DESTRUTIVO", "0.85"))
+MARGEM_ROTEADOR_DESTRUTIVO = float(os.getenv("MARGEM_ROTEADOR_DESTRUTIVO", "0.2"))
+DIMENSAO_VETOR = 4096
+
+ROTULO_ENCERRAR = "encerrar"
+NEGACOES = {"nao", "nem", "nunca", "jamais"}
+_RE_SAIDA = re.compile(r"\b(?:tchau|encerrar|encerra|sair|fim|finalizar|ate logo|ate mais|cancelar|desisto)\b")
+_RE_SAIR_DE = re.compile(r"\bsair d[aeo]s?\b") # "sair do cheque especial" não é sair do atendimento
+_RE_VOLTA = re.compile(r"\b(?:voltar|menu|outros servicos)\b")
+_RE_VOLTAR_A_OUTRA_COISA = re.compile(r"\bvoltar (?:a|pra|para) (?!(?:o |a )?(?:menu|triagem|inicio)\b)") # "voltar a trabalhar"
+
+EXEMPLOS_TRIAGEM = {
+    "credito": [
+        "credito", "quero ver meu limite", "consultar meu limite", "aumentar meu limite",
+        "pedir aumento de limite", "quero mais credito", "solicitar credito", "emprestimo",
+        "meu limite esta baixo", "limite do cartao", "quero aumentar meu credito",
+    ],
+    "entrevista": [
+        "atualizacao cadastral", "atualizar meu cadastro", "atualizar meus dados",
+        "quero fazer a entrevista", "mudar meus dados cadastrais", "recalcular meu score",
+        "atualizar minha renda",
+    ],
+    "cambio": [
+        "cotacao de moedas", "cotacao do dolar", "quanto esta o dolar", "cambio",
+        "preco do euro", "valor da libra", "quero ver o euro", "cotacao do bitcoin",
+        "quanto custa o dolar hoje", "cotacao do iene",
+    ],
+    "encerrar": [
+        "tchau", "encerrar", "sair", "fim", "encerrar atendimento",
+        "obrigado tchau", "pode finalizar", "ate logo", "quero sair",
+    ],
+}
+
+EXEMPLOS_MENU_CREDITO = {
+    "consultar_limite": [
+        "consultar limite", "quero ver meu limite", "qual meu limite", "quanto tenho de limite",
+        "ver saldo", "limite atual", "consultar meu credito",
+    ],
+    "aumentar_limite": [
+        "aumentar limite", "quero aumentar meu limite", "pedir aumento", "novo limite",
+        "solicitar aumento de limite", "quero mais limite", "aumento de credito",
+    ],
+    "encerrar": [
+        "tchau", "encerrar", "sair", "fim", "cancelar", "obrigado tchau",
+        "encerrar atendimento",
+    ],
+    "voltar": [
+        "voltar", "outros servicos", "menu principal", "voltar ao menu", "ver outras opcoes",
+        "falar com a triagem", "quero outro servico",
+    ],
+}
+
+# Pedidos de saída no meio de outro fluxo (entrevista): segunda opinião para as palavras-chave
+EXEMPLOS_SAIDA = {
+    "encerrar": [
+        "tchau", "encerrar", "sair", "fim", "cancelar", "desisto", "quero sair", "quero cancelar",
+        "cancelar a entrevista", "encerrar atendimento", "pode encerrar", "obrigado tchau", "ate logo",
+    ],
+    "voltar": [
+        "voltar", "menu", "voltar ao menu", "menu principal", "outros servicos", "quero voltar",
+        "voltar para a triagem", "ver outras opcoes",
+    ],
+}
+
+def _ngramas(texto):
+    palavras = texto.split()
+    yield from palavras
+    for palavra in palavras:
+        marcada = f" {palavra} "
+        for i in range(len(marcada) - 2):
+            yield marcada[i:i + 3]
+
+def tem_negacao(texto):
+    """
+    `texto` já normalizado (normalizar_mensagem).
+    """
+    return any(palavra in NEGACOES for palavra in texto.split())
+
+def pedido_de_saida(texto):
+    return bool(_RE_SAIDA.search(texto)) and not _RE_SAIR_DE.search(texto)
+
+def pedido_de_volta(texto):
+    return bool(_RE_VOLTA.search(texto)) and not _RE_VOLTAR_A_OUTRA_COISA.search(texto)
+
+def vetorizar(mensagens, dimensao=DIMENSAO_VETOR):
+    """
+    Converte uma lista de mensagens numa matriz (n x dimensao) de vetores L2-normalizados.
+    """
+    matriz = np.zeros((len(mensagens), dimensao), dtype=np.float32)
+    for linha, mensagem in enumerate(mensagens):
+        for ngrama in _ngramas(normalizar_mensagem(mensagem)):
+            matriz[linha, zlib.crc32(ngrama.encode()) % dimensao] += 1.0
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return matriz / normas
+
+class RoteadorIntencoes:
+    def __init__(self, exemplos, destrutivos=(ROTULO_ENCERRAR,), dimensao=DIMENSAO_VETOR):
+        self.dimensao = dimensao
+        self.rotulos = list(exemplos.keys())
+        self.destrutivos = set(destrutivos)
+
+        # Exemplos agrupados por rótulo para reduzir a matriz com np.maximum.reduceat
+        textos = []
+        self._inicios = []
+        for rotulo in self.rotulos:
+            self._inicios.append(len(textos))
+            textos.extend(exemplos[rotulo])
+        self._matriz_exemplos = vetorizar(textos, dimensao)
+
+        self.decididos = 0
+        self.encaminhados_llm = 0
+        self.palpites = 0
+        self.barrados = 0
+
+    def pontuar_lote(self, mensagens):
+        """
+        Retorna a matriz (mensagens x rótulos) com a maior similaridade de cada rótulo.
+        """
+        similaridades = vetorizar(mensagens, self.dimensao) @ self._matriz_exemplos.T
+        return np.maximum.reduceat(similaridades, self._inicios, axis=1)
+
+    def classificar(self, mensagem, limiar=None):
+        """
+        Retorna (rotulo, confianca). O rótulo é None quando a confiança fica abaixo do limiar
+        ou muito próxima do segundo colocado; nesse caso o chamador deve consultar o LLM.
+        """
+        limiar = LIMIAR_ROTEADOR if limiar is None else limiar
+        pontuacoes = self.pontuar_lote([mensagem])[0]
+        ordem = np.argsort(pontuacoes)[::-1]
+        melhor = float(pontuacoes[ordem[0]])
+        segundo = float(pontuacoes[ordem[1]]) if len(ordem) > 1 else 0.0
+
+        rotulo = self.rotulos[ordem[0]]
+        if melhor >= limiar and melhor - segundo >= MARGEM_ROTEADOR:
+            if self._aceitavel(rotulo, normalizar_mensagem(mensagem), melhor, melhor - segundo):
+                self.decididos += 1
+                return rotulo, melhor
+            self.barrados += 1
+
+        self.encaminhados_llm += 1
+        return None, melhor
+
+    def _aceitavel(self, rotulo, texto, confianca, margem=None):
+        """
+        Guarda contra negação e saídas falsas. Sem `margem` (palpite), não exige a confiança
+        maior dos rótulos destrutivos, só as guardas de texto.
+        """
+        if tem_negacao(texto):
+            return False
+        if rotulo == ROTULO_ENCERRAR and not pedido_de_saida(texto):
+            return False
+        if margem is not None and rotulo in self.destrutivos:
+            return confianca >= LIMIAR_ROTEADOR_DESTRUTIVO and margem >= MARGEM_ROTEADOR_DESTRUTIVO
+        return True
+
+    def palpite(self, mensagem, limiar=LIMIAR_ROTEADOR_DEGRADADO):
+        """
+        Melhor rótulo com limiar menor e sem exigir margem, para quando o LLM não respondeu
+        (disjuntor aberto, prazo estourado, fila cheia). None se nem isso for plausível.
+        """
+        pontuacoes = self.pontuar_lote([mensagem])[0]
+        melhor = int(np.argmax(pontuacoes))
+        if pontuacoes[melhor] < limiar or not self._aceitavel(self.rotulos[melhor], normalizar_mensagem(mensagem), float(pontuacoes[melhor])):
+            return None
+        self.palpites += 1
+        return self.rotulos[melhor]
+
+    def confirma(self, mensagem, rotulo, limiar=LIMIAR_ROTEADOR_DESTRUTIVO):
+        """
+        Segunda opinião para quem detectou `rotulo` por palavra-chave: a mensagem precisa estar
+        tão perto dos exemplos do rótulo quanto se exige dos rótulos destrutivos.
+        """
+        pontuacoes = self.pontuar_lote([mensagem])[0]
+        return float(pontuacoes[self.rotulos.index(rotulo)]) >= limiar
+
+    def estatisticas(self):
+        total = self.decididos + self.encaminhados_llm
+        return {
+            "decididos_sem_llm": self.decididos,
+            "encaminhados_llm": self.encaminhados_llm,
+            "taxa_sem_llm": round(self.decididos / total, 4) if total else 0.0,
+            "limiar": LIMIAR_ROTEADOR,
+            "palpites_sem_llm": self.palpites,
+            "barrados_por_guarda": self.barrados,
+        }
+
+ROTEADOR_TRIAGEM = RoteadorIntencoes(EXEMPLOS_TRIAGEM)
+ROTEADOR_MENU_CREDITO = RoteadorIntencoes(EXEMPLOS_MENU_CREDITO, destrutivos=(ROTULO_ENCERRAR, "aumentar_limite"))
+ROTEADOR_SAIDA = RoteadorIntencoes(EXEMPLOS_SAIDA, destrutivos=(ROTULO_ENCERRAR, "voltar"))
@@ -1,59 +1,137 @@
 from fastapi import APIRouter
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
+import asyncio
 import os
-import requests
+import re
 from dotenv import load_dotenv
 
 # Importar Sessão e LLM_Service Compartilhados
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-from sessao import obter_sessao
-from llm_service import consultar_llm
+from orquestrador import agente
+from sessao import obter_sessao, turno_de_sessao
+from estado_sessao import Agente, EstadoTriagem, SubEstadoCambio, USUARIO, ASSISTENTE
+from llm_service import classificar_llm
+from extrator_entrevista import intencao_saida
+from cache_cotacoes import CacheCotacoes
+from cliente_cotacoes import ClienteCotacoes, URL_AWESOMEAPI
 
 # Configuração
 load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env"))
 router = APIRouter(prefix="/cambio", tags=["Agente de Câmbio"])
+COTACAO_TTL = float(os.getenv("COTACAO_TTL", "30")) # Segundos em que a cotação é considerada fresca
+COTACAO_TTL_OBSOLETO = float(os.getenv("COTACAO_TTL_OBSOLETO", "600")) # Até quando servir a antiga enquanto atualiza
+COTACAO_TTL_FALHA = float(os.getenv("COTACAO_TTL_FALHA", "10"))
+COTACAO_URL = os.getenv("COTACAO_URL", URL_AWESOMEAPI)
+COTACAO_MAX_CONEXOES = int(os.getenv("COTACAO_MAX_CONEXOES", "20"))
+# Pré-carregamento: moedas sempre mantidas frescas (botões da interface) + as mais pedidas
+COTACAO_PARES_QUENTES = [m.strip().upper() for m in os.getenv("COTACAO_PARES_QUENTES", "USD,EUR,GBP").split(",") if m.strip()]
+COTACAO_INTERVALO_PRE_CARGA = float(os.getenv("COTACAO_INTERVALO_PRE_CARGA", "10"))
+COTACAO_MAX_PARES_QUENTES = int(os.getenv("COTACAO_MAX_PARES_QUENTES", "10"))
+COTACAO_MIN_PEDIDOS_QUENTE = int(os.getenv("COTACAO_MIN_PEDIDOS_QUENTE", "3"))
 
 # Modelos
 class EntradaChat(BaseModel):
     id_sessao: str
     mensagem: str
+    encadear: bool = False # True: em transferências, o servidor já executa a abertura do agente de destino
 
 class SaidaChat(BaseModel):
     resposta: str
     acao: str = "continuar" 
     alvo: Optional[str] = None
     id_sessao: str
+    mensagens: List[str] = [] # Respostas de todos os agentes que atuaram no turno
+    agente_final: Optional[str] = None # Agente que atende a próxima mensagem
 
-def obter_cotacao(moeda_origem: str, moeda_destino: str = "BRL"):
+CLIENTE_COTACOES = ClienteCotacoes(
+    url_base=COTACAO_URL,
+    timeout=5.0,
+    max_conexoes=COTACAO_MAX_CONEXOES
+)
+
+CACHE_COTACOES = CacheCotacoes(
+    CLIENTE_COTACOES.buscar_lote,
+    ttl=COTACAO_TTL,
+    ttl_obsoleto=COTACAO_TTL_OBSOLETO,
+    ttl_falha=COTACAO_TTL_FALHA
+)
+
+async def obter_cotacao(moeda_origem: str, moeda_destino: str = "BRL"):
     """
-    Busca a cotação real usando a API pública e gratuita 'AwesomeAPI'.
+    Cotação servida pelo cache (uma busca por par a cada COTACAO_TTL segundos).
     """
-    url = f"https://economia.awesomeapi.com.br/last/{moeda_origem}-{moeda_destino}"
-    try:
-        response = requests.get(url, timeout=5)
-        if response.status_code == 200:
-            dados = response.json()
-            chave = f"{moeda_origem}{moeda_destino}"
-            
-            if chave in dados:
-                info = dados[chave]
-                nome = info.get('name', '')
-                valor = float(info.get('bid', 0)) # Preço de compra
-                return True, nome, valor
-    except Exception as e:
-        print(f"Erro ao buscar cotação de {moeda_origem}: {e}")
-        
-    return False, "Erro ao consultar a API", 0.0
+    return await CACHE_COTACOES.obter(moeda_origem, moeda_destino)
+
+async def obter_cotacoes(moedas_origem, moeda_destino: str = "BRL"):
+    """
+    Várias cotações de uma vez: os pares fora do cache saem numa única requisição à AwesomeAPI.
+    Retorna [(moeda, sucesso, nome, valor)] na ordem pedida.
+    """
+    resultados = await CACHE_COTACOES.obter_lote([(moeda, moeda_destino) for moeda in moedas_origem])
+    return [(moeda, *resultados[(moeda.upper(), moeda_destino.upper())]) for moeda in moedas_origem]
+
+async def pre_carregador_cotacoes(intervalo=COTACAO_INTERVALO_PRE_CARGA):
+    """
+    Tarefa de fundo (iniciada no main.py) que mantém os pares quentes atualizados numa única
+    requisição em lote, antes que vençam, para o endpoint quase nunca esperar pela rede.
+    """
+    fixos = [(moeda, "BRL") for moeda in COTACAO_PARES_QUENTES]
+    while True:
+        try:
+            pares = CACHE_COTACOES.escolher_pares_quentes(fixos, COTACAO_MAX_PARES_QUENTES, COTACAO_MIN_PEDIDOS_QUENTE)
+            # Antecedência de um intervalo: o que venceria antes do próximo ciclo é buscado agora
+            await CACHE_COTACOES.pre_carregar(pares, antecedencia=intervalo)
+        except Exception as e:
+            print(f"Erro no pré-carregamento de cotações: {e}")
+        await asyncio.sleep(intervalo)
+
+# Nomes usados pelos botões da interface e pelas perguntas mais comuns
+MOEDAS_POR_NOME = (("dólar", "USD"), ("dolar", "USD"), ("euro", "EUR"), ("libra", "GBP"))
+
+def moedas_por_nome(msg_lower):
+    """
+    Siglas das moedas citadas por nome, na ordem em que aparecem ("euro e dólar" -> ["EUR", "USD"]).
+    """
+    posicoes = {}
+    for nome, codigo in MOEDAS_POR_NOME:
+        posicao = msg_lower.find(nome)
+        if posicao >= 0:
+            posicoes[codigo] = min(posicao, posicoes.get(codigo, posicao))
+    return sorted(posicoes, key=posicoes.get)
+
+def separar_codigos(codigo_moeda):
+    """
+    "USD, EUR" -> ["USD", "EUR"]; retorna [] se algum item não for uma sigla de 3 letras.
+    """
+    codigos = list(dict.fromkeys(c.strip() for c in codigo_moeda.split(",") if c.strip()))
+    if not codigos or any(len(c) != 3 or not c.isalpha() for c in codigos):
+        return []
+    return codigos
+
+_RE_SIGLA = re.compile(r"\b[A-Z]{3}\b")
+
+def codigo_por_regras(mensagem):
+    """
+    Substituto determinístico do LLM: "SAIR"/"VOLTAR" pelas palavras-chave, ou as siglas
+    em maiúsculas citadas na mensagem. None se nada for reconhecido.
+    """
+    saida = intencao_saida(mensagem)
+    if saida:
+        return "SAIR" if saida == "encerrar" else "VOLTAR"
+    siglas = list(dict.fromkeys(_RE_SIGLA.findall(mensagem)))
+    return ",".join(siglas) or None
 
 @router.post("/", response_model=SaidaChat)
+@turno_de_sessao
+@agente(Agente.CAMBIO)
 async def endpoint_cambio(entrada: EntradaChat):
     id_sessao = entrada.id_sessao
     mensagem = entrada.mensagem.strip()
     
     sessao = obter_sessao(id_sessao)
-    if not sessao or not sessao.get("dados_cliente"):
+    if not sessao or not sessao.dados_cliente:
         return SaidaChat(
             resposta="Sessão não encontrada ou não autenticada. Por favor, inicie pelo atendimento inicial.",
             acao="encerrar",
@@ -61,34 +139,29 @@ async def endpoint_cambio(entrada: EntradaChat):
         )
     
     # Adicionar mensagem do usuário ao histórico global
-    if "historico" not in sessao: sessao["historico"] = []
     
     # Se a mensagem for vazia, significa transferência, envia saudação
     if not mensagem:
         resposta_texto = "Perfeito, vamos falar sobre cotação das moedas. Sobre qual moeda deseja pesquisar?"
-        sessao["sub_estado_cambio"] = "AGUARDANDO_MOEDA"
-        sessao["historico"].append({"role": "assistant", "content": resposta_texto})
+        sessao.sub_estado_cambio = SubEstadoCambio.AGUARDANDO_MOEDA
+        sessao.registrar(ASSISTENTE, resposta_texto)
         return SaidaChat(resposta=resposta_texto, acao="continuar", id_sessao=id_sessao)
 
-    sessao["historico"].append({"role": "user", "content": mensagem})
+    sessao.registrar(USUARIO, mensagem)
 
-    sub_estado = sessao.get("sub_estado_cambio", "MENU")
+    sub_estado = sessao.sub_estado_cambio
     
     resposta_texto = ""
     acao = "continuar"
     alvo = None
 
-    if sub_estado == "MENU" or sub_estado == "AGUARDANDO_MOEDA":
+    if sub_estado == SubEstadoCambio.MENU or sub_estado == SubEstadoCambio.AGUARDANDO_MOEDA:
         # Bypass Rápido Expresso para botões da Interface
         msg_lower = mensagem.lower()
         if msg_lower == "outros serviços" or "menu" in msg_lower or "voltar" in msg_lower:
             codigo_moeda = "VOLTAR"
-        elif "dólar" in msg_lower or "dolar" in msg_lower:
-            codigo_moeda = "USD"
-        elif "euro" in msg_lower:
-            codigo_moeda = "EUR"
-        elif "libra" in msg_lower:
-            codigo_moeda = "GBP"
+        elif moedas_citadas := moedas_por_nome(msg_lower):
+            codigo_moeda = ",".join(moedas_citadas)
         else:
             # Processar IA para extrair a moeda ou intenção de sair por correlação livre e países
             instrucao = """
@@ -97,47 +170,67 @@ async def endpoint_cambio(entrada: EntradaChat):
             Você deve deduzir a moeda pelo país se ele citar um. (ex: Inglaterra/Reino Unido = GBP, Europa = EUR, Japão = JPY).
             Exemplo de siglas: USD para Dólar Americano, EUR para Euro, GBP para Libra Esterlina (Inglaterra), BTC para Bitcoin.
             Se ele não falar de qual país é o Dólar, assuma USD.
+            Se ele pedir mais de uma moeda, responda as siglas separadas por vírgula (ex: USD,EUR,JPY).
             
             Se o usuário quiser sair ou encerrar, retorne exatamente "SAIR".
             Se quiser ver outros serviços e voltar ao menu, retorne exatamente "VOLTAR".
             Se você não identificar a moeda ou país com clareza, retorne "DESCONHECIDO".
     
-            Responda APENAS com a sigla de 3 letras maiúsculas, "SAIR", "VOLTAR" ou "DESCONHECIDO". Nada mais.
+            Responda APENAS com a(s) sigla(s) de 3 letras maiúsculas, "SAIR", "VOLTAR" ou "DESCONHECIDO". Nada mais.
             """
-            resultado_llm = consultar_llm(mensagem, sessao.get("historico", []), instrucao)
+            resultado_llm = await classificar_llm(mensagem, sessao.historico, instrucao)
             codigo_moeda = resultado_llm.strip().upper()
+            if "ERRO_LLM" in codigo_moeda:
+                # LLM indisponível: palavras-chave de saída ou siglas escritas pelo cliente ("JPY")
+                codigo_moeda = codigo_por_regras(mensagem) or codigo_moeda
 
         if "ERRO_LLM" in codigo_moeda:
             resposta_texto = "Meu sistema de câmbio está instável. Qual moeda deseja consultar?"
-            sessao["sub_estado_cambio"] = "AGUARDANDO_MOEDA"
+            sessao.sub_estado_cambio = SubEstadoCambio.AGUARDANDO_MOEDA
         elif "SAIR" in codigo_moeda or "ENCER" in codigo_moeda:
             resposta_texto = "Atendimento encerrado."
-            sessao["estado"] = "ENCERRADO"
+            sessao.estado = EstadoTriagem.ENCERRADO
             acao = "encerrar"
         elif "VOLTAR" in codigo_moeda:
             resposta_texto = ""
-            sessao["sub_estado_cambio"] = "MENU"
+            sessao.sub_estado_cambio = SubEstadoCambio.MENU
             acao = "transferir"
             alvo = "AgenteTriagem"
-        elif codigo_moeda == "DESCONHECIDO" or len(codigo_moeda) != 3:
+        elif codigo_moeda == "DESCONHECIDO" or not (codigos := separar_codigos(codigo_moeda)):
              resposta_texto = "Moeda não compreendida. Especifique-a, por favor: (Dólar, Euro, Libra)"
-             sessao["sub_estado_cambio"] = "AGUARDANDO_MOEDA"
+             sessao.sub_estado_cambio = SubEstadoCambio.AGUARDANDO_MOEDA
+        elif len(codigos) > 1:
+             # Várias moedas na mesma pergunta: uma única consulta em lote
+             cotacoes = await obter_cotacoes(codigos, "BRL")
+             linhas = [f"- **{nome_par}**: R$ {valor:.4f}" for _, sucesso, nome_par, valor in cotacoes if sucesso]
+             indisponiveis = [moeda for moeda, sucesso, _, _ in cotacoes if not sucesso]
+
+             if linhas:
+                 resposta_texto = "Cotações:\n" + "\n".join(linhas)
+                 if indisponiveis:
+                     resposta_texto += f"\nIndisponíveis no momento: {', '.join(indisponiveis)}."
+                 resposta_texto += "\nQual outra moeda deseja consultar? (Dólar, Euro, Libra, Outros serviços)"
+                 sessao.sub_estado_cambio = SubEstadoCambio.AGUARDANDO_MOEDA
+             else:
+                 resposta_texto = "O provedor de cotações em tempo real está indisponível no momento. Pode tentar mais tarde? (Outros serviços)"
+                 sessao.sub_estado_cambio = SubEstadoCambio.MENU
         else:
+             codigo_moeda = codigos[0]
              # Fazer a busca na API
-             sucesso, nome_par, valor = obter_cotacao(codigo_moeda, "BRL")
+             sucesso, nome_par, valor = await obter_cotacao(codigo_moeda, "BRL")
              
              if sucesso:
                  resposta_texto = f"Cotação de **{nome_par}**: R$ {valor:.4f}. Qual outra moeda deseja consultar? (Dólar, Euro, Libra, Outros serviços)"
-                 sessao["sub_estado_cambio"] = "AGUARDANDO_MOEDA"
+                 sessao.sub_estado_cambio = SubEstadoCambio.AGUARDANDO_MOEDA
              elif nome_par == "Erro ao consultar a API":
                  resposta_texto = "O provedor de cotações em tempo real está indisponível no momento. Pode tentar mais tarde? (Outros serviços)"
-                 sessao["sub_estado_cambio"] = "MENU"
+                 sessao.sub_estado_cambio = SubEstadoCambio.MENU
              else:
                  resposta_texto = f"Cotação de {codigo_moeda} indisponível no momento. Deseja tentar outra? (Outros serviços)"
-                 sessao["sub_estado_cambio"] = "AGUARDANDO_MOEDA"
+                 sessao.sub_estado_cambio = SubEstadoCambio.AGUARDANDO_MOEDA
 
     # Salva no histórico
-    sessao["historico"].append({"role": "assistant", "content": resposta_texto})
+    sessao.registrar(ASSISTENTE, resposta_texto)
 
     return SaidaChat(
         resposta=resposta_texto,
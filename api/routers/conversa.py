@@ -0,0 +1,131 @@
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+import asyncio
+import json
+import os
+import time
+
+# Importar Orquestrador Compartilhado
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from orquestrador import executar_turno
+from transmissao import definir_emissor, restaurar_emissor, evento_sse, TTFB_SSE, TTFB_WEBSOCKET
+
+router = APIRouter(prefix="/conversa", tags=["Conversa (WebSocket e SSE)"])
+
+# Modelos
+class EntradaConversa(BaseModel):
+    id_sessao: str
+    mensagem: str
+
+class ConexoesConversa:
+    """
+    Contadores das conexões abertas. Uma conexão ociosa custa só a corrotina aguardando
+    a próxima mensagem, então um worker comporta milhares de clientes conectados.
+    """
+    def __init__(self):
+        self.ativas = 0
+        self.abertas = 0
+        self.turnos = 0
+        self.erros = 0
+
+    def estatisticas(self):
+        return {
+            "ativas": self.ativas,
+            "abertas_total": self.abertas,
+            "turnos": self.turnos,
+            "erros": self.erros,
+        }
+
+CONEXOES = ConexoesConversa()
+
+def ler_mensagem(texto):
+    # Aceita {"mensagem": "..."} ou o texto puro
+    try:
+        dados = json.loads(texto)
+    except ValueError:
+        return texto
+    if isinstance(dados, dict):
+        return str(dados.get("mensagem", ""))
+    return texto
+
+@router.websocket("/ws/{id_sessao}")
+async def conversa_ws(websocket: WebSocket, id_sessao: str):
+    """
+    Canal único por sessão: cada mensagem recebida é roteada pelo servidor para o agente_atual
+    da sessão (com transferências encadeadas) e a resposta é enviada pela mesma conexão,
+    no mesmo formato do SaidaChat dos endpoints HTTP.
+    """
+    await websocket.accept()
+    CONEXOES.ativas += 1
+    CONEXOES.abertas += 1
+    try:
+        while True:
+            mensagem = ler_mensagem(await websocket.receive_text())
+            inicio = time.perf_counter()
+            try:
+                saida = await executar_turno(id_sessao, mensagem.strip())
+                CONEXOES.turnos += 1
+            except Exception as e:
+                CONEXOES.erros += 1
+                print(f"Erro no turno da conversa {id_sessao}: {e}")
+                resposta = "Erro ao processar sua mensagem. Tente novamente."
+                await websocket.send_json({
+                    "resposta": resposta,
+                    "acao": "continuar",
+                    "alvo": None,
+                    "id_sessao": id_sessao,
+                    "mensagens": [resposta],
+                    "agente_final": None,
+                })
+                continue
+            await websocket.send_text(saida.model_dump_json())
+            TTFB_WEBSOCKET.medir_desde(inicio)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        CONEXOES.ativas -= 1
+
+@router.post("/sse")
+async def conversa_sse(entrada: EntradaConversa):
+    """
+    Mesmo roteamento do WebSocket, com a resposta em Server-Sent Events:
+    - `mensagem`: mensagem completa de um agente, enviada assim que o agente termina;
+    - `fim`: o SaidaChat final (mensagens combinadas, ação e agente final).
+    O cliente começa a receber texto na primeira mensagem, sem esperar o turno inteiro.
+    """
+    inicio = time.perf_counter()
+    fila = asyncio.Queue()
+
+    def emissor(evento, dados):
+        fila.put_nowait((evento, dados))
+
+    async def executar():
+        token = definir_emissor(emissor)
+        try:
+            saida = await executar_turno(entrada.id_sessao, entrada.mensagem.strip())
+            fila.put_nowait(("fim", saida.model_dump()))
+        except Exception as e:
+            print(f"Erro no turno SSE da conversa {entrada.id_sessao}: {e}")
+            fila.put_nowait(("erro", {"texto": "Erro ao processar sua mensagem. Tente novamente."}))
+        finally:
+            restaurar_emissor(token)
+
+    async def eventos():
+        tarefa = asyncio.create_task(executar())
+        primeiro = True
+        try:
+            while True:
+                evento, dados = await fila.get()
+                if primeiro and evento in ("mensagem", "erro"):
+                    TTFB_SSE.medir_desde(inicio)
+                    primeiro = False
+                yield evento_sse(evento, dados)
+                if evento in ("fim", "erro"):
+                    break
+        finally:
+            # O turno termina mesmo se o cliente fechar a conexão no meio (a sessão fica consistente)
+            await asyncio.shield(tarefa)
+
+    return StreamingResponse(eventos(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
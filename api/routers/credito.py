@@ -1,7 +1,6 @@
 from fastapi import APIRouter
 from pydantic import BaseModel
-from typing import Optional
-import pandas as pd
+from typing import List, Optional
 import os
 import datetime
 from dotenv import load_dotenv
@@ -9,8 +8,14 @@ from dotenv import load_dotenv
 # Importar Sessão e LLM_Service Compartilhados
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-from sessao import obter_sessao, atualizar_sessao
-from llm_service import consultar_llm
+from orquestrador import agente
+from sessao import obter_sessao, atualizar_sessao, turno_de_sessao
+from estado_sessao import Agente, EstadoTriagem, SubEstadoCredito, USUARIO, ASSISTENTE
+from llm_service import consultar_llm, classificar_llm
+from extrator_entrevista import intencao_saida as intencao_saida_regras, resposta_sim_nao
+from roteador_intencoes import ROTEADOR_MENU_CREDITO
+from repositorio import REPOSITORIO
+from fila_escrita import FilaEscrita
 
 # Configuração
 load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env"))
@@ -20,58 +25,61 @@ router = APIRouter(prefix="/credito", tags=["Agente de Crédito"])
 class EntradaChat(BaseModel):
     id_sessao: str
     mensagem: str
+    encadear: bool = False # True: em transferências, o servidor já executa a abertura do agente de destino
 
 class SaidaChat(BaseModel):
     resposta: str
     acao: str = "continuar" 
     alvo: Optional[str] = None
     id_sessao: str
+    mensagens: List[str] = [] # Respostas de todos os agentes que atuaram no turno
+    agente_final: Optional[str] = None # Agente que atende a próxima mensagem
 
-# Dados
-PASTA_DADOS = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
-ARQUIVO_SOLICITACOES = os.path.join(PASTA_DADOS, "solicitacoes_aumento_limite.csv")
-ARQUIVO_SCORE_LIMITE = os.path.join(PASTA_DADOS, "score_limite.csv")
+# Política de descarga das solicitações (write-behind)
+FILA_MAX_LOTE = int(os.getenv("FILA_SOLICITACOES_MAX_LOTE", "100"))
+FILA_INTERVALO = float(os.getenv("FILA_SOLICITACOES_INTERVALO", "1.0"))
+# Checagem de desistência ao informar o valor: prazo curto, a resposta padrão ("continuar") é segura
+PRAZO_LLM_VALOR = float(os.getenv("LLM_PRAZO_CREDITO_VALOR", "4"))
 
 # Funções Auxiliares
-def verificar_limite_score(score, novo_limite):
+async def verificar_limite_score(score, novo_limite):
     try:
-        df = pd.read_csv(ARQUIVO_SCORE_LIMITE)
-        if df.empty: return False
-        
-        # Encontrar faixa de score
-        # Assumindo score numérico
-        score = int(score)
-        faixa = df[(df['min_score'] <= score) & (df['max_score'] >= score)]
-        
-        if not faixa.empty:
-            limite_max = float(faixa.iloc[0]['limite_maximo'])
+        # Faixa encontrada por busca binária (tabela em memória ou índice do SQLite)
+        limite_max = await REPOSITORIO.ler(REPOSITORIO.limite_maximo, int(score))
+        if limite_max is not None:
             return novo_limite <= limite_max
         return False
     except Exception as e:
         print(f"Erro ao verificar score: {e}")
         return "erro_db"
 
+# Lotes gravados com uma escrita bufferizada (CSV) ou um INSERT em lote (SQLite)
+FILA_SOLICITACOES = FilaEscrita(
+    REPOSITORIO.registrar_solicitacoes,
+    max_lote=FILA_MAX_LOTE,
+    intervalo=FILA_INTERVALO,
+    nome="fila_solicitacoes"
+)
+
 def registrar_solicitacao(dados):
     # cpf_cliente,data_hora_solicitacao,limite_atual,novo_limite_solicitado,status_pedido
+    # O endpoint responde assim que o registro entra na fila; a gravação acontece em lote
     try:
-        colunas = ["cpf_cliente", "data_hora_solicitacao", "limite_atual", "novo_limite_solicitado", "status_pedido"]
-        if not os.path.exists(ARQUIVO_SOLICITACOES):
-            pd.DataFrame(columns=colunas).to_csv(ARQUIVO_SOLICITACOES, index=False)
-            
-        df = pd.DataFrame([dados])
-        df.to_csv(ARQUIVO_SOLICITACOES, mode='a', header=False, index=False)
+        FILA_SOLICITACOES.enfileirar(dados)
         return True
     except Exception as e:
         print(f"Erro ao registrar solicitação: {e}")
         return False
 
 @router.post("/", response_model=SaidaChat)
+@turno_de_sessao
+@agente(Agente.CREDITO)
 async def endpoint_credito(entrada: EntradaChat):
     id_sessao = entrada.id_sessao
     mensagem = entrada.mensagem.strip()
     
     sessao = obter_sessao(id_sessao)
-    if not sessao or not sessao.get("dados_cliente"):
+    if not sessao or not sessao.dados_cliente:
         return SaidaChat(
             resposta="Sessão não encontrada ou não autenticada. Por favor, inicie pelo atendimento inicial.",
             acao="encerrar",
@@ -79,30 +87,37 @@ async def endpoint_credito(entrada: EntradaChat):
         )
     
     # Adicionar mensagem do usuário ao histórico global
-    if "historico" not in sessao: sessao["historico"] = []
-    sessao["historico"].append({"role": "user", "content": mensagem})
+    sessao.registrar(USUARIO, mensagem)
 
     # Estado Interno do Agente de Crédito
     # Se já estivermos "dentro" de um fluxo de solicitação, continuamos
-    sub_estado = sessao.get("sub_estado_credito", "MENU")
+    sub_estado = sessao.sub_estado_credito
     
-    cliente = sessao["dados_cliente"]
+    cliente = sessao.dados_cliente
     cpf = cliente.get("cpf")
     nome = cliente.get("nome")
     limite_atual = float(cliente.get("limite_credito", 0))
     score_atual = int(cliente.get("score", 0))
 
+    # O score vem do repositório quando disponível (reflete entrevistas gravadas por qualquer sessão)
+    try:
+        registro = await REPOSITORIO.ler(REPOSITORIO.obter_cliente, cpf)
+        if registro is not None:
+            score_atual = int(registro["score"])
+    except Exception as e:
+        print(f"Erro ao consultar repositório de clientes: {e}")
+
     resposta_texto = ""
     acao = "continuar"
     alvo = None
 
-    if sub_estado == "MENU":
+    if sub_estado == SubEstadoCredito.MENU:
         # Check para mensagem silenciosa se for a primeira após transferencia
-        if sessao.get("voltou_da_entrevista") is True:
-            sessao["voltou_da_entrevista"] = False
+        if sessao.voltou_da_entrevista is True:
+            sessao.voltou_da_entrevista = False
             # Retorna a mensagem inicial do menu sem precisar classificar a palavra que fez a transicao
             resposta_texto = "Vamos falar de crédito. Posso consultar seu limite ou analisar um pedido de aumento. (Consultar limite, Aumentar limite)"
-            sessao["historico"].append({"role": "assistant", "content": resposta_texto})
+            sessao.registrar(ASSISTENTE, resposta_texto)
             return SaidaChat(resposta=resposta_texto, acao="continuar", id_sessao=id_sessao)
 
         # Classificar se é consulta, aumento ou encerramento
@@ -117,7 +132,13 @@ async def endpoint_credito(entrada: EntradaChat):
         
         Regra: Responda APENAS com o nome da categoria exata. Sem frases.
         """
-        intencao = consultar_llm(mensagem, sessao.get("historico", []), instrucao)
+        # Roteador por similaridade primeiro; o LLM só é chamado quando ele não tem confiança
+        intencao, _ = ROTEADOR_MENU_CREDITO.classificar(mensagem)
+        if intencao is None:
+            intencao = await classificar_llm(mensagem, sessao.historico, instrucao)
+            if "erro_llm" in intencao:
+                # LLM indisponível: palpite do roteador por similaridade
+                intencao = ROTEADOR_MENU_CREDITO.palpite(mensagem) or intencao
 
         # Limpeza para modelos locais
         intencao = intencao.strip().lower()
@@ -137,16 +158,16 @@ async def endpoint_credito(entrada: EntradaChat):
         
         elif "aumentar" in intencao:
             resposta_texto = "Qual o valor de limite desejado? (Ex: 5000)"
-            sessao["sub_estado_credito"] = "AGUARDANDO_VALOR"
+            sessao.sub_estado_credito = SubEstadoCredito.AGUARDANDO_VALOR
         
         elif intencao == "encerrar":
             resposta_texto = "Entendido. Atendimento encerrado."
-            sessao["estado"] = "ENCERRADO"
+            sessao.estado = EstadoTriagem.ENCERRADO
             acao = "encerrar"
 
         elif intencao == "voltar":
             resposta_texto = ""
-            sessao["sub_estado_credito"] = "MENU"
+            sessao.sub_estado_credito = SubEstadoCredito.MENU
             acao = "transferir"
             alvo = "AgenteTriagem"
 
@@ -154,7 +175,7 @@ async def endpoint_credito(entrada: EntradaChat):
              resposta_texto = "Por favor, escolha uma opção para créditos: (Consultar limite, Aumentar limite, Outros serviços)"
 
 
-    elif sub_estado == "AGUARDANDO_VALOR":
+    elif sub_estado == SubEstadoCredito.AGUARDANDO_VALOR:
         # Verificação rápida se o usuário desistiu de dar o valor
         instrucao = """
         O bot perguntou qual o valor do limite desejado. O usuário respondeu.
@@ -165,18 +186,19 @@ async def endpoint_credito(entrada: EntradaChat):
         
         Responda APENAS com a categoria exata.
         """
-        intencao_saida = consultar_llm(mensagem, sessao.get("historico", []), instrucao).strip().lower()
+        intencao_saida = (await consultar_llm(mensagem, sessao.historico, instrucao, prazo=PRAZO_LLM_VALOR)).strip().lower()
         if "erro_llm" in intencao_saida:
-            resposta_texto = "Desculpe, falha na interpretação da sua mensagem. Qual seria o valor?"
-            return SaidaChat(resposta=resposta_texto, acao="continuar", id_sessao=id_sessao)
-        elif "encerra" in intencao_saida or "sair" in intencao_saida:
+            # LLM indisponível: palavras-chave de saída; sem elas, segue tentando ler o valor
+            intencao_saida = intencao_saida_regras(mensagem) or "continuar"
+
+        if "encerra" in intencao_saida or "sair" in intencao_saida:
             resposta_texto = "Operação cancelada. Atendimento encerrado."
-            sessao["estado"] = "ENCERRADO"
-            sessao["sub_estado_credito"] = "MENU"
+            sessao.estado = EstadoTriagem.ENCERRADO
+            sessao.sub_estado_credito = SubEstadoCredito.MENU
             return SaidaChat(resposta=resposta_texto, acao="encerrar", id_sessao=id_sessao)
         elif "volta" in intencao_saida or "menu" in intencao_saida or "serviço" in intencao_saida or "outro" in intencao_saida:
             resposta_texto = ""
-            sessao["sub_estado_credito"] = "MENU"
+            sessao.sub_estado_credito = SubEstadoCredito.MENU
             return SaidaChat(resposta=resposta_texto, acao="transferir", alvo="AgenteTriagem", id_sessao=id_sessao)
 
         import re as regex_module
@@ -203,11 +225,11 @@ async def endpoint_credito(entrada: EntradaChat):
         
         if novo_limite > 0:
             # Processar Solicitação OK
-            aprovado = verificar_limite_score(score_atual, novo_limite)
+            aprovado = await verificar_limite_score(score_atual, novo_limite)
             
             if aprovado == "erro_db":
                 resposta_texto = "Nosso serviço de consulta de scores está temporariamente indisponível. Desculpe-nos. (Outros serviços)"
-                sessao["sub_estado_credito"] = "MENU"
+                sessao.sub_estado_credito = SubEstadoCredito.MENU
             else:
                 status = "aprovado" if aprovado else "rejeitado"
                 
@@ -220,7 +242,7 @@ async def endpoint_credito(entrada: EntradaChat):
                 }
                 registrar_solicitacao(dados_solicitacao)
                 
-                sessao["sub_estado_credito"] = "MENU"
+                sessao.sub_estado_credito = SubEstadoCredito.MENU
 
                 if aprovado:
                     resposta_texto = f"Solicitação APROVADA baseada no seu score ({score_atual}). Novo limite: R$ {novo_limite:.2f}."
@@ -228,12 +250,12 @@ async def endpoint_credito(entrada: EntradaChat):
                 else:
                     resposta_texto = ("Seu score não aprova este aumento automático. "
                                       "Deseja fazer uma entrevista rápida para atualizar dados e tentar novamente? (Sim, Não)")
-                    atualizar_sessao(id_sessao, "sub_estado_credito", "OFERECER_ENTREVISTA")
-                    sessao["sub_estado_credito"] = "OFERECER_ENTREVISTA"
+                    atualizar_sessao(id_sessao, "sub_estado_credito", SubEstadoCredito.OFERECER_ENTREVISTA)
+                    sessao.sub_estado_credito = SubEstadoCredito.OFERECER_ENTREVISTA
         else:
              resposta_texto = "Valor não identificado. Digite apenas o número (ex: 5000)."
 
-    elif sub_estado == "OFERECER_ENTREVISTA":
+    elif sub_estado == SubEstadoCredito.OFERECER_ENTREVISTA:
         msg_lower = mensagem.strip().lower()
         if msg_lower in ["sim", "sim.", "s", "quero", "claro", "aceito", "bora"]:
             intencao = "sim"
@@ -250,8 +272,10 @@ async def endpoint_credito(entrada: EntradaChat):
             
             Responda APENAS a categoria exata.
             """
-            intencao = consultar_llm(mensagem, sessao.get("historico", []), instrucao)
+            intencao = await consultar_llm(mensagem, sessao.historico, instrucao)
             intencao = intencao.strip().lower()
+            if "erro_llm" in intencao:
+                intencao = intencao_saida_regras(mensagem) or resposta_sim_nao(mensagem) or intencao
 
         if "erro_llm" in intencao:
             resposta_texto = "Desculpe, meu classificador falhou. Deseja iniciar a entrevista? (Sim, Não)"
@@ -259,20 +283,20 @@ async def endpoint_credito(entrada: EntradaChat):
             resposta_texto = "" # Não envia mensagem, apenas transfere
             acao = "transferir"
             alvo = "AgenteEntrevista"
-            sessao["sub_estado_credito"] = "MENU" # Limpa estado
+            sessao.sub_estado_credito = SubEstadoCredito.MENU # Limpa estado
         elif "encerra" in intencao or "sair" in intencao:
             resposta_texto = "Operação cancelada. Atendimento encerrado."
-            sessao["sub_estado_credito"] = "MENU"
-            sessao["estado"] = "ENCERRADO"
+            sessao.sub_estado_credito = SubEstadoCredito.MENU
+            sessao.estado = EstadoTriagem.ENCERRADO
             acao = "encerrar"
         elif "volta" in intencao or "menu" in intencao or "serviço" in intencao or "outro" in intencao:
             resposta_texto = ""
-            sessao["sub_estado_credito"] = "MENU"
+            sessao.sub_estado_credito = SubEstadoCredito.MENU
             acao = "transferir"
             alvo = "AgenteTriagem"
         else:
             resposta_texto = "Tudo bem. Mais alguma demanda de crédito? (Consultar limite, Aumentar limite, Outros serviços)"
-            sessao["sub_estado_credito"] = "MENU"
+            sessao.sub_estado_credito = SubEstadoCredito.MENU
 
     return SaidaChat(
         resposta=resposta_texto,
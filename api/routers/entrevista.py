@@ -1,16 +1,20 @@
 from fastapi import APIRouter
 from pydantic import BaseModel
-from typing import Optional
-import pandas as pd
+from typing import List, Optional
+import asyncio
+import functools
 import os
 from dotenv import load_dotenv
-import re
 
 # Importar Sessão e LLM_Service Compartilhados
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-from sessao import obter_sessao, atualizar_sessao
+from orquestrador import agente
+from sessao import obter_sessao, turno_de_sessao
+from estado_sessao import Agente, EstadoTriagem, SubEstadoEntrevista, USUARIO, ASSISTENTE
 from llm_service import consultar_llm
+from extrator_entrevista import EXTRATOR_ENTREVISTA, CAMPOS_ENTREVISTA, normalizar_campo
+from repositorio import REPOSITORIO
 
 # Configuração
 load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env"))
@@ -20,62 +24,80 @@ router = APIRouter(prefix="/entrevista", tags=["Agente de Entrevista"])
 class EntradaChat(BaseModel):
     id_sessao: str
     mensagem: str
+    encadear: bool = False # True: em transferências, o servidor já executa a abertura do agente de destino
 
 class SaidaChat(BaseModel):
     resposta: str
     acao: str = "continuar" 
     alvo: Optional[str] = None
     id_sessao: str
+    mensagens: List[str] = [] # Respostas de todos os agentes que atuaram no turno
+    agente_final: Optional[str] = None # Agente que atende a próxima mensagem
 
-# Dados
-PASTA_DADOS = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
-ARQUIVO_DADOS = os.path.join(PASTA_DADOS, "clientes.csv")
+async def atualizar_score_cliente(cpf, novo_score):
+    try:
+        # UPDATE de uma linha no SQLite, ou regravação do CSV pelo índice em memória (em thread nos dois casos)
+        return await asyncio.to_thread(REPOSITORIO.atualizar_score, cpf, novo_score)
+    except Exception as e:
+        print(f"Erro ao atualizar score do cliente: {e}")
+        return "erro_db"
 
-def extrair_valor_financeiro(mensagem):
-    # Procura por números no formato 0000 ou 0000.00 ou 0.000,00
-    numeros = re.findall(r"[\d\.,]+", mensagem)
-    if numeros:
-        for num_str in numeros:
-            clean_str = num_str
-            if ',' in clean_str and '.' in clean_str:
-                clean_str = clean_str.replace('.', '').replace(',', '.')
-            elif ',' in clean_str:
-                clean_str = clean_str.replace(',', '.')
-            try:
-                val = float(clean_str)
-                if val >= 0:
-                    return val
-            except:
-                continue
-    return -1.0 # Indica falha
+# Descrição de cada campo no esquema JSON pedido ao LLM
+DESCRICAO_CAMPOS = {
+    "renda": '- "renda": número (float) do valor ganho, salário ou rendimento (ex: se o usuário disser um valor alto solto como "10000", extraia 10000.0), ou null',
+    "emprego": '- "emprego": exatamente "formal" (usar se ele disser CLT, carteira assinada, registrado), "autônomo" ou "desempregado", ou null',
+    "despesas": '- "despesas": número (float) do custo fixo mensal, ou 0.0 caso diga que "não tem despesas", "não possuo despesas", "0 despesas", "sem despesas", senão null',
+    "dependentes": '- "dependentes": string Exatamente "0" (se disser que não tem, nenhum, sem dependentes), "1", "2" ou "3+", ou null se não falado',
+    "dividas": '- "dividas": string "sim" ou "não" (mesmo se "sem dívidas", colocar "não"), ou null',
+}
+EXEMPLO_CAMPOS = {"renda": "5000.0", "emprego": '"formal"', "despesas": "0.0", "dependentes": '"0"', "dividas": '"não"'}
 
-def atualizar_score_cliente_csv(cpf, novo_score):
-    try:
-        df = pd.read_csv(ARQUIVO_DADOS, dtype=str)
-        cpf_limpo_alvo = "".join([c for c in cpf if c.isdigit()])
+@functools.lru_cache(maxsize=None)
+def instrucao_extracao(campos):
+    """
+    Instrução de extração apenas com os campos pedidos (no máximo 31 combinações, cada uma com sua chain).
+    """
+    estrutura = "\n        ".join(DESCRICAO_CAMPOS[campo] for campo in campos)
+    exemplo = "".join(f'"{campo}": {EXEMPLO_CAMPOS[campo]}, ' for campo in campos)
+    return f"""
+        Você é um assistente especializado em extrair informações financeiras em formato JSON.
+        Se um dado não foi informado agora ou no histórico recente, coloque o valor como null.
         
-        # Cria coluna temporária
-        df['cpf_limpo'] = df['cpf'].apply(lambda x: "".join([c for c in str(x) if c.isdigit()]))
+        Estrutura exigida do JSON:
+        {estrutura}
+        - "encerrar": boolean (true se desiste do banco inteiro, tchau, quer sair)
+        - "voltar": boolean (true se apenas quer voltar para o menu inicial, opções globais, triagem)
         
-        if cpf_limpo_alvo in df['cpf_limpo'].values:
-            # Atualiza o score na linha onde encontrou o CPF
-            idx = df[df['cpf_limpo'] == cpf_limpo_alvo].index
-            df.loc[idx, 'score'] = str(novo_score)
-            df = df.drop(columns=['cpf_limpo']) # Remove a coluna temporária
-            df.to_csv(ARQUIVO_DADOS, index=False)
-            return True
-        return False
-    except Exception as e:
-        print(f"Erro ao atualizar CSV de clientes: {e}")
-        return "erro_db"
+        Importante: Responda APENAS com o JSON. Não adicione nenhum texto antes ou depois.
+        Exemplo de continuação comum:
+        {{{exemplo}"encerrar": false, "voltar": false}}
+        """
+
+# Tipos de cada campo no JSON Schema usado na decodificação restrita do Ollama
+ESQUEMA_CAMPOS = {
+    "renda": {"type": ["number", "null"]},
+    "emprego": {"enum": ["formal", "autônomo", "desempregado", None]},
+    "despesas": {"type": ["number", "null"]},
+    "dependentes": {"enum": ["0", "1", "2", "3+", None]},
+    "dividas": {"enum": ["sim", "não", None]},
+}
+
+@functools.lru_cache(maxsize=None)
+def esquema_extracao(campos):
+    propriedades = {campo: ESQUEMA_CAMPOS[campo] for campo in campos}
+    propriedades["encerrar"] = {"type": "boolean"}
+    propriedades["voltar"] = {"type": "boolean"}
+    return {"type": "object", "properties": propriedades, "required": list(propriedades)}
 
 @router.post("/", response_model=SaidaChat)
+@turno_de_sessao
+@agente(Agente.ENTREVISTA)
 async def endpoint_entrevista(entrada: EntradaChat):
     id_sessao = entrada.id_sessao
     mensagem = entrada.mensagem.strip().lower()
     
     sessao = obter_sessao(id_sessao)
-    if not sessao or not sessao.get("dados_cliente"):
+    if not sessao or not sessao.dados_cliente:
         return SaidaChat(
             resposta="Sessão não encontrada ou não autenticada.",
             acao="encerrar",
@@ -83,15 +105,14 @@ async def endpoint_entrevista(entrada: EntradaChat):
         )
     
     # Adicionar mensagem do usuário ao histórico global
-    if "historico" not in sessao: sessao["historico"] = []
-    sessao["historico"].append({"role": "user", "content": mensagem})
+    sessao.registrar(USUARIO, mensagem)
 
     # Verifica se acabou de ser transferido e é a primeira chamada neste agente
-    estado_entrevista = sessao.get("sub_estado_entrevista", "INICIO")
+    estado_entrevista = sessao.sub_estado_entrevista
     
     # Se ele for inicial, nós ignoramos a entrada do usuário que ativou a transferência
     # e enviamos a pergunta direto!
-    if estado_entrevista == "INICIO":
+    if estado_entrevista == SubEstadoEntrevista.INICIO:
         resposta_texto = ("Vamos atualizar seus dados para reavaliar seu score.\n\n"
                           "Informe os seguintes dados (pode ser em uma única mensagem):\n"
                           "- Renda mensal\n"
@@ -99,132 +120,83 @@ async def endpoint_entrevista(entrada: EntradaChat):
                           "- Despesas fixas\n"
                           "- Número de dependentes\n"
                           "- Possui dívidas ativas? (Sim, Não)")
-        sessao["sub_estado_entrevista"] = "COLETANDO_DADOS"
-        sessao["dados_entrevista"] = {
+        sessao.sub_estado_entrevista = SubEstadoEntrevista.COLETANDO_DADOS
+        sessao.dados_entrevista = {
             "renda": None,
             "emprego": None,
             "despesas": None,
             "dependentes": None,
             "dividas": None
         }
-        sessao["historico"].append({"role": "assistant", "content": resposta_texto})
+        sessao.registrar(ASSISTENTE, resposta_texto)
         return SaidaChat(resposta=resposta_texto, acao="continuar", id_sessao=id_sessao)
 
     resposta_texto = ""
     acao = "continuar"
     alvo = None
 
-    if estado_entrevista == "COLETANDO_DADOS":
-        instrucao = """
-        Você é um assistente especializado em extrair informações financeiras em formato JSON.
-        Se um dado não foi informado agora ou no histórico recente, coloque o valor como null.
-        
-        Estrutura exigida do JSON:
-        - "renda": número (float) do valor ganho, salário ou rendimento (ex: se o usuário disser um valor alto solto como "10000", extraia 10000.0), ou null
-        - "emprego": exatamente "formal" (usar se ele disser CLT, carteira assinada, registrado), "autônomo" ou "desempregado", ou null
-        - "despesas": número (float) do custo fixo mensal, ou 0.0 caso diga que "não tem despesas", "não possuo despesas", "0 despesas", "sem despesas", senão null
-        - "dependentes": string Exatamente "0" (se disser que não tem, nenhum, sem dependentes), "1", "2" ou "3+", ou null se não falado
-        - "dividas": string "sim" ou "não" (mesmo se "sem dívidas", colocar "não"), ou null
-        - "encerrar": boolean (true se desiste do banco inteiro, tchau, quer sair)
-        - "voltar": boolean (true se apenas quer voltar para o menu inicial, opções globais, triagem)
-        
-        Importante: Responda APENAS com o JSON. Não adicione nenhum texto antes ou depois.
-        Exemplo de continuação comum:
-        {"renda": 5000.0, "emprego": "formal", "despesas": 0.0, "dependentes": "0", "dividas": "não", "encerrar": false, "voltar": false}
-        """
-        dados_extraidos = consultar_llm(mensagem, sessao.get("historico", []), instrucao, formato="json")
-        
-        # Verificar cancelamento imediato ou retorno ao menu pela IA
-        if isinstance(dados_extraidos, dict):
-            if dados_extraidos.get("erro_llm") is True:
-                resposta_texto = "Desculpe, meu sistema falhou ao interpretar suas informações. Poderia enviá-las de novo?"
-                return SaidaChat(resposta=resposta_texto, acao="continuar", id_sessao=id_sessao)
-                
+    if estado_entrevista == SubEstadoEntrevista.COLETANDO_DADOS:
+        dados_acumulados = sessao.dados_entrevista or {}
+        faltando = [campo for campo in CAMPOS_ENTREVISTA if dados_acumulados.get(campo) is None]
+
+        # 1. Extração determinística (regras pré-compiladas); correções de campos já preenchidos também valem
+        campos, flags = EXTRATOR_ENTREVISTA.extrair(mensagem, faltando)
+        confiaveis, fracos = EXTRATOR_ENTREVISTA.separar(campos)
+        pendentes = [campo for campo in faltando if campo not in confiaveis]
+
+        if flags["voltar"] and not confiaveis:
+            resposta_texto = ""
+            sessao.sub_estado_entrevista = SubEstadoEntrevista.INICIO
+            return SaidaChat(resposta=resposta_texto, acao="transferir", alvo="AgenteTriagem", id_sessao=id_sessao)
+
+        if flags["encerrar"] and not confiaveis:
+            resposta_texto = "Entrevista cancelada. Atendimento encerrado."
+            sessao.sub_estado_entrevista = SubEstadoEntrevista.INICIO
+            sessao.estado = EstadoTriagem.ENCERRADO
+            sessao.registrar(ASSISTENTE, resposta_texto)
+            return SaidaChat(resposta=resposta_texto, acao="encerrar", id_sessao=id_sessao)
+
+        dados_acumulados.update(confiaveis)
+        campos_llm = 0
+
+        # 2. LLM só para os campos que as regras não preencheram, com esquema reduzido
+        #    (e para pedidos de saída ambíguos: "não quero cancelar", "vou voltar a trabalhar")
+        if pendentes or flags["saida_incerta"]:
+            dados_extraidos = await consultar_llm(
+                mensagem, sessao.historico, instrucao_extracao(tuple(pendentes)),
+                formato="json", esquema=esquema_extracao(tuple(pendentes))
+            )
+
+            if not isinstance(dados_extraidos, dict) or dados_extraidos.get("erro_llm") is True:
+                if not confiaveis and not fracos:
+                    resposta_texto = "Desculpe, meu sistema falhou ao interpretar suas informações. Poderia enviá-las de novo?"
+                    return SaidaChat(resposta=resposta_texto, acao="continuar", id_sessao=id_sessao)
+                dados_extraidos = {}
+
+            # Verificar cancelamento imediato ou retorno ao menu pela IA
             if dados_extraidos.get("voltar") is True:
                 resposta_texto = ""
-                sessao["sub_estado_entrevista"] = "INICIO"
+                sessao.sub_estado_entrevista = SubEstadoEntrevista.INICIO
                 return SaidaChat(resposta=resposta_texto, acao="transferir", alvo="AgenteTriagem", id_sessao=id_sessao)
-            
+
             if dados_extraidos.get("encerrar") is True:
                 resposta_texto = "Entrevista cancelada. Atendimento encerrado."
-                sessao["sub_estado_entrevista"] = "INICIO"
-                sessao["estado"] = "ENCERRADO"
-                sessao["historico"].append({"role": "assistant", "content": resposta_texto})
+                sessao.sub_estado_entrevista = SubEstadoEntrevista.INICIO
+                sessao.estado = EstadoTriagem.ENCERRADO
+                sessao.registrar(ASSISTENTE, resposta_texto)
                 return SaidaChat(resposta=resposta_texto, acao="encerrar", id_sessao=id_sessao)
-        
-        # Merge de dados já obtidos com os novos
-        dados_acumulados = sessao.get("dados_entrevista", {})
-        
-        # Verifica e atualiza apenas os novos dados extraídos com sucesso
-        import re as regex_module
-        if isinstance(dados_extraidos, dict):
-            # Extração defensiva com Regex direta da mensagem se o LLM falhar miseravelmente
-            numeros = regex_module.findall(r"[\d\.,]+", mensagem)
-            val_extraido = None
-            if numeros:
-                for num_str in numeros:
-                     clean_str = num_str
-                     if ',' in clean_str and '.' in clean_str:
-                         clean_str = clean_str.replace('.', '').replace(',', '.')
-                     elif ',' in clean_str:
-                         clean_str = clean_str.replace(',', '.')
-                     try: val_extraido = float(clean_str); break
-                     except: continue
 
-            if dados_extraidos.get("renda") is not None:
-                try: dados_acumulados["renda"] = float(dados_extraidos["renda"])
-                except: pass
-            
-            if dados_extraidos.get("despesas") is not None:
-                 try: dados_acumulados["despesas"] = float(dados_extraidos["despesas"])
-                 except: pass
-                 
-            # Tratamento avançado de bypass do Fallback (Caso pessoa não indique nominalmente e só sobrar um numero ou mande algo como '0 despesas')
-            msg_lower_limpa = mensagem.lower().replace("ã", "a").replace("í", "i")
-            if "sem despesa" in msg_lower_limpa or "nao tenho despesa" in msg_lower_limpa or "nao possuo despesa" in msg_lower_limpa or "0 despesa" in msg_lower_limpa:
-                dados_acumulados["despesas"] = 0.0
-            elif "sem renda" in msg_lower_limpa or "0 renda" in msg_lower_limpa:
-                dados_acumulados["renda"] = 0.0
-                
-            if dados_acumulados.get("renda") is None and val_extraido is not None and ("renda" in mensagem.lower() or "ganho" in mensagem.lower() or "recebo" in mensagem.lower()):
-                dados_acumulados["renda"] = val_extraido
-            elif dados_acumulados.get("despesas") is None and val_extraido is not None and "despesa" in mensagem.lower():
-                dados_acumulados["despesas"] = val_extraido
-            elif val_extraido is not None and val_extraido > 100:
-                # Se o numero for consideravelmente grande (maior que 100) e ele não estiver classificado, inferimos que seja a Renda por eliminação pragmática
-                if dados_acumulados.get("renda") is None:
-                     dados_acumulados["renda"] = val_extraido
-            
-            emprego = str(dados_extraidos.get("emprego", "")).lower()
-            msg_emprego = mensagem.lower()
-            if "formal" in emprego or "clt" in msg_emprego or "carteira assinada" in msg_emprego: dados_acumulados["emprego"] = "formal"
-            elif "autônomo" in emprego or "autonomo" in emprego or "uber" in msg_emprego: dados_acumulados["emprego"] = "autônomo"
-            elif "desempregado" in emprego or "sem emprego" in msg_emprego: dados_acumulados["emprego"] = "desempregado"
-            
-            dep = str(dados_extraidos.get("dependentes", "")).lower()
-            if dep in ["0", "1", "2", "3+"]: dados_acumulados["dependentes"] = dep
-            else:
-                 # fallback limpeza dependentes baseada puramente na intencao expressa
-                 msg_limpa = mensagem.lower()
-                 if "3" in msg_limpa or "mais" in msg_limpa or "três" in msg_limpa: dados_acumulados["dependentes"] = "3+"
-                 elif "2" in msg_limpa or "dois" in msg_limpa: dados_acumulados["dependentes"] = "2"
-                 elif "1" in msg_limpa or "um" in msg_limpa: dados_acumulados["dependentes"] = "1"
-                 elif "0" in msg_limpa or "sem dependente" in msg_limpa or "nenhum" in msg_limpa or "nao tem" in msg_limpa.replace("ã","a"): dados_acumulados["dependentes"] = "0"
-                 # Se a LLM tentou passar nulo, mas e extraímos que ele disse 0 literalmente "0 dependentes"
-                 if dados_acumulados.get("dependentes") is None and val_extraido == 0.0:
-                      dados_acumulados["dependentes"] = "0"
-            
-            div = str(dados_extraidos.get("dividas", "")).lower()
-            if "sim" in div: dados_acumulados["dividas"] = "sim"
-            elif "não" in div or "nao" in div: dados_acumulados["dividas"] = "não"
-            else:
-                 msg_limpa = mensagem.lower()
-                 if "sem divida" in msg_limpa.replace("í","i") or "nenhuma divida" in msg_limpa.replace("í","i") or "não tenho divida" in msg_limpa.replace("í","i").replace("ã","a"):
-                     dados_acumulados["dividas"] = "não"
-                 elif "tenho divida" in msg_limpa.replace("í","i") or "estou com divida" in msg_limpa.replace("í","i"):
-                     dados_acumulados["dividas"] = "sim"
+            for campo in pendentes:
+                valor = normalizar_campo(campo, dados_extraidos.get(campo))
+                if valor is not None:
+                    dados_acumulados[campo] = valor
+                    campos_llm += 1
+                elif campo in fracos:
+                    # O LLM não achou: fica o palpite das regras (ex: número solto > 100 como renda)
+                    dados_acumulados[campo] = fracos[campo]
 
-        sessao["dados_entrevista"] = dados_acumulados
+        EXTRATOR_ENTREVISTA.registrar_turno(len(confiaveis), campos_llm, usou_llm=bool(pendentes or flags["saida_incerta"]))
+        sessao.dados_entrevista = dados_acumulados
         
         # Checar o que ainda falta
         campos_faltando = []
@@ -263,16 +235,16 @@ async def endpoint_entrevista(entrada: EntradaChat):
             novo_score = max(0, min(1000, novo_score)) # Limita entre 0 e 1000
 
             # Atualizar Perfil na Sessão
-            cliente = sessao["dados_cliente"]
+            cliente = sessao.dados_cliente
             score_antigo = cliente.get("score")
             cliente["score"] = novo_score
             
-            # Atualizar no CSV
-            sucesso_db = atualizar_score_cliente_csv(cliente["cpf"], novo_score)
+            # Atualizar no repositório de dados
+            sucesso_db = await atualizar_score_cliente(cliente["cpf"], novo_score)
             
             if sucesso_db == "erro_db":
                 resposta_texto = "Ocorreu um erro técnico ao salvar seu novo score no banco de dados. Tente novamente mais tarde."
-                sessao["sub_estado_entrevista"] = "INICIO"
+                sessao.sub_estado_entrevista = SubEstadoEntrevista.INICIO
                 return SaidaChat(resposta=resposta_texto, acao="transferir", alvo="AgenteTriagem", id_sessao=id_sessao)
 
             resposta_texto = (f"Dados atualizados.\n"
@@ -280,13 +252,13 @@ async def endpoint_entrevista(entrada: EntradaChat):
                               f"Agora podemos prosseguir com o crédito.")
             
             # Limpar estado da entrevista
-            sessao["sub_estado_entrevista"] = "INICIO"
-            sessao["voltou_da_entrevista"] = True
+            sessao.sub_estado_entrevista = SubEstadoEntrevista.INICIO
+            sessao.voltou_da_entrevista = True
 
             acao = "transferir"
             alvo = "AgenteCredito"
 
-    sessao["historico"].append({"role": "assistant", "content": resposta_texto})
+    sessao.registrar(ASSISTENTE, resposta_texto)
     
     return SaidaChat(
         resposta=resposta_texto,
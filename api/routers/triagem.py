@@ -1,7 +1,6 @@
 from fastapi import APIRouter
 from pydantic import BaseModel
-from typing import Optional
-import pandas as pd
+from typing import List, Optional
 import os
 import re
 from dotenv import load_dotenv
@@ -9,8 +8,12 @@ from dotenv import load_dotenv
 # Importar Sessão e LLM_Service Compartilhados
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-from sessao import obter_sessao, criar_sessao, atualizar_sessao
-from llm_service import consultar_llm
+from orquestrador import agente
+from sessao import obter_sessao, criar_sessao, atualizar_sessao, turno_de_sessao
+from estado_sessao import Agente, EstadoTriagem, USUARIO, ASSISTENTE
+from llm_service import classificar_llm
+from roteador_intencoes import ROTEADOR_TRIAGEM
+from repositorio import REPOSITORIO
 
 # Configuração
 load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env"))
@@ -20,39 +23,32 @@ router = APIRouter(prefix="/triagem", tags=["Agente de Triagem"])
 class EntradaChat(BaseModel):
     id_sessao: str
     mensagem: str
+    encadear: bool = False # True: em transferências, o servidor já executa a abertura do agente de destino
 
 class SaidaChat(BaseModel):
     resposta: str
     acao: str = "continuar" # continuar, transferir, encerrar
     alvo: Optional[str] = None # nome do agente se houver transferência
     id_sessao: str
+    mensagens: List[str] = [] # Respostas de todos os agentes que atuaram no turno
+    agente_final: Optional[str] = None # Agente que atende a próxima mensagem
 
 # Configuração GERAL
 MAX_TENTATIVAS = 3
-ARQUIVO_DADOS = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "clientes.csv")
 
 # Lógica de Autenticação
-def autenticar_cliente(cpf_usuario, data_usuario):
+async def autenticar_cliente(cpf_usuario, data_usuario):
     """
-    Verifica se o CPF e a Data de Nascimento correspondem na base de dados (clientes.csv).
+    Verifica se o CPF e a Data de Nascimento correspondem na base de dados.
+    A consulta é feita pelo CPF normalizado no repositório configurado (índice em memória do CSV ou SQLite).
     """
     try:
-        # Lê o CSV como string para preservar zeros à esquerda
-        df = pd.read_csv(ARQUIVO_DADOS, dtype=str)
+        cliente_encontrado = await REPOSITORIO.ler(REPOSITORIO.obter_cliente, cpf_usuario)
         
-        # Normaliza o CPF recebido (remove formatação)
-        cpf_limpo = "".join([c for c in cpf_usuario if c.isdigit()])
-        
-        # Cria coluna temporária com CPF limpo para comparação
-        df['cpf_limpo'] = df['cpf'].apply(lambda x: "".join([c for c in str(x) if c.isdigit()]))
-        
-        cliente_encontrado = df[df['cpf_limpo'] == cpf_limpo]
-        
-        if not cliente_encontrado.empty:
-            data_registrada = cliente_encontrado.iloc[0]['data_nascimento']
+        if cliente_encontrado is not None:
             # Compara strings (formato DD/MM/AAAA)
-            if data_registrada == data_usuario:
-                return True, cliente_encontrado.iloc[0].to_dict()
+            if cliente_encontrado['data_nascimento'] == data_usuario:
+                return True, cliente_encontrado
         
         return False, None
     except Exception as e:
@@ -60,6 +56,8 @@ def autenticar_cliente(cpf_usuario, data_usuario):
         return False, "erro_db"
 
 @router.post("/", response_model=SaidaChat)
+@turno_de_sessao
+@agente(Agente.TRIAGEM)
 async def endpoint_triagem(entrada: EntradaChat):
     id_sessao = entrada.id_sessao
     mensagem = entrada.mensagem.strip()
@@ -67,76 +65,69 @@ async def endpoint_triagem(entrada: EntradaChat):
     # Inicializa Sessão via módulo compartilhado
     sessao = obter_sessao(id_sessao)
     if not sessao:
-        sessao = criar_sessao(id_sessao, {
-            "estado": "SAUDACAO",
-            "tentativas": 0,
-            "dados_cliente": None,
-            "cpf_temp": None,
-            "agente_atual": "triagem",
-            "historico": [] # Lista de mensagens {role, content}
-        })
+        # EstadoSessao já nasce em SAUDACAO, com o agente de triagem e histórico vazio
+        sessao = criar_sessao(id_sessao)
     
-    estado = sessao["estado"]
+    estado = sessao.estado
     
     # Adicionar mensagem do usuário ao histórico
-    if "historico" not in sessao: sessao["historico"] = []
-    sessao["historico"].append({"role": "user", "content": mensagem})
+    sessao.registrar(USUARIO, mensagem)
     
-    # ... (resto da lógica usa 'sessao' localmente, que é referencia ao dict, entao funciona)
+    # ... (resto da lógica usa 'sessao' localmente, que é referência ao objeto, então funciona)
     resposta_texto = ""
     acao = "continuar"
     alvo = None
 
     # Máquina de Estados
-    if estado == "SAUDACAO":
+    if estado == EstadoTriagem.SAUDACAO:
         resposta_texto = "Olá! Bem-vindo ao Banco Ágil. Sou o assistente virtual. Informe seu CPF, por favor."
-        sessao["estado"] = "AGUARDANDO_CPF"
+        sessao.estado = EstadoTriagem.AGUARDANDO_CPF
     
-    elif estado == "AGUARDANDO_CPF":
+    elif estado == EstadoTriagem.AGUARDANDO_CPF:
         # Extrai apenas dígitos
         digitos = re.findall(r'\d', mensagem)
         
         if len(digitos) == 11:
-            sessao["cpf_temp"] = "".join(digitos)
+            sessao.cpf_temp = "".join(digitos)
             resposta_texto = "Obrigado! Agora sua data de nascimento, no formato DD/MM/AAAA."
-            sessao["estado"] = "AGUARDANDO_DATA_NASCIMENTO"
+            sessao.estado = EstadoTriagem.AGUARDANDO_DATA_NASCIMENTO
         else:
             resposta_texto = "CPF inválido. Certifique-se de digitar 11 dígitos."
             # Mantém no estado atual
             
-    elif estado == "AGUARDANDO_DATA_NASCIMENTO":
+    elif estado == EstadoTriagem.AGUARDANDO_DATA_NASCIMENTO:
         # Valida formato da data DD/MM/AAAA
         match_data = re.search(r"\d{2}/\d{2}/\d{4}", mensagem)
         if match_data:
             data_nascimento = match_data.group(0)
-            cpf = sessao.get("cpf_temp")
+            cpf = sessao.cpf_temp
             
-            sucesso, cliente = autenticar_cliente(cpf, data_nascimento)
+            sucesso, cliente = await autenticar_cliente(cpf, data_nascimento)
             
             if sucesso:
-                sessao["dados_cliente"] = cliente
-                sessao["estado"] = "AUTENTICADO"
+                sessao.dados_cliente = cliente
+                sessao.estado = EstadoTriagem.AUTENTICADO
                 resposta_texto = f"Autenticação realizada com sucesso, {cliente['nome']}! Em que posso ajudar hoje? (Crédito, Cotação de Moedas, Atualização Cadastral)"
             elif cliente == "erro_db":
                 resposta_texto = "Desculpe, nosso sistema de cadastro está temporariamente indisponível. Por favor, tente novamente mais tarde."
                 # Mantém AGUARDANDO_DATA_NASCIMENTO mas não gasta tentativa
             else:
-                sessao["tentativas"] += 1
-                if sessao["tentativas"] >= MAX_TENTATIVAS:
+                sessao.tentativas += 1
+                if sessao.tentativas >= MAX_TENTATIVAS:
                     resposta_texto = "Não foi possível autenticar seus dados após 3 tentativas. O atendimento será encerrado. Obrigado."
                     acao = "encerrar"
-                    sessao["estado"] = "ENCERRADO"
+                    sessao.estado = EstadoTriagem.ENCERRADO
                 else:
-                    restantes = MAX_TENTATIVAS - sessao["tentativas"]
+                    restantes = MAX_TENTATIVAS - sessao.tentativas
                     resposta_texto = f"Dados não conferem. Tentativas restantes: {restantes}. Informe seu CPF novamente."
-                    sessao["estado"] = "AGUARDANDO_CPF" # Reinicia fluxo de autenticação
+                    sessao.estado = EstadoTriagem.AGUARDANDO_CPF # Reinicia fluxo de autenticação
         else:
              resposta_texto = "Data inválida. Use o formato DD/MM/AAAA."
 
-    elif estado == "AUTENTICADO":
+    elif estado == EstadoTriagem.AUTENTICADO:
         if not mensagem:
              resposta_texto = "Com o que mais posso ajudá-lo hoje? (Crédito, Cotação de Moedas, Atualização Cadastral)"
-             sessao["historico"].append({"role": "assistant", "content": resposta_texto})
+             sessao.registrar(ASSISTENTE, resposta_texto)
              return SaidaChat(resposta=resposta_texto, acao="continuar", id_sessao=id_sessao)
 
         # 1. Correspondência exata rápida (Bypass do LLM para cliques de Quick Reply)
@@ -148,7 +139,11 @@ async def endpoint_triagem(entrada: EntradaChat):
         elif msg_lower == "atualização cadastral":
             intencao = "entrevista"
         else:
-            # 2. Classificação de Intenção com LangChain através do LLM_Service para texto livre
+            # 2. Roteador por similaridade com exemplos rotulados (dispensa o LLM quando confiante)
+            intencao, _ = ROTEADOR_TRIAGEM.classificar(mensagem)
+
+        if intencao is None:
+            # 3. Classificação de Intenção com LangChain através do LLM_Service para texto livre (com cache de intenções repetidas)
             try:
                  instrucao = """
                  Você é um classificador de intenções bancárias.
@@ -161,7 +156,7 @@ async def endpoint_triagem(entrada: EntradaChat):
                  
                  Não dê explicações. Apenas a palavra exata da categoria em letras minúsculas.
                  """
-                 intencao_bruta = consultar_llm(mensagem, sessao.get("historico", []), instrucao)
+                 intencao_bruta = await classificar_llm(mensagem, sessao.historico, instrucao)
                  
                  # Limpeza extra para modelos locais
                  intencao_bruta = intencao_bruta.strip().lower()
@@ -187,6 +182,10 @@ async def endpoint_triagem(entrada: EntradaChat):
             except Exception as e:
                  print(f"Excessão não tratada na triagem ao classificar LLM: {e}")
                  intencao = "erro_llm"
+
+            if intencao == "erro_llm":
+                 # LLM indisponível (disjuntor aberto, prazo estourado, fila cheia): palpite do roteador por similaridade
+                 intencao = ROTEADOR_TRIAGEM.palpite(mensagem) or intencao
              
              
         if "erro_llm" in intencao:
@@ -194,12 +193,12 @@ async def endpoint_triagem(entrada: EntradaChat):
         elif intencao == "encerrar":
             resposta_texto = "Atendimento encerrado. Obrigado por escolher o Banco Ágil! Até logo."
             acao = "encerrar"
-            sessao["estado"] = "ENCERRADO"
+            sessao.estado = EstadoTriagem.ENCERRADO
         elif "credito" in intencao:
             resposta_texto = "" # Transferência silenciosa
             acao = "transferir"
             alvo = "AgenteCredito"
-            sessao["voltou_da_entrevista"] = True # Força o agente a enviar a primeira msg
+            sessao.voltou_da_entrevista = True # Força o agente a enviar a primeira msg
         elif "entrevista" in intencao:
             resposta_texto = "" # Transferência silenciosa
             acao = "transferir"
@@ -208,16 +207,16 @@ async def endpoint_triagem(entrada: EntradaChat):
             resposta_texto = "" # Transferência silenciosa
             acao = "transferir"
             alvo = "AgenteCambio"
-            sessao["iniciando_cambio"] = True
+            sessao.iniciando_cambio = True
         else:
             resposta_texto = "Poderia reformular? Atendo demandas sobre (Crédito, Cotação de Moedas, Atualização Cadastral)."
             # Mantém estado AUTENTICADO
 
-    elif estado == "ENCERRADO":
+    elif estado == EstadoTriagem.ENCERRADO:
         resposta_texto = "Este atendimento já foi encerrado."
         acao = "encerrar"
 
-    sessao["historico"].append({"role": "assistant", "content": resposta_texto})
+    sessao.registrar(ASSISTENTE, resposta_texto)
     
     return SaidaChat(
         resposta=resposta_texto,
@@ -1,22 +1,415 @@
-from threading import Lock
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import functools
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dotenv import load_dotenv
+from estado_sessao import EstadoSessao, EstadoTriagem
 
-# Gerenciador de Sessões Compartilhado (Thread-Safe para simulação)
-# Estrutura: {id_sessao: {estado, dados_cliente, agente_atual, historico}}
-SESSOES = {}
-LOCK_SESSOES = Lock()
+# Gerenciador de Sessões Compartilhado
+# Estrutura: {id_sessao: EstadoSessao} (ver estado_sessao.py)
+# Todo acesso acontece no event loop; os turnos de uma mesma sessão são serializados por uma
+# trava própria da sessão (TRAVAS_SESSOES), sem um lock global entre sessões diferentes.
+# As sessões ficam em ordem de último acesso (LRU) e expiram após um tempo ocioso.
+# Com SESSOES_BACKEND=sqlite ou redis, o estado sai do processo e a API pode rodar com vários workers:
+# cada sessão gravada leva um número de versão e a gravação só vale se a versão não mudou desde a
+# leitura (compare-and-swap). Um turno concorrente da mesma sessão em outro worker gera ConflitoSessao.
+
+load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+SESSAO_TTL_OCIOSO = float(os.getenv("SESSAO_TTL_OCIOSO", "1800")) # 30 min sem interação
+SESSAO_TTL_ENCERRADA = float(os.getenv("SESSAO_TTL_ENCERRADA", "120")) # Sessões ENCERRADO saem mais cedo
+MAX_SESSOES = int(os.getenv("MAX_SESSOES", "10000"))
+INTERVALO_VARREDURA = float(os.getenv("INTERVALO_VARREDURA_SESSOES", "60"))
+SESSOES_BACKEND = os.getenv("SESSOES_BACKEND", "memoria").lower() # memoria, sqlite ou redis
+ARQUIVO_SESSOES_SQLITE = os.getenv("SESSOES_SQLITE", os.path.join(os.path.dirname(__file__), "data", "sessoes.db"))
+URL_REDIS = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+class ConflitoSessao(Exception):
+    """
+    A sessão foi gravada por outro worker durante o turno; o resultado deste turno é descartado.
+    """
+    def __init__(self, id_sessao):
+        super().__init__(f"Sessão {id_sessao} alterada por outra requisição simultânea.")
+        self.id_sessao = id_sessao
+
+class ArmazemSessoes:
+    """
+    Backend em memória do processo: devolve o próprio objeto da sessão, sem serialização.
+    """
+    em_processo = True
+
+    def __init__(self, max_sessoes=MAX_SESSOES, ttl_ocioso=SESSAO_TTL_OCIOSO, ttl_encerrada=SESSAO_TTL_ENCERRADA):
+        self.max_sessoes = max_sessoes
+        self.ttl_ocioso = ttl_ocioso
+        self.ttl_encerrada = ttl_encerrada
+        self._sessoes = OrderedDict() # {id_sessao: [sessao, ultimo_acesso]}
+        self.removidas_ttl = 0
+        self.removidas_lru = 0
+        self.removidas_encerradas = 0
+
+    def _expirada(self, sessao, ultimo_acesso, agora):
+        ttl = self.ttl_encerrada if sessao.estado is EstadoTriagem.ENCERRADO else self.ttl_ocioso
+        return agora - ultimo_acesso > ttl
+
+    def obter(self, id_sessao):
+        item = self._sessoes.get(id_sessao)
+        if item is None:
+            return None
+        agora = time.monotonic()
+        if self._expirada(item[0], item[1], agora):
+            del self._sessoes[id_sessao]
+            self.removidas_ttl += 1
+            return None
+        item[1] = agora
+        self._sessoes.move_to_end(id_sessao)
+        return item[0]
+
+    def criar(self, id_sessao, dados_iniciais):
+        self._sessoes[id_sessao] = [dados_iniciais, time.monotonic()]
+        self._sessoes.move_to_end(id_sessao)
+        while len(self._sessoes) > self.max_sessoes:
+            self._sessoes.popitem(last=False)
+            self.removidas_lru += 1
+        return dados_iniciais
+
+    def atualizar(self, id_sessao, chave, valor):
+        if id_sessao in self._sessoes:
+            setattr(self._sessoes[id_sessao][0], chave, valor)
+            return True
+        return False
+
+    def varrer(self):
+        """
+        Remove sessões ociosas além do TTL e sessões encerradas além do prazo curto.
+        Retorna quantas foram removidas.
+        """
+        agora = time.monotonic()
+        expiradas = [
+            (id_sessao, sessao.estado is EstadoTriagem.ENCERRADO)
+            for id_sessao, (sessao, ultimo_acesso) in self._sessoes.items()
+            if self._expirada(sessao, ultimo_acesso, agora)
+        ]
+        for id_sessao, encerrada in expiradas:
+            del self._sessoes[id_sessao]
+            if encerrada:
+                self.removidas_encerradas += 1
+            else:
+                self.removidas_ttl += 1
+        return len(expiradas)
+
+    def __len__(self):
+        return len(self._sessoes)
+
+    def estatisticas(self):
+        return {
+            "backend": "memoria",
+            "ativas": len(self._sessoes),
+            "max_sessoes": self.max_sessoes,
+            "removidas_ttl": self.removidas_ttl,
+            "removidas_lru": self.removidas_lru,
+            "removidas_encerradas": self.removidas_encerradas,
+        }
+
+def serializar_sessao(sessao):
+    # JSON compacto posicional (sem nomes de campo): [estado, tentativas, ..., historico, ...]
+    return json.dumps(sessao.para_lista(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def desserializar_sessao(bruto):
+    return EstadoSessao.de_lista(json.loads(bruto))
+
+class BackendSessoesSQLite:
+    """
+    Sessões serializadas num SQLite local em modo WAL, compartilhado pelos workers da máquina.
+    Serve também como substituto do Redis em testes. As consultas rodam fora do event loop
+    (asyncio.to_thread, uma conexão por thread): a espera pela trava de escrita de outro worker
+    (até `timeout`) não para os demais atendimentos do processo.
+    `carregar` devolve (dados, versao); `gravar` só substitui a linha se a versão for a mesma da
+    leitura (versao=None: sessão nova, só grava se não houver outra ativa com o mesmo id).
+    """
+    em_processo = False
+
+    def __init__(self, caminho, max_sessoes=MAX_SESSOES, ttl_ocioso=SESSAO_TTL_OCIOSO, ttl_encerrada=SESSAO_TTL_ENCERRADA):
+        self.caminho = caminho
+        self.max_sessoes = max_sessoes
+        self.ttl_ocioso = ttl_ocioso
+        self.ttl_encerrada = ttl_encerrada
+        self._local = threading.local()
+        self._conexao().executescript(
+            "CREATE TABLE IF NOT EXISTS sessoes (id TEXT PRIMARY KEY, dados BLOB NOT NULL, expira_em REAL NOT NULL, atualizado_em REAL NOT NULL, versao INTEGER NOT NULL DEFAULT 0);"
+            "CREATE INDEX IF NOT EXISTS idx_sessoes_expira ON sessoes (expira_em);"
+            "CREATE INDEX IF NOT EXISTS idx_sessoes_atualizado ON sessoes (atualizado_em);"
+        )
+        colunas = [linha[1] for linha in self._conexao().execute("PRAGMA table_info(sessoes)")]
+        if "versao" not in colunas: # Banco criado antes do controle de versão
+            self._conexao().execute("ALTER TABLE sessoes ADD COLUMN versao INTEGER NOT NULL DEFAULT 0")
+        self.leituras = 0
+        self.escritas = 0
+        self.conflitos = 0
+        self.removidas_ttl = 0
+        self.removidas_lru = 0
+        self.ativas = self._contar_ativas() # Atualizado a cada varredura (o /metricas não consulta o banco)
+
+    def _conexao(self):
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is None:
+            conexao = sqlite3.connect(self.caminho, timeout=5.0)
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.execute("PRAGMA synchronous=NORMAL")
+            self._local.conexao = conexao
+        return conexao
+
+    def _carregar(self, id_sessao):
+        linha = self._conexao().execute(
+            "SELECT dados, versao FROM sessoes WHERE id = ? AND expira_em > ?", (id_sessao, time.time())
+        ).fetchone()
+        return tuple(linha) if linha else None
+
+    def _gravar(self, id_sessao, bruto, ttl, versao):
+        agora = time.time()
+        conexao = self._conexao()
+        with conexao:
+            if versao is None:
+                # Sessão nova: ocupa o id só se não houver linha ou se a existente já expirou
+                cursor = conexao.execute(
+                    "INSERT INTO sessoes (id, dados, expira_em, atualizado_em, versao) VALUES (?, ?, ?, ?, 1) "
+                    "ON CONFLICT (id) DO UPDATE SET dados = excluded.dados, expira_em = excluded.expira_em, "
+                    "atualizado_em = excluded.atualizado_em, versao = sessoes.versao + 1 WHERE sessoes.expira_em <= ?",
+                    (id_sessao, bruto, agora + ttl, agora, agora)
+                )
+            else:
+                cursor = conexao.execute(
+                    "UPDATE sessoes SET dados = ?, expira_em = ?, atualizado_em = ?, versao = versao + 1 WHERE id = ? AND versao = ?",
+                    (bruto, agora + ttl, agora, id_sessao, versao)
+                )
+        return cursor.rowcount == 1
+
+    def _varrer(self):
+        conexao = self._conexao()
+        with conexao:
+            removidas_ttl = conexao.execute("DELETE FROM sessoes WHERE expira_em <= ?", (time.time(),)).rowcount
+            # Acima do limite, descarta as menos recentes
+            removidas_lru = conexao.execute(
+                "DELETE FROM sessoes WHERE id IN (SELECT id FROM sessoes ORDER BY atualizado_em DESC LIMIT -1 OFFSET ?)",
+                (self.max_sessoes,)
+            ).rowcount
+        return removidas_ttl, removidas_lru, self._contar_ativas()
+
+    def _contar_ativas(self):
+        return self._conexao().execute("SELECT COUNT(*) FROM sessoes WHERE expira_em > ?", (time.time(),)).fetchone()[0]
+
+    async def carregar(self, id_sessao):
+        self.leituras += 1
+        return await asyncio.to_thread(self._carregar, id_sessao)
+
+    async def gravar(self, id_sessao, bruto, versao=None, encerrada=False):
+        self.escritas += 1
+        ttl = self.ttl_encerrada if encerrada else self.ttl_ocioso
+        if not await asyncio.to_thread(self._gravar, id_sessao, bruto, ttl, versao):
+            self.conflitos += 1
+            raise ConflitoSessao(id_sessao)
+
+    async def varrer(self):
+        removidas_ttl, removidas_lru, self.ativas = await asyncio.to_thread(self._varrer)
+        self.removidas_ttl += removidas_ttl
+        self.removidas_lru += removidas_lru
+        return removidas_ttl + removidas_lru
+
+    def estatisticas(self):
+        return {
+            "backend": "sqlite",
+            "ativas": self.ativas,
+            "max_sessoes": self.max_sessoes,
+            "leituras": self.leituras,
+            "escritas": self.escritas,
+            "conflitos": self.conflitos,
+            "removidas_ttl": self.removidas_ttl,
+            "removidas_lru": self.removidas_lru,
+        }
+
+class BackendSessoesRedis:
+    """
+    Sessões num Redis (ou servidor compatível), compartilhadas entre processos e máquinas.
+    Cada sessão é um hash {dados, versao}; a gravação compara a versão e grava num script Lua
+    (atômico no servidor, uma ida e volta, sem WATCH preso a uma conexão durante o turno).
+    A expiração fica a cargo do próprio Redis (EXPIRE); o limite de memória, do maxmemory-policy.
+    """
+    em_processo = False
+    PREFIXO = "banco_agil:sessao:v2:" # v2: hash {dados, versao} (v1 guardava só a string serializada)
+    # KEYS[1]: chave; ARGV: dados, versão lida ("" para sessão nova), TTL em segundos
+    SCRIPT_GRAVAR = """
+        local versao = redis.call('HGET', KEYS[1], 'versao')
+        if (versao or '') ~= ARGV[2] then return 0 end
+        redis.call('HSET', KEYS[1], 'dados', ARGV[1], 'versao', tonumber(versao or '0') + 1)
+        redis.call('EXPIRE', KEYS[1], ARGV[3])
+        return 1
+    """
+
+    def __init__(self, url, ttl_ocioso=SESSAO_TTL_OCIOSO, ttl_encerrada=SESSAO_TTL_ENCERRADA):
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError:
+            raise RuntimeError("SESSOES_BACKEND=redis requer o pacote 'redis' (pip install redis).")
+        self._cliente = redis_asyncio.from_url(url)
+        self._gravar = self._cliente.register_script(self.SCRIPT_GRAVAR)
+        self.ttl_ocioso = ttl_ocioso
+        self.ttl_encerrada = ttl_encerrada
+        self.leituras = 0
+        self.escritas = 0
+        self.conflitos = 0
+
+    async def carregar(self, id_sessao):
+        self.leituras += 1
+        dados, versao = await self._cliente.hmget(self.PREFIXO + id_sessao, "dados", "versao")
+        return (dados, int(versao)) if dados is not None else None
+
+    async def gravar(self, id_sessao, bruto, versao=None, encerrada=False):
+        self.escritas += 1
+        ttl = self.ttl_encerrada if encerrada else self.ttl_ocioso
+        versao_lida = "" if versao is None else str(versao)
+        if not await self._gravar(keys=[self.PREFIXO + id_sessao], args=[bruto, versao_lida, max(1, int(ttl))]):
+            self.conflitos += 1
+            raise ConflitoSessao(id_sessao)
+
+    async def varrer(self):
+        return 0
+
+    def estatisticas(self):
+        return {"backend": "redis", "leituras": self.leituras, "escritas": self.escritas, "conflitos": self.conflitos}
+
+def criar_backend(nome=SESSOES_BACKEND):
+    if nome == "sqlite":
+        return BackendSessoesSQLite(ARQUIVO_SESSOES_SQLITE)
+    if nome == "redis":
+        return BackendSessoesRedis(URL_REDIS)
+    return ArmazemSessoes()
+
+SESSOES = criar_backend()
+
+class TravasSessao:
+    """
+    Uma asyncio.Lock por sessão, criada sob demanda e descartada quando ninguém mais a usa.
+    Turnos da mesma sessão esperam um pelo outro; sessões diferentes nunca disputam a mesma trava.
+    A garantia vale dentro de um worker. Entre workers (backends sqlite/redis), a gravação com
+    versão detecta o turno simultâneo: o segundo a gravar recebe ConflitoSessao (HTTP 409) em vez
+    de sobrescrever o primeiro. Afinidade por sessão no balanceador evita esses conflitos.
+    """
+    def __init__(self):
+        self._travas = {} # {id_sessao: [asyncio.Lock, usuarios]}
+        self.aquisicoes = 0
+        self.esperas = 0
+
+    @asynccontextmanager
+    async def travar(self, id_sessao):
+        item = self._travas.get(id_sessao)
+        if item is None:
+            item = self._travas[id_sessao] = [asyncio.Lock(), 0]
+        item[1] += 1
+        self.aquisicoes += 1
+        if item[0].locked():
+            self.esperas += 1
+        try:
+            async with item[0]:
+                yield
+        finally:
+            item[1] -= 1
+            if item[1] == 0:
+                del self._travas[id_sessao]
+
+    def estatisticas(self):
+        return {
+            "travas_ativas": len(self._travas),
+            "aquisicoes": self.aquisicoes,
+            "esperas": self.esperas,
+        }
+
+TRAVAS_SESSOES = TravasSessao()
+
+# Sessões carregadas ou criadas no turno atual (backends externos): {id_sessao: sessao}
+_TURNO = ContextVar("turno_sessao", default=None)
+
+def turno_de_sessao(endpoint):
+    """
+    Decorador dos endpoints dos agentes. O turno inteiro roda com a trava da sessão.
+    Com backend externo, carrega a sessão antes do turno e a grava de volta ao final, condicionada
+    à versão lida. Não há marca de "sessão suja": todo turno que encontra a sessão registra
+    histórico, então sempre há o que gravar, e a gravação renova o TTL.
+    """
+    @functools.wraps(endpoint)
+    async def executar(entrada, *args, **kwargs):
+        async with TRAVAS_SESSOES.travar(entrada.id_sessao):
+            if SESSOES.em_processo:
+                return await endpoint(entrada, *args, **kwargs)
+            return await _executar_turno_externo(endpoint, entrada, *args, **kwargs)
+    return executar
+
+async def _executar_turno_externo(endpoint, entrada, *args, **kwargs):
+    turno = {}
+    versoes = {} # {id_sessao: versao lida}; sessões criadas no turno não têm versão
+    token = _TURNO.set(turno)
+    try:
+        carregada = await SESSOES.carregar(entrada.id_sessao)
+        if carregada is not None:
+            bruto, versoes[entrada.id_sessao] = carregada
+            turno[entrada.id_sessao] = desserializar_sessao(bruto)
+        resultado = await endpoint(entrada, *args, **kwargs)
+    except BaseException:
+        _TURNO.reset(token)
+        try:
+            await _gravar_turno(turno, versoes)
+        except ConflitoSessao as e:
+            print(f"Conflito de sessão após erro no turno: {e}")
+        raise
+    _TURNO.reset(token)
+    await _gravar_turno(turno, versoes)
+    return resultado
+
+async def _gravar_turno(turno, versoes):
+    for id_sessao, sessao in turno.items():
+        await SESSOES.gravar(
+            id_sessao, serializar_sessao(sessao), versao=versoes.get(id_sessao),
+            encerrada=sessao.estado is EstadoTriagem.ENCERRADO
+        )
 
 def obter_sessao(id_sessao):
-    with LOCK_SESSOES:
-        return SESSOES.get(id_sessao)
+    if SESSOES.em_processo:
+        return SESSOES.obter(id_sessao)
+    turno = _TURNO.get()
+    return turno.get(id_sessao) if turno is not None else None
 
-def criar_sessao(id_sessao, dados_iniciais):
-    with LOCK_SESSOES:
-        SESSOES[id_sessao] = dados_iniciais
-        return SESSOES[id_sessao]
+def criar_sessao(id_sessao, dados_iniciais=None):
+    if dados_iniciais is None:
+        dados_iniciais = EstadoSessao()
+    if SESSOES.em_processo:
+        return SESSOES.criar(id_sessao, dados_iniciais)
+    turno = _TURNO.get()
+    if turno is None:
+        raise RuntimeError("criar_sessao com backend externo deve ser chamado dentro de um turno_de_sessao.")
+    turno[id_sessao] = dados_iniciais
+    return dados_iniciais
 
 def atualizar_sessao(id_sessao, chave, valor):
-    with LOCK_SESSOES:
-        if id_sessao in SESSOES:
-            SESSOES[id_sessao][chave] = valor
-            return True
+    if SESSOES.em_processo:
+        return SESSOES.atualizar(id_sessao, chave, valor)
+    sessao = obter_sessao(id_sessao)
+    if sessao is None:
         return False
+    setattr(sessao, chave, valor)
+    return True
+
+async def varredor_sessoes(intervalo=INTERVALO_VARREDURA):
+    """
+    Tarefa de fundo (iniciada no main.py) que remove periodicamente as sessões expiradas.
+    """
+    while True:
+        await asyncio.sleep(intervalo)
+        try:
+            removidas = await SESSOES.varrer() if not SESSOES.em_processo else SESSOES.varrer()
+            if removidas:
+                print(f"Varredura de sessões: {removidas} sessões removidas.")
+        except Exception as e:
+            print(f"Erro na varredura de sessões: {e}")
@@ -0,0 +1,87 @@
+import csv
+import os
+import time
+from bisect import bisect_right
+from threading import Lock
+
+# Tabela de faixas de score -> limite máximo, carregada uma vez em listas ordenadas.
+# Estrutura: _faixas = (minimos, maximos, limites), com minimos[i] <= score <= maximos[i] -> limites[i]
+
+PASTA_DADOS = os.path.join(os.path.dirname(__file__), "data")
+ARQUIVO_SCORE_LIMITE = os.path.join(PASTA_DADOS, "score_limite.csv")
+INTERVALO_VERIFICACAO = 1.0 # Segundos entre duas consultas ao mtime do arquivo
+
+def validar_faixas(faixas):
+    """
+    Recebe [(min_score, max_score, limite_maximo)] ordenadas por min_score e
+    lança ValueError se houver faixa invertida, sobreposição ou buraco entre faixas.
+    """
+    for minimo, maximo, _ in faixas:
+        if minimo > maximo:
+            raise ValueError(f"Faixa invertida: {minimo}-{maximo}")
+    for (min_ant, max_ant, _), (minimo, maximo, _) in zip(faixas, faixas[1:]):
+        if minimo <= max_ant:
+            raise ValueError(f"Faixas sobrepostas: {min_ant}-{max_ant} e {minimo}-{maximo}")
+        if minimo != max_ant + 1:
+            raise ValueError(f"Buraco entre as faixas {min_ant}-{max_ant} e {minimo}-{maximo}")
+
+class TabelaScore:
+    """
+    Consulta de faixa por busca binária. O arquivo é recarregado quando o mtime muda (consultado
+    no máximo uma vez por `intervalo_verificacao`); se a nova versão for inválida, a tabela
+    anterior continua em uso. Mesmo esquema de recarga do ArmazemClientes.
+    """
+    def __init__(self, caminho, intervalo_verificacao=INTERVALO_VERIFICACAO):
+        self.caminho = caminho
+        self.intervalo_verificacao = intervalo_verificacao
+        self._faixas = ([], [], [])
+        self._mtime = None
+        self._verificado_em = 0.0
+        self._lock = Lock()
+
+    def precisa_recarregar(self):
+        agora = time.monotonic()
+        if self._mtime is not None and agora - self._verificado_em < self.intervalo_verificacao:
+            return False
+        self._verificado_em = agora
+        return os.stat(self.caminho).st_mtime_ns != self._mtime
+
+    def _recarregar_se_mudou(self):
+        if self.precisa_recarregar():
+            self.recarregar()
+
+    def recarregar(self):
+        mtime = os.stat(self.caminho).st_mtime_ns
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            with open(self.caminho, newline="", encoding="utf-8") as arquivo:
+                faixas = sorted(
+                    (int(linha["min_score"]), int(linha["max_score"]), float(linha["limite_maximo"]))
+                    for linha in csv.DictReader(arquivo)
+                )
+            try:
+                validar_faixas(faixas)
+            except ValueError as e:
+                if self._mtime is None:
+                    raise
+                print(f"Tabela de score inválida, mantendo a versão anterior: {e}")
+                self._mtime = mtime
+                return
+
+            # Troca das três listas numa única referência, sem leitor ver metade da tabela
+            self._faixas = ([f[0] for f in faixas], [f[1] for f in faixas], [f[2] for f in faixas])
+            self._mtime = mtime
+
+    def limite_maximo(self, score):
+        """
+        Retorna o limite máximo da faixa do score, ou None se o score não cair em nenhuma faixa.
+        """
+        self._recarregar_se_mudou()
+        minimos, maximos, limites = self._faixas
+        i = bisect_right(minimos, score) - 1
+        if i >= 0 and score <= maximos[i]:
+            return limites[i]
+        return None
+
+TABELA_SCORE = TabelaScore(ARQUIVO_SCORE_LIMITE)
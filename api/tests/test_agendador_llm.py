@@ -0,0 +1,127 @@
+import asyncio
+import pytest
+from agendador_llm import AgendadorLLM, PRIORIDADE_CLASSIFICACAO, PRIORIDADE_EXTRACAO
+
+class ChainFalsa:
+    """
+    Registra a ordem de execução; com `trava`, as chamadas só terminam quando ela é liberada.
+    """
+    def __init__(self, ordem, trava=None):
+        self.ordem = ordem
+        self.trava = trava
+        self.lotes = []
+
+    async def ainvoke(self, entrada):
+        self.ordem.append(entrada)
+        if self.trava is not None:
+            await self.trava.wait()
+        return f"ok:{entrada}"
+
+    async def abatch(self, entradas, return_exceptions=False):
+        self.lotes.append(list(entradas))
+        return [await self.ainvoke(entrada) for entrada in entradas]
+
+def rodar(corrotina):
+    return asyncio.run(corrotina())
+
+def test_fila_respeita_prioridade_e_ordem_de_chegada():
+    async def cenario():
+        ordem = []
+        trava = asyncio.Event()
+        agendador = AgendadorLLM(max_concorrencia=1, max_lote=1)
+        ocupando = asyncio.create_task(agendador.executar(ChainFalsa(ordem, trava), "ocupando"))
+        await asyncio.sleep(0)
+
+        chain = ChainFalsa(ordem)
+        pedidos = [
+            asyncio.create_task(agendador.executar(chain, "extracao", PRIORIDADE_EXTRACAO)),
+            asyncio.create_task(agendador.executar(chain, "classificacao 1", PRIORIDADE_CLASSIFICACAO)),
+            asyncio.create_task(agendador.executar(chain, "classificacao 2", PRIORIDADE_CLASSIFICACAO)),
+        ]
+        await asyncio.sleep(0)
+        assert agendador.estatisticas()["fila"] == 3
+
+        trava.set()
+        resultados = await asyncio.gather(ocupando, *pedidos)
+        assert ordem == ["ocupando", "classificacao 1", "classificacao 2", "extracao"]
+        assert resultados[1] == "ok:extracao"
+        assert agendador.estatisticas()["ativos"] == 0
+    rodar(cenario)
+
+def test_classificacoes_da_mesma_chain_saem_em_lote():
+    async def cenario():
+        trava = asyncio.Event()
+        agendador = AgendadorLLM(max_concorrencia=1, max_lote=3)
+        ocupando = asyncio.create_task(agendador.executar(ChainFalsa([], trava), "ocupando"))
+        await asyncio.sleep(0)
+
+        chain = ChainFalsa([])
+        pedidos = [asyncio.create_task(agendador.executar(chain, n, agrupavel=True)) for n in range(4)]
+        await asyncio.sleep(0)
+        trava.set()
+        assert await asyncio.gather(*pedidos) == ["ok:0", "ok:1", "ok:2", "ok:3"]
+        await ocupando
+        assert chain.lotes == [[0, 1, 2]] # O quarto sai sozinho (ainvoke)
+        assert agendador.estatisticas()["pedidos_em_lote"] == 3
+    rodar(cenario)
+
+def test_pedidos_identicos_sao_coalescidos():
+    async def cenario():
+        agendador = AgendadorLLM()
+        chamadas = 0
+        liberar = asyncio.Event()
+
+        async def fabrica():
+            nonlocal chamadas
+            chamadas += 1
+            await liberar.wait()
+            return "credito"
+
+        tarefas = [asyncio.create_task(agendador.coalescer(("classificacao", "quero credito"), fabrica)) for _ in range(3)]
+        await asyncio.sleep(0)
+        liberar.set()
+        assert await asyncio.gather(*tarefas) == ["credito"] * 3
+        assert chamadas == 1
+        assert agendador.coalescidos == 2
+
+        # Terminada a chamada, a mesma chave gera uma nova
+        assert await agendador.coalescer(("classificacao", "quero credito"), fabrica) == "credito"
+        assert chamadas == 2
+    rodar(cenario)
+
+def test_coalescido_continua_se_um_cliente_desiste():
+    async def cenario():
+        agendador = AgendadorLLM()
+        liberar = asyncio.Event()
+
+        async def fabrica():
+            await liberar.wait()
+            return "cambio"
+
+        desistente = asyncio.create_task(agendador.coalescer("chave", fabrica))
+        paciente = asyncio.create_task(agendador.coalescer("chave", fabrica))
+        await asyncio.sleep(0)
+        desistente.cancel()
+        liberar.set()
+        assert await paciente == "cambio"
+        with pytest.raises(asyncio.CancelledError):
+            await desistente
+    rodar(cenario)
+
+def test_pedido_cancelado_na_fila_e_descartado():
+    async def cenario():
+        ordem = []
+        trava = asyncio.Event()
+        agendador = AgendadorLLM(max_concorrencia=1)
+        ocupando = asyncio.create_task(agendador.executar(ChainFalsa(ordem, trava), "ocupando"))
+        await asyncio.sleep(0)
+        chain = ChainFalsa(ordem)
+        cancelado = asyncio.create_task(agendador.executar(chain, "cancelado"))
+        seguinte = asyncio.create_task(agendador.executar(chain, "seguinte"))
+        await asyncio.sleep(0)
+        cancelado.cancel()
+        trava.set()
+        await asyncio.gather(ocupando, seguinte)
+        assert ordem == ["ocupando", "seguinte"]
+        assert agendador.cancelados == 1
+    rodar(cenario)
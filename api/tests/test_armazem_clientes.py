@@ -0,0 +1,58 @@
+import asyncio
+import os
+import threading
+import armazem_clientes
+import repositorio
+from armazem_clientes import ArmazemClientes
+from tabela_score import TabelaScore
+
+CABECALHO = "cpf,data_nascimento,nome,score,limite_credito\n"
+
+def escrever(caminho, conteudo, mtime_ns):
+    caminho.write_text(conteudo, encoding="utf-8")
+    os.utime(caminho, ns=(mtime_ns, mtime_ns))
+
+def test_mtime_consultado_no_maximo_uma_vez_por_intervalo(tmp_path, monkeypatch):
+    caminho = tmp_path / "clientes.csv"
+    escrever(caminho, CABECALHO + "111.111.111-11,01/01/1980,Ana,500,1000.00\n", 1_000_000_000)
+    armazem = ArmazemClientes(str(caminho), intervalo_verificacao=60)
+    assert armazem.obter("11111111111")["nome"] == "Ana"
+
+    chamadas = []
+    stat_original = os.stat
+    monkeypatch.setattr(armazem_clientes.os, "stat", lambda *a: chamadas.append(a) or stat_original(*a))
+    escrever(caminho, CABECALHO + "111.111.111-11,01/01/1980,Bia,500,1000.00\n", 2_000_000_000)
+    for _ in range(100):
+        assert armazem.obter("11111111111")["nome"] == "Ana" # Dentro do intervalo: sem os.stat
+    assert chamadas == []
+
+    armazem.intervalo_verificacao = 0
+    assert armazem.obter("11111111111")["nome"] == "Bia"
+
+def test_csv_recarrega_fora_do_event_loop(tmp_path, monkeypatch):
+    caminho_clientes = tmp_path / "clientes.csv"
+    caminho_score = tmp_path / "score_limite.csv"
+    escrever(caminho_clientes, CABECALHO + "111.111.111-11,01/01/1980,Ana,500,1000.00\n", 1_000_000_000)
+    escrever(caminho_score, "min_score,max_score,limite_maximo\n0,1000,500\n", 1_000_000_000)
+    armazem = ArmazemClientes(str(caminho_clientes), intervalo_verificacao=0)
+    tabela = TabelaScore(str(caminho_score), intervalo_verificacao=0)
+    monkeypatch.setattr(repositorio, "ARMAZEM_CLIENTES", armazem)
+    monkeypatch.setattr(repositorio, "TABELA_SCORE", tabela)
+
+    threads_recarga = []
+    for fonte in (armazem, tabela):
+        recarregar = fonte.recarregar
+        def registrar(recarregar=recarregar):
+            threads_recarga.append(threading.current_thread())
+            recarregar()
+        monkeypatch.setattr(fonte, "recarregar", registrar)
+
+    repo = repositorio.RepositorioCSV()
+    async def cenario():
+        cliente = await repo.ler(repo.obter_cliente, "111.111.111-11")
+        limite = await repo.ler(repo.limite_maximo, 700)
+        return cliente, limite
+    cliente, limite = asyncio.run(cenario())
+    assert cliente["nome"] == "Ana" and limite == 500.0
+    assert len(threads_recarga) == 2
+    assert all(thread is not threading.main_thread() for thread in threads_recarga)
@@ -0,0 +1,45 @@
+import pytest
+import cache_classificacao
+from cache_classificacao import CacheClassificacao, normalizar_mensagem
+
+@pytest.fixture
+def relogio(monkeypatch):
+    agora = [0.0]
+    monkeypatch.setattr(cache_classificacao.time, "monotonic", lambda: agora[0])
+    return agora
+
+def test_normalizacao_une_variacoes_triviais():
+    assert normalizar_mensagem("  Cotação do Dólar!! ") == "cotacao do dolar"
+    cache = CacheClassificacao()
+    cache.guardar("instrucao", "Cotação do Dólar!!", "cambio")
+    assert cache.obter("instrucao", "cotacao do dolar") == "cambio"
+    assert cache.obter("outra instrucao", "cotacao do dolar") is None
+
+def test_item_expira_apos_ttl(relogio):
+    cache = CacheClassificacao(ttl=10)
+    cache.guardar("i", "tchau", "encerrar")
+    relogio[0] = 9.9
+    assert cache.obter("i", "tchau") == "encerrar"
+    relogio[0] = 10.1
+    assert cache.obter("i", "tchau") is None
+    estatisticas = cache.estatisticas()
+    assert (estatisticas["expirados"], estatisticas["itens"], estatisticas["acertos"], estatisticas["falhas"]) == (1, 0, 1, 1)
+
+def test_despejo_remove_o_menos_usado(relogio):
+    cache = CacheClassificacao(capacidade=2)
+    cache.guardar("i", "a", "1")
+    cache.guardar("i", "b", "2")
+    assert cache.obter("i", "a") == "1" # "a" passa a ser o mais recente
+    cache.guardar("i", "c", "3")
+    assert cache.obter("i", "b") is None
+    assert cache.obter("i", "a") == "1"
+    assert cache.obter("i", "c") == "3"
+    assert cache.estatisticas()["despejados"] == 1
+
+def test_regravar_renova_ttl(relogio):
+    cache = CacheClassificacao(ttl=10)
+    cache.guardar("i", "credito", "credito")
+    relogio[0] = 8
+    cache.guardar("i", "credito", "credito")
+    relogio[0] = 15
+    assert cache.obter("i", "credito") == "credito"
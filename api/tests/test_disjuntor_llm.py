@@ -0,0 +1,100 @@
+import asyncio
+import pytest
+import disjuntor_llm
+from agendador_llm import AgendadorLLM, SobrecargaLLM, PRIORIDADE_CLASSIFICACAO, PRIORIDADE_EXTRACAO
+from disjuntor_llm import DisjuntorLLM, EstadoDisjuntor, LLMIndisponivel
+
+class Relogio:
+    def __init__(self):
+        self.agora = 1000.0
+
+    def __call__(self):
+        return self.agora
+
+@pytest.fixture
+def relogio(monkeypatch):
+    relogio = Relogio()
+    monkeypatch.setattr(disjuntor_llm.time, "monotonic", relogio)
+    return relogio
+
+def test_ciclo_aberto_meio_aberto_fechado(relogio):
+    disjuntor = DisjuntorLLM(falhas_para_abrir=2, tempo_aberto=10)
+    assert disjuntor.admitir() is False
+    disjuntor.registrar(False)
+    assert disjuntor.estado is EstadoDisjuntor.FECHADO
+    disjuntor.registrar(False)
+    assert disjuntor.estado is EstadoDisjuntor.ABERTO
+
+    with pytest.raises(LLMIndisponivel):
+        disjuntor.admitir()
+
+    relogio.agora += 10
+    assert disjuntor.admitir() is True # Única sonda
+    assert disjuntor.estado is EstadoDisjuntor.MEIO_ABERTO
+    with pytest.raises(LLMIndisponivel):
+        disjuntor.admitir()
+
+    disjuntor.registrar(True, sonda=True)
+    assert disjuntor.estado is EstadoDisjuntor.FECHADO
+    assert disjuntor.admitir() is False
+    assert disjuntor.estatisticas()["aberturas"] == 1
+    assert disjuntor.estatisticas()["sondas"] == 1
+
+def test_sonda_com_falha_reabre(relogio):
+    disjuntor = DisjuntorLLM(falhas_para_abrir=1, tempo_aberto=5)
+    disjuntor.registrar(False)
+    relogio.agora += 5
+    assert disjuntor.admitir() is True
+    disjuntor.registrar(False, sonda=True)
+    assert disjuntor.estado is EstadoDisjuntor.ABERTO
+    with pytest.raises(LLMIndisponivel):
+        disjuntor.admitir()
+    assert disjuntor.aberturas == 2
+
+def test_sonda_abandonada_libera_nova_sonda(relogio):
+    disjuntor = DisjuntorLLM(falhas_para_abrir=1, tempo_aberto=5)
+    disjuntor.registrar(False)
+    relogio.agora += 5
+    assert disjuntor.admitir() is True
+    disjuntor.registrar(None, sonda=True) # Cliente desistiu: não conta como falha nem sucesso
+    assert disjuntor.estado is EstadoDisjuntor.MEIO_ABERTO
+    assert disjuntor.admitir() is True
+
+def test_sucesso_zera_falhas_consecutivas():
+    disjuntor = DisjuntorLLM(falhas_para_abrir=2)
+    disjuntor.registrar(False)
+    disjuntor.registrar(True)
+    disjuntor.registrar(False)
+    assert disjuntor.estado is EstadoDisjuntor.FECHADO
+
+class ChainPresa:
+    def __init__(self, trava):
+        self.trava = trava
+
+    async def ainvoke(self, entrada):
+        await self.trava.wait()
+        return entrada
+
+def test_fila_recusa_pedidos_acima_da_espera_maxima():
+    async def cenario():
+        trava = asyncio.Event()
+        chain = ChainPresa(trava)
+        agendador = AgendadorLLM(max_concorrencia=1, max_espera=0.05)
+        ocupando = asyncio.create_task(agendador.executar(chain, "ocupando"))
+        await asyncio.sleep(0)
+        na_fila = asyncio.create_task(agendador.executar(chain, "extracao", PRIORIDADE_EXTRACAO))
+        await asyncio.sleep(0.1)
+
+        with pytest.raises(SobrecargaLLM):
+            await agendador.executar(chain, "outra extracao", PRIORIDADE_EXTRACAO)
+        assert agendador.estatisticas()["rejeitados_sobrecarga"] == 1
+
+        # Uma classificação não espera atrás da extração: continua sendo aceita
+        classificacao = asyncio.create_task(agendador.executar(chain, "classificacao", PRIORIDADE_CLASSIFICACAO))
+        await asyncio.sleep(0)
+        trava.set()
+        assert await asyncio.gather(ocupando, na_fila, classificacao) == ["ocupando", "extracao", "classificacao"]
+
+        # Fila vazia de novo: aceita normalmente
+        assert await agendador.executar(chain, "depois") == "depois"
+    asyncio.run(cenario())
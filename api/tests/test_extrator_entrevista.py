@@ -0,0 +1,68 @@
+import pytest
+from extrator_entrevista import ExtratorEntrevista, detectar_saida, intencao_saida, resposta_sim_nao
+
+@pytest.fixture
+def extrator():
+    return ExtratorEntrevista()
+
+def test_frase_completa_dispensa_llm(extrator):
+    campos, flags = extrator.extrair("renda 9000, clt, despesas 1.200,00, 1 dependente, sem dívidas")
+    confiaveis, fracos = extrator.separar(campos)
+    assert confiaveis == {"renda": 9000.0, "emprego": "formal", "despesas": 1200.0, "dependentes": "1", "dividas": "não"}
+    assert fracos == {}
+    assert flags == {"encerrar": False, "voltar": False, "saida_incerta": False}
+
+def test_valor_explicito_vence_sem_renda(extrator):
+    campos, _ = extrator.extrair("sou formal, mas não tenho renda extra, renda 3000")
+    assert campos["renda"] == (3000.0, 0.95)
+
+@pytest.mark.parametrize("mensagem", ["não tenho renda extra", "não tenho renda fixa"])
+def test_sem_renda_com_qualificador_nao_zera(extrator, mensagem):
+    assert "renda" not in extrator.extrair(mensagem)[0]
+
+@pytest.mark.parametrize("mensagem", ["não tenho renda", "estou sem renda, desempregado", "sem renda e sem despesas"])
+def test_sem_renda(extrator, mensagem):
+    assert extrator.extrair(mensagem)[0]["renda"] == (0.0, 0.9)
+
+@pytest.mark.parametrize("mensagem", ["não estou com dívidas", "nem tenho dividas", "nunca tive, não estou devendo"])
+def test_dividas_negadas_nao_viram_sim(extrator, mensagem):
+    campos, _ = extrator.extrair(mensagem)
+    confiaveis, _ = extrator.separar(campos)
+    assert campos["dividas"][0] == "não"
+    assert confiaveis.get("dividas") != "sim"
+
+@pytest.mark.parametrize("mensagem", ["tenho dívidas", "não tenho filhos mas tenho dívidas", "não tenho filhos, tenho dívidas"])
+def test_dividas_afirmadas(extrator, mensagem):
+    assert extrator.extrair(mensagem)[0]["dividas"] == ("sim", 0.9)
+
+def test_resposta_curta_so_com_um_campo_pendente(extrator):
+    assert extrator.extrair("5000", faltando=["renda"])[0] == {"renda": (5000.0, 0.85)}
+    assert extrator.extrair("5000", faltando=["renda", "despesas"])[0] == {"renda": (5000.0, 0.5)}
+    assert extrator.extrair("2", faltando=["dependentes"])[0] == {"dependentes": ("2", 0.85)}
+
+def test_saida_e_sim_nao():
+    assert intencao_saida("quero sair") == "encerrar"
+    assert intencao_saida("voltar ao menu") == "voltar"
+    assert intencao_saida("renda 3000") is None
+    assert resposta_sim_nao("quero sim") == "sim"
+    assert resposta_sim_nao("agora não") == "nao"
+    assert resposta_sim_nao("talvez") is None
+
+@pytest.mark.parametrize("mensagem, saida", [
+    ("tchau", "encerrar"), ("cancelar", "encerrar"), ("Quero sair!", "encerrar"),
+    ("voltar ao menu", "voltar"), ("quero voltar", "voltar"),
+])
+def test_saida_explicita_dispensa_llm(extrator, mensagem, saida):
+    _, flags = extrator.extrair(mensagem)
+    assert flags[saida] and not flags["saida_incerta"]
+
+@pytest.mark.parametrize("mensagem", [
+    "não quero cancelar", "nao vou sair agora, so um minuto", "vou voltar a trabalhar", "quero sair do cheque especial",
+])
+def test_saida_negada_ou_em_outro_contexto_vai_ao_llm(extrator, mensagem):
+    _, flags = extrator.extrair(mensagem)
+    assert flags == {"encerrar": False, "voltar": False, "saida_incerta": True}
+    assert intencao_saida(mensagem) is None
+
+def test_sem_palavra_de_saida():
+    assert detectar_saida("renda 9000, clt") == (None, False)
@@ -0,0 +1,36 @@
+import pytest
+from roteador_intencoes import ROTEADOR_TRIAGEM, ROTEADOR_MENU_CREDITO
+
+@pytest.mark.parametrize("mensagem, esperado", [
+    ("tchau", "encerrar"),
+    ("encerrar atendimento", "encerrar"),
+    ("cotação do dólar", "cambio"),
+    ("quero aumentar meu limite", "credito"),
+    ("atualizar meu cadastro", "entrevista"),
+])
+def test_triagem_decide_sem_llm(mensagem, esperado):
+    assert ROTEADOR_TRIAGEM.classificar(mensagem)[0] == esperado
+
+@pytest.mark.parametrize("mensagem", [
+    "não quero crédito",
+    "nem quero saber de câmbio",
+    "quero sair do cheque especial",
+    "obrigado",
+])
+def test_triagem_encaminha_ao_llm_negacao_e_saida_falsa(mensagem):
+    assert ROTEADOR_TRIAGEM.classificar(mensagem)[0] is None
+
+@pytest.mark.parametrize("mensagem", ["não quero aumentar meu limite", "pedir aumento de limite", "não quero sair"])
+def test_menu_credito_destrutivos_exigem_confianca(mensagem):
+    assert ROTEADOR_MENU_CREDITO.classificar(mensagem)[0] is None
+
+def test_menu_credito_decide_frases_claras():
+    assert ROTEADOR_MENU_CREDITO.classificar("aumentar limite")[0] == "aumentar_limite"
+    assert ROTEADOR_MENU_CREDITO.classificar("consultar limite")[0] == "consultar_limite"
+    assert ROTEADOR_MENU_CREDITO.classificar("cancelar")[0] == "encerrar"
+
+def test_palpite_degradado_aplica_as_guardas():
+    assert ROTEADOR_TRIAGEM.palpite("não quero crédito") is None
+    assert ROTEADOR_TRIAGEM.palpite("obrigado") is None
+    assert ROTEADOR_TRIAGEM.palpite("quero sair do cheque especial") is None
+    assert ROTEADOR_TRIAGEM.palpite("pedir um empréstimo") == "credito"
@@ -0,0 +1,89 @@
+import asyncio
+import sqlite3
+import pytest
+import sessao as modulo_sessao
+from estado_sessao import EstadoSessao, EstadoTriagem
+from sessao import BackendSessoesSQLite, ConflitoSessao, serializar_sessao, desserializar_sessao
+
+def test_sqlite_grava_carrega_e_varre(tmp_path):
+    async def cenario():
+        backend = BackendSessoesSQLite(str(tmp_path / "sessoes.db"), max_sessoes=1, ttl_encerrada=0)
+        sessao = EstadoSessao()
+        sessao.tentativas = 2
+        await backend.gravar("a", serializar_sessao(sessao))
+        bruto, versao = await backend.carregar("a")
+        assert desserializar_sessao(bruto).tentativas == 2
+        assert versao == 1
+
+        sessao.estado = EstadoTriagem.ENCERRADO
+        await backend.gravar("b", serializar_sessao(sessao), encerrada=True) # TTL zero: já expirada
+        assert await backend.carregar("b") is None
+        assert await backend.carregar("inexistente") is None
+
+        assert await backend.varrer() == 1
+        assert backend.estatisticas()["ativas"] == 1
+    asyncio.run(cenario())
+
+def test_sqlite_segunda_gravacao_da_mesma_versao_e_recusada(tmp_path):
+    async def cenario():
+        backend = BackendSessoesSQLite(str(tmp_path / "sessoes.db"))
+        await backend.gravar("a", serializar_sessao(EstadoSessao()))
+        # Dois workers leem a mesma versão; o primeiro a gravar vence
+        _, versao = await backend.carregar("a")
+        primeira, segunda = EstadoSessao(), EstadoSessao()
+        primeira.tentativas, segunda.tentativas = 1, 2
+        await backend.gravar("a", serializar_sessao(primeira), versao=versao)
+        with pytest.raises(ConflitoSessao):
+            await backend.gravar("a", serializar_sessao(segunda), versao=versao)
+        bruto, versao_final = await backend.carregar("a")
+        assert desserializar_sessao(bruto).tentativas == 1
+        assert versao_final == versao + 1
+
+        # Sessão nova com o id de uma ativa também é conflito
+        with pytest.raises(ConflitoSessao):
+            await backend.gravar("a", serializar_sessao(EstadoSessao()))
+        assert backend.estatisticas()["conflitos"] == 2
+    asyncio.run(cenario())
+
+def test_sqlite_sessao_nova_substitui_expirada(tmp_path):
+    async def cenario():
+        backend = BackendSessoesSQLite(str(tmp_path / "sessoes.db"), ttl_encerrada=0)
+        await backend.gravar("a", serializar_sessao(EstadoSessao()), encerrada=True)
+        await backend.gravar("a", serializar_sessao(EstadoSessao()))
+        assert await backend.carregar("a") is not None
+    asyncio.run(cenario())
+
+def test_sqlite_banco_sem_coluna_de_versao(tmp_path):
+    caminho = str(tmp_path / "sessoes.db")
+    with sqlite3.connect(caminho) as conexao:
+        conexao.execute("CREATE TABLE sessoes (id TEXT PRIMARY KEY, dados BLOB NOT NULL, expira_em REAL NOT NULL, atualizado_em REAL NOT NULL)")
+        conexao.execute("INSERT INTO sessoes VALUES ('a', ?, 9e12, 0)", (serializar_sessao(EstadoSessao()),))
+    backend = BackendSessoesSQLite(caminho)
+    assert asyncio.run(backend.carregar("a"))[1] == 0
+
+class Entrada:
+    def __init__(self, id_sessao):
+        self.id_sessao = id_sessao
+
+def test_turno_concorrente_de_outro_worker_gera_conflito(tmp_path, monkeypatch):
+    backend = BackendSessoesSQLite(str(tmp_path / "sessoes.db"))
+    monkeypatch.setattr(modulo_sessao, "SESSOES", backend)
+
+    @modulo_sessao.turno_de_sessao
+    async def endpoint(entrada):
+        sessao = modulo_sessao.obter_sessao(entrada.id_sessao) or modulo_sessao.criar_sessao(entrada.id_sessao)
+        sessao.tentativas += 1
+        # Outro worker (fora da trava deste processo) grava a mesma sessão no meio do turno
+        concorrente = EstadoSessao()
+        concorrente.tentativas = 10
+        _, versao = await backend.carregar(entrada.id_sessao)
+        await backend.gravar(entrada.id_sessao, serializar_sessao(concorrente), versao=versao)
+        return "ok"
+
+    async def cenario():
+        await backend.gravar("a", serializar_sessao(EstadoSessao()))
+        with pytest.raises(ConflitoSessao):
+            await endpoint(Entrada("a"))
+        bruto, _ = await backend.carregar("a")
+        assert desserializar_sessao(bruto).tentativas == 10 # A gravação do outro worker não foi sobrescrita
+    asyncio.run(cenario())
@@ -0,0 +1,63 @@
+import json
+import time
+from collections import deque
+from contextvars import ContextVar
+
+# Transmissão das respostas do turno enquanto ele acontece (modo SSE).
+# O turno em modo streaming define um emissor; o orquestrador publica nele a mensagem de cada
+# agente assim que ela fica pronta. Fora desse modo não há emissor e as chamadas abaixo não fazem nada.
+
+_EMISSOR = ContextVar("emissor_turno", default=None)
+
+def definir_emissor(emissor):
+    """
+    `emissor(evento, dados)` passa a receber os eventos do turno atual. Retorna o token do ContextVar.
+    """
+    return _EMISSOR.set(emissor)
+
+def restaurar_emissor(token):
+    _EMISSOR.reset(token)
+
+def emitir_mensagem(texto):
+    # Mensagem completa de um agente
+    emissor = _EMISSOR.get()
+    if emissor is not None and texto:
+        emissor("mensagem", {"texto": texto})
+
+def evento_sse(evento, dados):
+    return f"event: {evento}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+class MedidorLatencia:
+    """
+    Guarda as últimas amostras (em segundos) e expõe percentis em milissegundos.
+    """
+    def __init__(self, capacidade=2048):
+        self._amostras = deque(maxlen=capacidade)
+        self.total = 0
+
+    def registrar(self, segundos):
+        self._amostras.append(segundos)
+        self.total += 1
+
+    def medir_desde(self, inicio):
+        self.registrar(time.perf_counter() - inicio)
+
+    def estatisticas(self):
+        if not self._amostras:
+            return {"amostras": 0, "total": self.total}
+        ordenadas = sorted(self._amostras)
+        def percentil(p):
+            return round(ordenadas[min(len(ordenadas) - 1, int(p * len(ordenadas)))] * 1000, 2)
+        return {
+            "amostras": len(ordenadas),
+            "total": self.total,
+            "p50_ms": percentil(0.50),
+            "p95_ms": percentil(0.95),
+            "p99_ms": percentil(0.99),
+            "max_ms": round(ordenadas[-1] * 1000, 2),
+        }
+
+# Tempo até o primeiro byte de texto para o cliente, por canal
+TTFB_SSE = MedidorLatencia()
+TTFB_WEBSOCKET = MedidorLatencia()
+TTFB_HTTP = MedidorLatencia()